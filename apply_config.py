@@ -22,11 +22,44 @@ def update_integration_config(config):
         "feishu_app_id": config.get('feishu', {}).get('app_id', ''),
         "feishu_app_secret": config.get('feishu', {}).get('app_secret', ''),
         "feishu_folder_token": config.get('feishu', {}).get('folder_token', ''),
+        "feishu_mirror_dirs": config.get('feishu', {}).get('mirror_dirs', False),
+        "feishu_folder_cache": config.get('feishu', {}).get('folder_cache', 'feishu_folder_cache.json'),
+        "feishu_max_concurrency": config.get('feishu', {}).get('max_concurrency', 4),
+        "feishu_upload_cache": config.get('feishu', {}).get('upload_cache', 'feishu_upload_cache.json'),
+        "feishu_upload_cache_revalidate_hours": config.get('feishu', {}).get('upload_cache_revalidate_hours', 24),
+        "feishu_apps": config.get('feishu', {}).get('apps', []),
         "download_dir": config.get('baidu', {}).get('local_download_dir', 'temp_downloads'),
+        "baidu_verify_md5": config.get('baidu', {}).get('verify_md5', True),
+        "download_budget_mb": config.get('baidu', {}).get('download_budget_mb', 0),
+        "download_min_free_mb": config.get('baidu', {}).get('min_free_mb', 512),
+        "baidu_downloads_per_account": config.get('baidu', {}).get('downloads_per_account', 1),
+        "baidu_account_cooldown_minutes": config.get('baidu', {}).get('account_cooldown_minutes', 10),
+        "baidu_coalesce_seconds": config.get('baidu', {}).get('coalesce_seconds', 0),
+        "baidu_tasks": config.get('baidu', {}).get('tasks') or [],
+        "baidu_native_watch": config.get('baidu', {}).get('native_watch', False),
+        "baidu_watch_interval_minutes": config.get('baidu', {}).get('watch_interval_minutes', 10),
+        "baidu_full_rescan_every": config.get('baidu', {}).get('full_rescan_every', 12),
         "port": config.get('system', {}).get('port', 12345),
+        "admin_token": config.get('system', {}).get('admin_token', ''),
+        "config_watch_seconds": config.get('system', {}).get('config_watch_seconds', 5),
+        "transfer_workers": config.get('system', {}).get('transfer', {}).get('workers', 0),
+        "transfer_small_file_mb": config.get('system', {}).get('transfer', {}).get('small_file_mb', 64),
+        "transfer_aging_minutes": config.get('system', {}).get('transfer', {}).get('aging_minutes', 5),
+        "transfer_reserved_workers": config.get('system', {}).get('transfer', {}).get('reserved_workers', 1),
+        "bandwidth": config.get('system', {}).get('bandwidth', {}),
+        "cpu_workers": config.get('system', {}).get('cpu_workers', 0),
         "bilibili_users": config.get('bilibili', {}).get('users', []),
         "bilibili_interval": config.get('bilibili', {}).get('check_interval', 300),
-        "bilibili_cookies": config.get('bilibili', {}).get('cookies', {})
+        "bilibili_cookies": config.get('bilibili', {}).get('cookies', {}),
+        "bilibili_feed_mode": config.get('bilibili', {}).get('feed_mode', False),
+        "bilibili_guest_in_pool": config.get('bilibili', {}).get('guest_in_pool', False),
+        "bilibili_requests_per_minute": config.get('bilibili', {}).get('requests_per_minute', 20),
+        "bilibili_cooldown_minutes": config.get('bilibili', {}).get('cooldown_minutes', 10),
+        "bilibili_images": config.get('bilibili', {}).get('images', {}),
+        "bilibili_digest": config.get('bilibili', {}).get('digest', {"enabled": False}),
+        "bilibili_bundle": config.get('bilibili', {}).get('bundle', False),
+        "bilibili_index": config.get('bilibili', {}).get('index', {"enabled": False}),
+        "bilibili_video": config.get('bilibili', {}).get('video', {"enabled": False})
     }
     
     with open(INTEGRATION_CONFIG, 'w', encoding='utf-8') as f:
@@ -73,7 +106,10 @@ def update_baidu_config(config):
 
     # Update Tasks
     yaml_tasks = baidu_settings.get('tasks', [])
-    if yaml_tasks:
+    if yaml_tasks and baidu_settings.get('native_watch', False):
+        # The integration server watches the shares itself; baidu-autosave must not save them twice
+        base_config['baidu']['tasks'] = []
+    elif yaml_tasks:
         # Convert YAML tasks to baidu-autosave tasks format
         # Baidu-autosave tasks usually look like: 
         # { "source": "link", "pwd": "pwd", "target": "path", "regex_pattern": ... }
@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("Bandwidth")
+
+MB = 1024 * 1024
+
+
+def parse_schedule(entries, key):
+    """
+    Turn config entries like {"from": "09:00", "to": "19:00", "download_mb": 5}
+    into (start_minute, end_minute, bytes_per_second) tuples for one direction.
+    Entries without `key` do not limit that direction.
+    """
+    schedule = []
+    for entry in entries or []:
+        if key not in entry:
+            continue
+        start_h, start_m = (int(x) for x in str(entry["from"]).split(":"))
+        end_h, end_m = (int(x) for x in str(entry["to"]).split(":"))
+        schedule.append((start_h * 60 + start_m, end_h * 60 + end_m, float(entry[key]) * MB))
+    return schedule
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by every transfer in one direction.
+    Callers report bytes before sending/after receiving them and sleep until
+    the bucket has paid for them, so N concurrent transfers share the limit
+    instead of each getting a fixed slice. The rate can follow a time-of-day
+    schedule; a rate of 0 means unlimited.
+    """
+    def __init__(self, rate=0, schedule=None, burst_seconds=1.0):
+        """
+        :param rate: Default bytes per second (0 = unlimited)
+        :param schedule: List of (start_minute, end_minute, bytes_per_second) overriding the
+                         default inside that window; windows may wrap past midnight
+        :param burst_seconds: How much unused budget (in seconds of rate) may be spent at once
+        """
+        self.rate = rate
+        self.schedule = schedule or []
+        self.burst_seconds = burst_seconds
+        self._tat = 0.0  # Theoretical arrival time: when all reserved bytes are paid for
+        self._lock = threading.Lock()
+
+    def configure(self, rate=0, schedule=None):
+        with self._lock:
+            self.rate = rate
+            self.schedule = schedule or []
+
+    def current_rate(self, when=None):
+        when = when or datetime.now()
+        minute = when.hour * 60 + when.minute
+        for start, end, rate in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate
+        return self.rate
+
+    def consume(self, nbytes):
+        """Block until nbytes fit within the current rate"""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            rate = self.current_rate()
+            now = time.monotonic()
+            if not rate:
+                self._tat = now
+                return
+            self._tat = max(self._tat, now) + nbytes / rate
+            wait = self._tat - now - self.burst_seconds
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Bytes charged per read when a request body is streamed through a limiter
+STREAM_CHUNK = 64 * 1024
+
+
+class ThrottledReader:
+    """
+    Request body that charges a BandwidthLimiter as the HTTP client reads it,
+    at most chunk_size bytes at a time. A multi-MB upload is then paced over
+    the connection like downloads are, instead of being paid for up front and
+    sent in one burst at line rate. len() gives requests the Content-Length;
+    seek(0) rewinds the body for a retry.
+    """
+    def __init__(self, data, limiter, chunk_size=STREAM_CHUNK):
+        self._data = memoryview(data)
+        self.limiter = limiter
+        self.chunk_size = chunk_size
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence != 0:
+            raise ValueError("ThrottledReader only seeks from the start")
+        self._pos = offset
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self._data[self._pos:self._pos + size].tobytes()
+        self._pos += len(chunk)
+        if chunk and self.limiter:
+            self.limiter.consume(len(chunk))
+        return chunk
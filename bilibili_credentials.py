@@ -0,0 +1,157 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger("CredentialPool")
+
+# Bilibili risk-control responses: API codes and HTTP statuses
+RISK_CONTROL_CODES = {-352, -412, -509, -799}
+RISK_CONTROL_STATUS = {412, 429}
+
+
+def is_risk_controlled(exc):
+    """True if a bilibili_api exception means the identity was throttled"""
+    return getattr(exc, "code", None) in RISK_CONTROL_CODES or getattr(exc, "status", None) in RISK_CONTROL_STATUS
+
+
+class CredentialUnavailable(Exception):
+    """No identity (or not the required one) can take a request right now"""
+
+
+class PooledCredential:
+    """One identity in the pool (credential None = guest) with its own request budget"""
+    def __init__(self, name, credential, requests_per_minute):
+        self.name = name
+        self.credential = credential
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, requests_per_minute / 6.0)  # allow ~10s worth of burst
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.last_used = 0
+        self.cooldown_until = 0
+        self.strikes = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def available(self, now):
+        return now >= self.cooldown_until and self.tokens >= 1
+
+
+class CredentialPool:
+    """
+    Spreads Bilibili requests over several identities.
+    Each identity has a token-bucket rate budget; one that hits risk control is
+    taken out of rotation for a cooldown that doubles on repeated strikes.
+    """
+    def __init__(self, entries, strategy="least_loaded", cooldown=600):
+        """
+        :param entries: List of PooledCredential
+        :param strategy: "least_loaded" or "round_robin"
+        :param cooldown: Base cooldown in seconds for a throttled identity
+        """
+        if not entries:
+            raise ValueError("CredentialPool needs at least one entry")
+        self.entries = entries
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self._next = 0
+
+    @classmethod
+    def from_cookies(cls, cookies_list, include_guest=False, requests_per_minute=20, **kwargs):
+        """Build a pool from cookie dicts (sessdata, bili_jct, buvid3); falls back to guest mode"""
+        from bilibili_api import Credential
+
+        entries = []
+        for i, cookies in enumerate(cookies_list or []):
+            if cookies and cookies.get('sessdata'):
+                credential = Credential(
+                    sessdata=cookies.get('sessdata'),
+                    bili_jct=cookies.get('bili_jct'),
+                    buvid3=cookies.get('buvid3')
+                )
+                entries.append(PooledCredential(cookies.get('name', f"account{i + 1}"), credential, requests_per_minute))
+        if include_guest or not entries:
+            entries.append(PooledCredential("guest", None, requests_per_minute))
+        return cls(entries, **kwargs)
+
+    @property
+    def primary(self):
+        """The first logged-in credential, or None in guest-only mode"""
+        for entry in self.entries:
+            if entry.credential is not None:
+                return entry.credential
+        return None
+
+    def _pick(self, now, require=None):
+        candidates = self.entries if require is None else [e for e in self.entries if e.credential is require]
+        for entry in candidates:
+            entry.refill(now)
+        ready = [e for e in candidates if e.available(now)]
+        if not ready:
+            return None
+        if self.strategy == "round_robin":
+            for offset in range(len(self.entries)):
+                entry = self.entries[(self._next + offset) % len(self.entries)]
+                if entry in ready:
+                    self._next = (self.entries.index(entry) + 1) % len(self.entries)
+                    return entry
+        return min(ready, key=lambda e: (e.in_flight, e.last_used))
+
+    def _wait_time(self, now, require=None):
+        candidates = self.entries if require is None else [e for e in self.entries if e.credential is require]
+        waits = []
+        for entry in candidates:
+            token_wait = 0 if entry.tokens >= 1 else (1 - entry.tokens) / entry.rate
+            waits.append(max(entry.cooldown_until - now, token_wait))
+        return max(0.05, min(waits))
+
+    async def acquire(self, require=None, wait=True):
+        """
+        Wait for an identity with budget left (optionally a specific credential).
+        With wait=False, raise CredentialUnavailable instead of waiting.
+        """
+        while True:
+            now = time.monotonic()
+            entry = self._pick(now, require)
+            if entry:
+                entry.tokens -= 1
+                entry.in_flight += 1
+                entry.last_used = now
+                return entry
+            if not wait:
+                raise CredentialUnavailable("Required Bilibili credential is cooling down or out of budget"
+                                            if require is not None else "All Bilibili credentials are busy")
+            delay = self._wait_time(now, require)
+            if delay > 5:
+                logger.warning(f"All Bilibili credentials busy or cooling down, waiting {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    def release(self, entry, ok=True):
+        entry.in_flight -= 1
+        if ok:
+            entry.strikes = 0
+
+    def report_throttled(self, entry):
+        entry.strikes += 1
+        duration = self.cooldown * (2 ** (entry.strikes - 1))
+        entry.cooldown_until = time.monotonic() + duration
+        logger.warning(f"Bilibili credential '{entry.name}' hit risk control, cooling down for {duration}s")
+
+    @asynccontextmanager
+    async def use(self, require=None, wait=True):
+        """async with pool.use() as credential: ... (throttling is detected from the exception)"""
+        entry = await self.acquire(require, wait)
+        ok = True
+        try:
+            yield entry.credential
+        except Exception as e:
+            ok = False
+            if is_risk_controlled(e):
+                self.report_throttled(entry)
+            raise
+        finally:
+            self.release(entry, ok)
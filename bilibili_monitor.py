@@ -1,49 +1,132 @@
 
 import asyncio
+import inspect
 import time
 import os
 import threading
 import logging
-import requests
 from datetime import datetime
-from bilibili_api import user, dynamic, sync, Credential
+from lazy_import import LazyModule
+from dynamic_parser import DynamicEvent, parse_card
+from bilibili_credentials import CredentialPool
+from dynamic_archive import shard_dir, migrate_flat_layout
+
+# bilibili_api pulls in a large dependency tree; load it only once the monitor talks to Bilibili
+user = LazyModule("bilibili_api.user")
+network = LazyModule("bilibili_api.utils.network")
+requests = LazyModule("requests")
 
 # Configure logging
 logger = logging.getLogger("BilibiliMonitor")
 
+# Followed-users feed (same card format as user.get_dynamics)
+FEED_NEW_URL = "https://api.vc.bilibili.com/dynamic_svr/v1/dynamic_svr/dynamic_new"
+FEED_HISTORY_URL = "https://api.vc.bilibili.com/dynamic_svr/v1/dynamic_svr/dynamic_history"
+FEED_TYPE_LIST = 268435455  # all dynamic types
+FOLLOWED_REFRESH_INTERVAL = 3600
+
+# Image policy: ask the CDN for a resized/re-encoded variant instead of the original
+DEFAULT_IMAGE_POLICY = {
+    "mode": "resized",   # "resized" or "original"
+    "max_width": 1920,
+    "quality": 85,
+    "format": "webp"     # "webp", "avif", "jpg", or "" to keep the source format
+}
+
+def image_variant_url(url, policy=None):
+    """
+    Return (fetch_url, extension) for an image under the given policy.
+    Bilibili's CDN (*.hdslb.com) renders variants from a URL suffix such as
+    "@1920w_85q.webp"; other hosts and animated GIFs are fetched as-is.
+    """
+    policy = policy or DEFAULT_IMAGE_POLICY
+    base = url.split('?')[0]
+    ext = os.path.splitext(base)[1] or ".jpg"
+    if policy.get("mode") != "resized" or "hdslb.com" not in base or ext.lower() == ".gif" or "@" in base:
+        return url, ext
+
+    params = []
+    if policy.get("max_width"):
+        params.append(f"{int(policy['max_width'])}w")
+    if policy.get("quality"):
+        params.append(f"{int(policy['quality'])}q")
+    fmt = policy.get("format") or ""
+    suffix = "@" + "_".join(params) if params else "@"
+    if fmt:
+        suffix += f".{fmt}"
+        ext = f".{fmt}"
+    return base + suffix, ext
+
 class BilibiliMonitor:
-    def __init__(self, uids: list, check_interval: int, callback_func, cookies: dict = None):
+    def __init__(self, uids: list, check_interval: int, callback_func, cookies=None,
+                 feed_mode: bool = False, feed_max_pages: int = 5,
+                 guest_in_pool: bool = False, requests_per_minute: int = 20, cooldown: int = 600,
+                 image_policy: dict = None, index=None, video_archiver=None, video_callback=None):
         """
         :param uids: List of Bilibili User IDs to monitor
         :param check_interval: Check interval in seconds
-        :param callback_func: Function to call when new dynamic is found (args: file_path)
-        :param cookies: Dict containing sessdata, bili_jct, buvid3
+        :param callback_func: Function to call when new dynamic is found (args: file_path).
+                              Coroutine functions are scheduled as tasks and run concurrently with polling.
+        :param cookies: Dict containing sessdata, bili_jct, buvid3, or a list of such dicts
+                        to spread requests over several accounts
+        :param feed_mode: With cookies, read followed UIDs from the account's dynamics feed
+                          instead of one request per UID
+        :param feed_max_pages: Max feed pages read per check before falling back to per-UID requests
+        :param guest_in_pool: Also use guest (no cookies) requests alongside the accounts
+        :param requests_per_minute: Request budget of each account (and of guest mode)
+        :param cooldown: Seconds a risk-controlled account is taken out of rotation
+        :param image_policy: Image variant settings (see DEFAULT_IMAGE_POLICY)
+        :param index: Optional DynamicIndex that every archived dynamic is added to
+        :param video_archiver: Optional VideoArchiver; video dynamics then also archive the video itself
+        :param video_callback: Called (like callback_func) with the path of each archived video
         """
-        self.uids = uids
+        self.uids = list(uids)
+        self._uids_lock = threading.Lock()
+        self._pending_baseline = [] # UIDs added at runtime, baselined before their first check
         self.check_interval = check_interval
         self.callback = callback_func
         self.running = False
         self.last_dynamic_ids = {} # {uid: max_dynamic_id}
+        self._pending_callbacks = set()
+        self.feed_mode = feed_mode
+        self.image_policy = dict(DEFAULT_IMAGE_POLICY, **(image_policy or {}))
+        self.index = index
+        self.video_archiver = video_archiver
+        self.video_callback = video_callback
+        self.feed_max_pages = feed_max_pages
+        self._self_mid = None
+        self._followed = None # set of followed mids, refreshed hourly
+        self._followed_at = 0
         
-        self.credential = None
-        if cookies and cookies.get('sessdata'):
-            self.credential = Credential(
-                sessdata=cookies.get('sessdata'),
-                bili_jct=cookies.get('bili_jct'),
-                buvid3=cookies.get('buvid3')
-            )
-            logger.info("BilibiliMonitor authenticated with provided cookies.")
+        cookies_list = cookies if isinstance(cookies, list) else [cookies]
+        self.credential_pool = CredentialPool.from_cookies(
+            cookies_list,
+            include_guest=guest_in_pool,
+            requests_per_minute=requests_per_minute,
+            cooldown=cooldown
+        )
+        # Primary account: used for the followed feed and as the default identity
+        self.credential = self.credential_pool.primary
+        if self.credential:
+            logger.info(f"BilibiliMonitor authenticated with {len(self.credential_pool.entries)} pooled credential(s).")
         else:
             logger.info("BilibiliMonitor running in guest mode (no cookies).")
 
-    def _get_user(self, uid):
-        return user.User(uid, credential=self.credential)
+    async def _get_dynamics(self, uid):
+        # Each request is charged to whichever pooled identity has budget left
+        async with self.credential_pool.use() as credential:
+            return await user.User(uid, credential=credential).get_dynamics(offset=0)
         
     def start(self):
         """Start the monitor in a separate thread"""
         if self.running:
             return
         self.running = True
+        # Files written by older versions into the flat directory move into month shards
+        try:
+            migrate_flat_layout(os.path.join(os.getcwd(), "downloaded_dynamics"))
+        except Exception as e:
+            logger.error(f"Failed to migrate downloaded_dynamics to the sharded layout: {e}")
         thread = threading.Thread(target=self._monitor_loop, daemon=True)
         thread.start()
         logger.info(f"BilibiliMonitor started. Monitoring UIDs: {self.uids}")
@@ -51,13 +134,69 @@ class BilibiliMonitor:
     def stop(self):
         self.running = False
 
+    def add_uids(self, uids):
+        """Start watching more UIDs at runtime; only these are baselined. Returns the newly added UIDs"""
+        added = []
+        with self._uids_lock:
+            for uid in uids:
+                if uid not in self.uids:
+                    self.uids.append(uid)
+                    self._pending_baseline.append(uid)
+                    added.append(uid)
+        if added:
+            logger.info(f"Added UIDs to monitor: {added}")
+        return added
+
+    def remove_uids(self, uids):
+        """Stop watching UIDs; they leave the schedule immediately. Returns the removed UIDs"""
+        removed = []
+        with self._uids_lock:
+            for uid in uids:
+                if uid in self.uids:
+                    self.uids.remove(uid)
+                    if uid in self._pending_baseline:
+                        self._pending_baseline.remove(uid)
+                    self.last_dynamic_ids.pop(uid, None)
+                    removed.append(uid)
+        if removed:
+            logger.info(f"Removed UIDs from monitor: {removed}")
+        return removed
+
+    def _watched_uids(self):
+        # Snapshot of baselined UIDs, safe to iterate while the admin API edits the list
+        with self._uids_lock:
+            return [uid for uid in self.uids if uid not in self._pending_baseline]
+
+    def _is_watched(self, uid):
+        with self._uids_lock:
+            return uid in self.uids and uid not in self._pending_baseline
+
+    async def _baseline_pending(self):
+        with self._uids_lock:
+            pending = list(self._pending_baseline)
+        if not pending:
+            return
+        await self._init_baseline(pending)
+        with self._uids_lock:
+            for uid in pending:
+                if uid in self._pending_baseline:
+                    self._pending_baseline.remove(uid)
+                elif uid not in self.uids:
+                    # Removed again while its baseline was being fetched
+                    self.last_dynamic_ids.pop(uid, None)
+
     def _monitor_loop(self):
+        # One event loop for the monitor's lifetime, so async callbacks keep running between checks
+        asyncio.run(self._run())
+
+    async def _run(self):
         # Initial fetch to set baseline (don't alert on existing dynamics)
-        asyncio.run(self._init_baseline())
+        await self._init_baseline()
         
         while self.running:
             try:
-                asyncio.run(self._check_updates())
+                await self._baseline_pending()
+                await self._check_updates()
             except Exception as e:
                 logger.error(f"Error in monitor loop: {e}")
             
@@ -65,19 +204,56 @@ class BilibiliMonitor:
             for _ in range(self.check_interval):
                 if not self.running:
                     break
-                time.sleep(1)
+                await asyncio.sleep(1)
+                # Baseline UIDs added at runtime right away, so their next dynamics are caught
+                if self._pending_baseline:
+                    try:
+                        await self._baseline_pending()
+                    except Exception as e:
+                        logger.error(f"Error initializing baseline for new UIDs: {e}")
+
+        # Let in-flight uploads finish before the loop closes
+        if self._pending_callbacks:
+            await asyncio.gather(*self._pending_callbacks, return_exceptions=True)
+
+    def _track(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._pending_callbacks.add(task)
+        task.add_done_callback(self._pending_callbacks.discard)
+
+    def _dispatch_callback(self, file_path, callback=None):
+        callback = callback or self.callback
+        if inspect.iscoroutinefunction(callback):
+            self._track(self._run_async_callback(callback, file_path))
+        else:
+            callback(file_path)
+
+    async def _run_async_callback(self, callback, file_path):
+        try:
+            await callback(file_path)
+        except Exception as e:
+            logger.error(f"Callback failed for {file_path}: {e}", exc_info=True)
 
-    async def _init_baseline(self):
-        """Fetch latest dynamic ID for each user to avoid alerting on startup"""
+    async def _archive_video(self, event, out_path):
+        # Runs on the archiver's own threads; polling continues meanwhile
+        try:
+            path = await asyncio.wrap_future(self.video_archiver.submit(event.video, out_path))
+        except Exception as e:
+            logger.error(f"Failed to archive video of dynamic {event.dynamic_id}: {e}")
+            return
+        if self.video_callback:
+            self._dispatch_callback(path, self.video_callback)
+
+    async def _init_baseline(self, uids=None):
+        """Fetch latest dynamic ID for each user (default: all) to avoid alerting on startup"""
         logger.info("Initializing baseline for Bilibili monitor...")
-        for uid in self.uids:
+        for uid in (list(self.uids) if uids is None else uids):
             try:
                 # Get latest dynamics (offset=0 means latest)
                 # Structure: {'cards': [...], 'has_more': 1, 'next_offset': ...}
-                u = self._get_user(uid)
                 # bilibili_api dynamic.get_dynamic_space might be deprecated or different version
                 # Let's try user.get_dynamics
-                res = await u.get_dynamics(offset=0)
+                res = await self._get_dynamics(uid)
                 if res and 'cards' in res and len(res['cards']) > 0:
                     latest_id = res['cards'][0]['desc']['dynamic_id']
                     self.last_dynamic_ids[uid] = latest_id
@@ -89,99 +265,148 @@ class BilibiliMonitor:
         logger.info("Baseline initialized.")
 
     async def _check_updates(self):
-        for uid in self.uids:
+        feed_uids = set()
+        if self.feed_mode and self.credential:
+            try:
+                feed_uids = await self._check_feed()
+            except Exception as e:
+                logger.error(f"Error checking followed feed, falling back to per-UID checks: {e}")
+
+        for uid in self._watched_uids():
+            # Removed while this sweep was running
+            if uid in feed_uids or not self._is_watched(uid):
+                continue
             try:
-                u = self._get_user(uid)
-                res = await u.get_dynamics(offset=0)
+                res = await self._get_dynamics(uid)
                 
                 if not res or 'cards' not in res:
                     continue
-                    
-                new_dynamics = []
-                last_id = self.last_dynamic_ids.get(uid, 0)
-                current_max_id = last_id
-                
-                for card in res['cards']:
-                    dyn_id = card['desc']['dynamic_id']
-                    if dyn_id <= last_id:
-                        break
-                    new_dynamics.append(card)
-                    if dyn_id > current_max_id:
-                        current_max_id = dyn_id
-                
-                # Update max id
-                if current_max_id > last_id:
-                    self.last_dynamic_ids[uid] = current_max_id
-                
-                # Process new dynamics (oldest first to keep order)
-                for card in reversed(new_dynamics):
-                    await self._process_dynamic(card, uid)
+                await self._handle_new_cards(uid, res['cards'])
                     
             except Exception as e:
                 logger.error(f"Error checking updates for {uid}: {e}")
 
+    async def _handle_new_cards(self, uid, cards):
+        """Process cards (newest first) newer than the last seen dynamic of uid"""
+        new_dynamics = []
+        last_id = self.last_dynamic_ids.get(uid, 0)
+        current_max_id = last_id
+        
+        for card in cards:
+            dyn_id = card['desc']['dynamic_id']
+            if dyn_id <= last_id:
+                break
+            # Keep only the compact parsed record, not the raw card
+            try:
+                new_dynamics.append(parse_card(card))
+            except Exception as e:
+                logger.error(f"Error parsing dynamic {dyn_id}: {e}", exc_info=True)
+            if dyn_id > current_max_id:
+                current_max_id = dyn_id
+        
+        # Update max id
+        if current_max_id > last_id:
+            self.last_dynamic_ids[uid] = current_max_id
+        
+        # Process new dynamics (oldest first to keep order)
+        for event in reversed(new_dynamics):
+            await self._process_dynamic(event, uid)
+
+    async def _refresh_followed(self):
+        # Feed requests never wait for the primary account: while it cools down,
+        # _check_updates falls back to per-UID checks on the other credentials
+        if not self._self_mid:
+            async with self.credential_pool.use(require=self.credential, wait=False):
+                info = await user.get_self_info(self.credential)
+            self._self_mid = info['mid']
+        async with self.credential_pool.use(require=self.credential, wait=False):
+            res = await network.Api(
+                url="https://api.bilibili.com/x/web-interface/attentions", method="GET", credential=self.credential
+            ).update_params(mid=self._self_mid).result
+        # Depending on the endpoint version the list is returned bare or under 'list'
+        mids = res if isinstance(res, list) else res.get('list', [])
+        self._followed = {int(m) for m in mids}
+        self._followed_at = time.time()
+        logger.info(f"Followed feed covers {len(self._followed)} followed users")
+
+    async def _get_feed_page(self, offset=None):
+        params = {"uid": self._self_mid, "type_list": FEED_TYPE_LIST}
+        if offset:
+            url = FEED_HISTORY_URL
+            params["offset_dynamic_id"] = offset
+        else:
+            url = FEED_NEW_URL
+        # The feed belongs to the primary account, so it is charged to that account's budget
+        async with self.credential_pool.use(require=self.credential, wait=False):
+            return await network.Api(url=url, method="GET", credential=self.credential).update_params(**params).result
+
+    async def _check_feed(self):
+        """
+        Read the logged-in account's followed-users feed once and dispatch cards
+        of watched UIDs. Returns the UIDs fully covered by the feed this cycle;
+        the rest (not followed, or older than the pages read) are checked per UID.
+        """
+        if self._followed is None or time.time() - self._followed_at > FOLLOWED_REFRESH_INTERVAL:
+            await self._refresh_followed()
+
+        watched = {int(uid): uid for uid in self._watched_uids() if int(uid) in self._followed}
+        if not watched:
+            return set()
+        cards_by_uid = {uid: [] for uid in watched.values()}
+        # Stop paging once we are past the newest dynamic already seen for every watched UID
+        known_ids = [self.last_dynamic_ids.get(uid, 0) for uid in watched.values()]
+        floor = min([i for i in known_ids if i] or [0])
+
+        offset = None
+        oldest_seen = None
+        exhausted = False
+        for _ in range(self.feed_max_pages):
+            res = await self._get_feed_page(offset)
+            cards = (res or {}).get('cards') or []
+            for card in cards:
+                uid = watched.get(int(card['desc']['uid']))
+                if uid is not None:
+                    cards_by_uid[uid].append(card)
+            if cards:
+                oldest_seen = cards[-1]['desc']['dynamic_id']
+            if not cards or not res.get('has_more'):
+                exhausted = True
+                break
+            if oldest_seen <= floor:
+                break
+            offset = res.get('history_offset') or oldest_seen
+
+        covered = set()
+        for uid, cards in cards_by_uid.items():
+            # If paging stopped early, older unseen dynamics of this UID may be missing from the feed
+            if not exhausted and oldest_seen is not None and self.last_dynamic_ids.get(uid, 0) < oldest_seen:
+                continue
+            cards.sort(key=lambda c: c['desc']['dynamic_id'], reverse=True)
+            await self._handle_new_cards(uid, cards)
+            covered.add(uid)
+        return covered
+
     async def _process_dynamic(self, card, uid):
-        """Parse dynamic card and generate markdown"""
-        logger.info(f"New dynamic found for {uid}: {card['desc']['dynamic_id']}")
+        """Generate markdown for a dynamic (DynamicEvent or raw card)"""
+        event = card if isinstance(card, DynamicEvent) else parse_card(card)
+        logger.info(f"New dynamic found for {uid}: {event.dynamic_id}")
         
         try:
-            desc = card['desc']
-            card_data = card['card'] # JSON string, needs parsing
-            # Usually card_data is a dict if using this library? 
-            # Note: bilibili-api returns parsed dict for 'card' usually, 
-            # but raw API returns string. The library might auto-parse.
-            # Let's assume it is parsed or handle it.
-            import json
-            if isinstance(card_data, str):
-                card_data = json.loads(card_data)
-                
-            user_profile = card['desc']['user_profile']
-            uname = user_profile['info']['uname']
-            timestamp = desc['timestamp']
+            uname = event.uname
+            timestamp = event.timestamp
             time_str = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
             
-            # Content Parsing
-            content = ""
-            image_urls = []
-            
-            # Check type
-            # 1: 转发, 2: 图文, 4: 文字, 8: 视频, 64: 专栏
-            dtype = desc['type']
-            
-            if dtype == 1: # Forward
-                content = f"**[转发动态]**\n\n"
-                original = card_data.get('origin')
-                if original:
-                    if isinstance(original, str):
-                        original = json.loads(original)
-                    # Recursively parse original? Keep effective.
-                    content += f"> {original.get('item', {}).get('description', '转发内容')}\n"
-                current_content = card_data.get('item', {}).get('content', '')
-                content += f"\n评论: {current_content}"
-                
-            elif dtype == 2: # Picture
-                content = card_data.get('item', {}).get('description', '')
-                pics = card_data.get('item', {}).get('pictures', [])
-                for p in pics:
-                    image_urls.append(p.get('img_src'))
-                    
-            elif dtype == 4: # Text
-                content = card_data.get('item', {}).get('content', '')
-                
-            elif dtype == 8: # Video
-                content = f"**[发布视频]** {card_data.get('title', '')}\n{card_data.get('desc', '')}"
-                content += f"\n[链接]({card_data.get('short_link')})"
-                image_urls.append(card_data.get('pic'))
-            
-            else:
-                content = f"**[未支持的动态类型 {dtype}]**"
+            # Content Parsing (see dynamic_parser for the per-type parsers)
+            content = event.content
+            image_urls = event.image_urls
 
             # Prepare directories and filenames
             date_str = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d_%H-%M')
             safe_uname = "".join([c for c in uname if c.isalnum() or c in (' ', '-', '_')]).strip()
-            base_filename = f"[{date_str}] {safe_uname}_{desc['dynamic_id']}"
+            base_filename = f"[{date_str}] {safe_uname}_{event.dynamic_id}"
             
-            download_dir = os.path.join(os.getcwd(), "downloaded_dynamics")
+            # Sharded by month and UID so no directory grows without bound
+            download_dir = shard_dir(os.path.join(os.getcwd(), "downloaded_dynamics"), timestamp, uid)
             images_dir = os.path.join(download_dir, "images")
             os.makedirs(images_dir, exist_ok=True)
             
@@ -194,15 +419,20 @@ class BilibiliMonitor:
                 for i, img_url in enumerate(image_urls):
                     if not img_url: continue
                     try:
-                        # Extract extension or default to jpg
-                        ext = os.path.splitext(img_url)[1].split('?')[0]  # remove query params
-                        if not ext: ext = ".jpg"
+                        # Right-sized variant from the CDN; extension follows the requested format
+                        fetch_url, ext = image_variant_url(img_url, self.image_policy)
                         
                         img_filename = f"{base_filename}_img_{i+1}{ext}"
                         img_filepath = os.path.join(images_dir, img_filename)
                         
                         # Download
-                        r = requests.get(img_url, timeout=10)
+                        r = requests.get(fetch_url, timeout=10)
+                        if r.status_code != 200 and fetch_url != img_url:
+                            # Variant not available, fall back to the original
+                            fetch_url, ext = img_url, image_variant_url(img_url, {"mode": "original"})[1]
+                            img_filename = f"{base_filename}_img_{i+1}{ext}"
+                            img_filepath = os.path.join(images_dir, img_filename)
+                            r = requests.get(fetch_url, timeout=10)
                         if r.status_code == 200:
                             with open(img_filepath, 'wb') as f:
                                 f.write(r.content)
@@ -225,15 +455,25 @@ class BilibiliMonitor:
                 for img_path in local_image_paths:
                     md_content += f"![img]({img_path})\n"
             
-            link = f"https://t.bilibili.com/{desc['dynamic_id']}"
+            link = f"https://t.bilibili.com/{event.dynamic_id}"
             md_content += f"\n[查看原文]({link})"
             
             with open(md_filepath, 'w', encoding='utf-8') as f:
                 f.write(md_content)
+
+            if self.index:
+                try:
+                    self.index.add_event(event, uid, md_filepath)
+                except Exception as e:
+                    logger.error(f"Failed to index dynamic {event.dynamic_id}: {e}")
                 
             # Trigger callback (Upload)
             if self.callback:
-                self.callback(md_filepath)
+                self._dispatch_callback(md_filepath)
+
+            if self.video_archiver and event.video:
+                video_path = os.path.join(download_dir, "videos", f"{base_filename}.mp4")
+                self._track(self._archive_video(event, video_path))
                 
         except Exception as e:
             logger.error(f"Error parsing dynamic: {e}", exc_info=True)
@@ -0,0 +1,71 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger("ConfigWatcher")
+
+
+class ConfigWatcher:
+    """
+    Polls a JSON config file and calls on_change(old_config, new_config)
+    whenever its modification time changes. Invalid JSON (e.g. a file that is
+    mid-write) is retried on the next poll.
+    """
+    def __init__(self, path, on_change, interval=5):
+        """
+        :param path: Config file to watch (e.g. integration_config.json)
+        :param on_change: Called on the watcher thread with (old_config, new_config)
+        :param interval: Seconds between polls
+        """
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtime = self._current_mtime()
+        self._config = self._load() or {}
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {self.path}: {e}")
+            return None
+
+    def check(self):
+        """Reload the file if it changed; returns True if on_change was called"""
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        config = self._load()
+        if config is None:
+            return False
+        self._mtime = mtime
+        old, self._config = self._config, config
+        logger.info(f"{self.path} changed, applying")
+        try:
+            self.on_change(old, config)
+        except Exception as e:
+            logger.error(f"Failed to apply changed config: {e}", exc_info=True)
+        return True
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.check()
@@ -0,0 +1,50 @@
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("CPUPool")
+
+READ_SIZE = 1024 * 1024
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_cpu_pool(config):
+    """
+    Shared process pool for Python-level CPU work (zip compression of bundles
+    and month archives), or None when system.cpu_workers is 0. Jobs receive
+    file paths and return paths, so no large buffer crosses the process boundary.
+    Hashing stays in the transfer threads: hashlib and zlib release the GIL and
+    run on buffers already in memory.
+    """
+    global _pool, _pool_workers
+    workers = config.get("cpu_workers", 0)
+    with _pool_lock:
+        if workers and (_pool is None or workers != _pool_workers):
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: forking a process that already runs threads can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            logger.info(f"Started CPU pool with {workers} processes")
+        return _pool if workers else None
+
+
+def run_cpu(pool, func, *args):
+    """Run func(*args) in the pool and wait for the result; inline when pool is None"""
+    if pool is None:
+        return func(*args)
+    return pool.submit(func, *args).result()
+
+
+def file_md5(path):
+    """md5 hex digest of a file, in one streaming pass"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("DigestBuffer")
+
+# Markdown image links, e.g. ![img](images/[2023-11-15_06-13] Name_1_img_1.jpg);
+# file names written by the monitor contain spaces, so they are allowed in the target
+IMAGE_LINK_RE = re.compile(r'(!\[[^\]]*\]\()([^)\n]+)(\))')
+
+
+# Pending items, so a restart does not lose what was buffered
+JOURNAL_NAME = "pending.json"
+
+
+def author_name(md_path):
+    """Author name from a dynamic's file name, e.g. "[2023-11-15_06-13] TestUser_2000.md" -> "TestUser" """
+    name = os.path.splitext(os.path.basename(md_path))[0]
+    name = name.split("] ", 1)[-1]
+    return name.rsplit("_", 1)[0]
+
+
+def digest_key(md_path, group_by="uid"):
+    """
+    Group key for a dynamic's markdown file: its author's UID, or one global group.
+    The UID comes from the <month>/<uid> shard the monitor writes to, so renamed
+    authors stay in one group and namesakes are not merged; files outside a UID
+    shard (e.g. the legacy shard) fall back to the author name.
+    """
+    if group_by != "uid":
+        return "all"
+    shard = os.path.basename(os.path.dirname(os.path.abspath(md_path)))
+    if shard.isdigit():
+        return shard
+    return author_name(md_path) or "all"
+
+
+def rebase_image_links(md_content, src_dir, dst_dir):
+    """Rewrite relative image links of a markdown file moved from src_dir to dst_dir"""
+    def repl(match):
+        link = match.group(2)
+        if "://" in link or os.path.isabs(link):
+            return match.group(0)
+        new_link = os.path.relpath(os.path.join(src_dir, link), dst_dir).replace(os.sep, "/")
+        return f"{match.group(1)}{new_link}{match.group(3)}"
+    return IMAGE_LINK_RE.sub(repl, md_content)
+
+
+class DigestBuffer:
+    """
+    Buffers rendered dynamics and flushes them as one combined markdown
+    document per group when the time window elapses or the group reaches
+    max_items. Flushing (and uploading) happens on a background thread, so
+    add() never blocks the caller. Buffered items are journaled in
+    output_dir/pending.json until their digest is handed over, and reloaded
+    by start(), so a restart does not drop them.
+    """
+    def __init__(self, flush_func, output_dir, group_by="uid", window=3600, max_items=50):
+        """
+        :param flush_func: Called with the combined digest file path (e.g. an upload function)
+        :param output_dir: Directory the digest files are written to
+        :param group_by: "uid" for one digest per author, "global" for a single digest
+        :param window: Max seconds an item waits before its group is flushed
+        :param max_items: Flush a group as soon as it holds this many items
+        """
+        self.flush_func = flush_func
+        self.output_dir = output_dir
+        self.group_by = group_by
+        self.window = window
+        self.max_items = max_items
+        self._groups = {}  # key -> (first_added_at, [md paths])
+        self._flushing = {}  # key -> (first_added_at, [md paths]), taken but not yet handed over
+        self.journal_path = os.path.join(output_dir, JOURNAL_NAME)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def add(self, md_path):
+        key = digest_key(md_path, self.group_by)
+        with self._cond:
+            first_added, paths = self._groups.setdefault(key, (time.time(), []))
+            paths.append(md_path)
+            self._save_journal()
+            if len(paths) >= self.max_items:
+                self._cond.notify()
+
+    def _save_journal(self):
+        # Caller holds self._cond
+        pending = {}
+        for groups in (self._flushing, self._groups):
+            for key, (first_added, paths) in groups.items():
+                entry = pending.setdefault(key, [first_added, []])
+                entry[0] = min(entry[0], first_added)
+                entry[1].extend(paths)
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pending, f, ensure_ascii=False)
+        os.replace(tmp_path, self.journal_path)
+
+    def _load_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable digest journal {self.journal_path}: {e}")
+            return 0
+        restored = 0
+        with self._cond:
+            for key, (first_added, paths) in pending.items():
+                paths = [p for p in paths if os.path.exists(p)]
+                if not paths:
+                    continue
+                old_first, old_paths = self._groups.get(key, (first_added, []))
+                self._groups[key] = (min(old_first, first_added), paths + [p for p in old_paths if p not in paths])
+                restored += len(paths)
+            self._save_journal()
+        if restored:
+            logger.info(f"Restored {restored} buffered dynamics from {self.journal_path}")
+        return restored
+
+    def start(self):
+        if self._running:
+            return
+        self._load_journal()
+        self._running = True
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush everything still buffered"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+        self.flush(force=True)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                self._cond.wait(timeout=min(self.window, 30))
+            self.flush()
+
+    def _take_due(self, force):
+        now = time.time()
+        due = {}
+        with self._cond:
+            for key, (first_added, paths) in list(self._groups.items()):
+                if force or len(paths) >= self.max_items or now - first_added >= self.window:
+                    due[key] = (first_added, paths)
+                    self._flushing[key] = self._groups.pop(key)
+        return due
+
+    def flush(self, force=False):
+        """Write and hand over every group that is due (all groups if force)"""
+        for key, (first_added, paths) in self._take_due(force).items():
+            handed_over = False
+            try:
+                digest_path = self._write_digest(key, paths)
+                if digest_path:
+                    logger.info(f"Flushing digest of {len(paths)} dynamics: {digest_path}")
+                    self.flush_func(digest_path)
+                handed_over = True
+            except Exception as e:
+                logger.error(f"Failed to flush digest {key}: {e}", exc_info=True)
+            with self._cond:
+                self._flushing.pop(key, None)
+                if not handed_over:
+                    # Retried with the next flush, keeping the original age
+                    old_first, old_paths = self._groups.get(key, (first_added, []))
+                    self._groups[key] = (min(old_first, first_added), paths + old_paths)
+                self._save_journal()
+
+    def _write_digest(self, key, paths):
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = datetime.now()
+        safe_key = "".join([c for c in key if c.isalnum() or c in (' ', '-', '_')]).strip() or "all"
+        digest_path = os.path.join(self.output_dir, f"[{now.strftime('%Y-%m-%d_%H-%M-%S')}] digest_{safe_key}.md")
+        # Files removed meanwhile (e.g. a month compacted before a restart) are skipped
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            logger.warning(f"Skipping {len(missing)} buffered dynamics that no longer exist")
+            paths = [p for p in paths if p not in missing]
+            if not paths:
+                return None
+        # Latest name of the author for UID groups
+        title = f"{author_name(paths[-1])} (UID {key})" if key.isdigit() else key
+
+        parts = [f"# 动态汇总: {title}\n\n**生成时间**: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n共 {len(paths)} 条动态\n"]
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            # Individual files stay where they are; point their images at the right place from here
+            parts.append(rebase_image_links(content, os.path.dirname(path), self.output_dir))
+
+        with open(digest_path, 'w', encoding='utf-8') as f:
+            f.write("\n\n---\n\n".join(parts))
+        return digest_path
@@ -0,0 +1,135 @@
+import os
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("DiskBudget")
+
+# Suffix used for files that are still being downloaded
+PARTIAL_SUFFIX = ".part"
+# Each transfer downloads into its own subdirectory, so equal basenames never collide
+TRANSFER_DIR_PREFIX = "transfer-"
+
+
+class DiskSpaceError(Exception):
+    pass
+
+
+class Reservation:
+    """
+    Space held by one transfer. Tracked paths (a file or the transfer's
+    directory) tell how much of it is already written to disk.
+    """
+    def __init__(self, size, label=""):
+        self.size = size
+        self.label = label
+        self.paths = []
+
+    def track(self, path):
+        self.paths.append(path)
+
+    def written(self):
+        total = 0
+        for path in self.paths:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    for name in filenames:
+                        try:
+                            total += os.path.getsize(os.path.join(dirpath, name))
+                        except OSError:
+                            pass  # Removed or renamed meanwhile
+            elif os.path.isfile(path):
+                total += os.path.getsize(path)
+        return total
+
+    def outstanding(self):
+        """Reserved bytes that are not on disk yet"""
+        return max(0, self.size - self.written())
+
+
+class DiskBudget:
+    """
+    Reserves disk space for a transfer before it starts.
+    A transfer that would push the reserved total over the budget, or eat into
+    the minimum free space on the volume, waits until earlier transfers
+    release their reservation instead of failing halfway with ENOSPC.
+    """
+    def __init__(self, directory, budget_bytes=0, min_free_bytes=512 * 1024 * 1024):
+        """
+        :param directory: Download directory the budget applies to
+        :param budget_bytes: Max bytes reserved at once (0 = limited by free space only)
+        :param min_free_bytes: Free space that must always be left on the volume
+        """
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.reserved = 0
+        self._active = set()
+        self._cond = threading.Condition()
+
+    def _free_bytes(self):
+        # The download directory may not exist yet; measure the volume it will live on
+        path = os.path.abspath(self.directory)
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def _fits(self, size):
+        # Free space already excludes what active transfers wrote; only their remaining bytes count against it
+        pending = sum(r.outstanding() for r in self._active)
+        if self._free_bytes() - pending - self.min_free_bytes < size:
+            return False
+        if self.budget_bytes and self.reserved + size > self.budget_bytes:
+            # A file larger than the whole budget may still run on its own
+            return self.reserved == 0
+        return True
+
+    @contextmanager
+    def reserve(self, size, label=""):
+        """
+        Block until `size` bytes can be reserved, hold them for the duration of the with-block.
+        Yields the Reservation; track() the path being downloaded so written bytes are not counted twice.
+        """
+        size = max(0, int(size or 0))
+        reservation = Reservation(size, label)
+        with self._cond:
+            if self.reserved == 0 and not self._fits(size):
+                # Nothing to wait for: the volume itself is too small
+                raise DiskSpaceError(f"Not enough disk space for {label or 'transfer'} ({size} bytes)")
+            if not self._fits(size):
+                logger.info(f"Waiting for disk budget: {label} needs {size} bytes, {self.reserved} reserved")
+            while not self._fits(size):
+                self._cond.wait(timeout=5)
+                if self.reserved == 0 and not self._fits(size):
+                    raise DiskSpaceError(f"Not enough disk space for {label or 'transfer'} ({size} bytes)")
+            self.reserved += size
+            self._active.add(reservation)
+        try:
+            yield reservation
+        finally:
+            with self._cond:
+                self.reserved -= size
+                self._active.discard(reservation)
+                self._cond.notify_all()
+
+
+def cleanup_partials(directory):
+    """Remove partial downloads and per-transfer directories left behind by a crashed run"""
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(PARTIAL_SUFFIX):
+                os.remove(path)
+                removed += 1
+            elif name.startswith(TRANSFER_DIR_PREFIX) and os.path.isdir(path):
+                shutil.rmtree(path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove partial download {name}: {e}")
+    if removed:
+        logger.info(f"Removed {removed} orphaned partial downloads from {directory}")
+    return removed
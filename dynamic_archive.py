@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import zlib
+import shutil
+import struct
+import zipfile
+import logging
+from datetime import datetime, timedelta
+
+from digest import IMAGE_LINK_RE
+from md_bundle import compress_type_for
+
+logger = logging.getLogger("DynamicArchive")
+
+# Shard for files migrated from the flat layout, whose UID is not recorded anywhere
+LEGACY_SHARD = "legacy"
+INDEX_SUFFIX = ".index.json"
+# A month is only compacted this long after it ended, so late fetches still land in its directory
+COMPACT_GRACE = timedelta(days=2)
+
+# "[2023-11-15_06-13] TestUser_2000.md" -> month "2023-11"
+MONTH_FROM_NAME_RE = re.compile(r'^\[(\d{4}-\d{2})-\d{2}_')
+MONTH_DIR_RE = re.compile(r'^\d{4}-\d{2}$')
+
+# Zip local file header: signature ... file name length, extra field length
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def shard_dir(root, timestamp, uid):
+    """Directory a dynamic is archived in: <root>/<YYYY-MM>/<uid>"""
+    month = datetime.fromtimestamp(timestamp).strftime('%Y-%m')
+    return os.path.join(root, month, str(uid))
+
+
+def migrate_flat_layout(root):
+    """
+    Move markdown files (and the images they link to) from the old flat
+    layout into <root>/<YYYY-MM>/legacy/. Links stay valid because images
+    keep their images/ subdirectory next to the markdown. Returns the number
+    of markdown files moved.
+    """
+    if not os.path.isdir(root):
+        return 0
+    moved = 0
+    for name in sorted(os.listdir(root)):
+        src = os.path.join(root, name)
+        match = MONTH_FROM_NAME_RE.match(name)
+        if not (name.endswith(".md") and match and os.path.isfile(src)):
+            continue
+        dst_dir = os.path.join(root, match.group(1), LEGACY_SHARD)
+        os.makedirs(os.path.join(dst_dir, "images"), exist_ok=True)
+
+        with open(src, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for link in IMAGE_LINK_RE.findall(content):
+            rel = link[1]
+            if "://" in rel or not rel.startswith("images/"):
+                continue
+            image_src = os.path.join(root, rel)
+            if os.path.isfile(image_src):
+                shutil.move(image_src, os.path.join(dst_dir, rel))
+        shutil.move(src, os.path.join(dst_dir, name))
+        moved += 1
+
+    images_dir = os.path.join(root, "images")
+    if os.path.isdir(images_dir) and not os.listdir(images_dir):
+        os.rmdir(images_dir)
+    if moved:
+        logger.info(f"Migrated {moved} dynamics from the flat layout into month shards")
+    return moved
+
+
+def compact_month(root, month):
+    """
+    Pack <root>/<month>/ into <root>/<month>.zip and write an offset index
+    (<month>.zip.index.json) next to it, then delete the files that are in
+    the archive. Files that arrive while the month is being packed are left
+    in place for the next run. Returns the archive path.
+    """
+    month_dir = os.path.join(root, month)
+    archive_path = os.path.join(root, f"{month}.zip")
+    tmp_path = archive_path + ".tmp"
+
+    if os.path.exists(tmp_path):
+        # Left over from an interrupted run
+        os.remove(tmp_path)
+    if os.path.exists(archive_path):
+        # Late arrivals for an already compacted month are appended to its archive
+        shutil.copyfile(archive_path, tmp_path)
+    archived = []
+    with zipfile.ZipFile(tmp_path, 'a' if os.path.exists(tmp_path) else 'w') as zf:
+        existing = set(zf.namelist())
+        for dirpath, _, filenames in os.walk(month_dir):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                arcname = os.path.relpath(path, month_dir).replace(os.sep, "/")
+                if arcname not in existing:
+                    zf.write(path, arcname, compress_type=compress_type_for(path))
+                archived.append(path)
+        index = {
+            info.filename: {
+                "offset": info.header_offset,
+                "size": info.file_size,
+                "compressed_size": info.compress_size,
+                "compress_type": info.compress_type
+            }
+            for info in zf.infolist()
+        }
+
+    with open(archive_path + INDEX_SUFFIX + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, archive_path)
+    os.replace(archive_path + INDEX_SUFFIX + ".tmp", archive_path + INDEX_SUFFIX)
+    for path in archived:
+        os.remove(path)
+    # Only directories left empty go; anything written meanwhile keeps its directory
+    for dirpath, _, _ in os.walk(month_dir, topdown=False):
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+    logger.info(f"Compacted {len(index)} files of {month} into {archive_path}")
+    return archive_path
+
+
+def compact_closed_months(root, now=None, executor=None, grace=COMPACT_GRACE):
+    """
+    Compact every month directory that ended at least `grace` ago; returns the archive paths.
+    With an executor (e.g. the CPU pool) months are compressed in parallel.
+    """
+    if not os.path.isdir(root):
+        return []
+    # Months before this one ended more than `grace` ago
+    closed = ((now or datetime.now()) - grace).strftime('%Y-%m')
+    months = [
+        name for name in sorted(os.listdir(root))
+        if MONTH_DIR_RE.match(name) and name < closed and os.path.isdir(os.path.join(root, name))
+    ]
+    if executor is not None:
+        return list(executor.map(compact_month, [root] * len(months), months))
+    return [compact_month(root, month) for month in months]
+
+
+def load_index(root, month):
+    with open(os.path.join(root, f"{month}.zip{INDEX_SUFFIX}"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_archived(root, month, arcname, index=None):
+    """
+    Read one file from a compacted month using the offset index: a single
+    seek and read, without parsing the archive's central directory.
+    """
+    entry = (index or load_index(root, month))[arcname]
+    with open(os.path.join(root, f"{month}.zip"), 'rb') as f:
+        f.seek(entry["offset"])
+        header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        if header[0] != b"PK\x03\x04":
+            raise ValueError(f"Corrupt archive entry {arcname} in {month}.zip")
+        name_len, extra_len = header[-2], header[-1]
+        f.seek(name_len + extra_len, os.SEEK_CUR)
+        data = f.read(entry["compressed_size"])
+    if entry["compress_type"] == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    return data
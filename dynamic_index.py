@@ -0,0 +1,211 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+import zipfile
+from datetime import datetime
+
+from dynamic_archive import MONTH_DIR_RE, INDEX_SUFFIX
+
+logger = logging.getLogger("DynamicIndex")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dynamics (
+    dynamic_id INTEGER PRIMARY KEY,
+    uid INTEGER,
+    uname TEXT,
+    timestamp INTEGER,
+    dtype INTEGER,
+    text TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS dynamics_uid_time ON dynamics(uid, timestamp);
+CREATE INDEX IF NOT EXISTS dynamics_time ON dynamics(timestamp);
+-- Trigram tokens match Chinese text (no word boundaries) as substrings
+CREATE VIRTUAL TABLE IF NOT EXISTS dynamics_fts USING fts5(
+    text, uname, content='dynamics', content_rowid='dynamic_id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS dynamics_ai AFTER INSERT ON dynamics BEGIN
+    INSERT INTO dynamics_fts(rowid, text, uname) VALUES (new.dynamic_id, new.text, new.uname);
+END;
+CREATE TRIGGER IF NOT EXISTS dynamics_ad AFTER DELETE ON dynamics BEGIN
+    INSERT INTO dynamics_fts(dynamics_fts, rowid, text, uname) VALUES ('delete', old.dynamic_id, old.text, old.uname);
+END;
+CREATE TRIGGER IF NOT EXISTS dynamics_au AFTER UPDATE ON dynamics BEGIN
+    INSERT INTO dynamics_fts(dynamics_fts, rowid, text, uname) VALUES ('delete', old.dynamic_id, old.text, old.uname);
+    INSERT INTO dynamics_fts(rowid, text, uname) VALUES (new.dynamic_id, new.text, new.uname);
+END;
+"""
+
+# Markdown written by BilibiliMonitor._process_dynamic
+MD_NAME_RE = re.compile(r'^\[[^\]]+\] .*_(\d+)\.md$')
+MD_UNAME_RE = re.compile(r'^# (.*) 的新动态$', re.M)
+MD_TIME_RE = re.compile(r'^\*\*时间\*\*: (.+)$', re.M)
+
+# Trigram tokens need at least 3 characters; shorter terms fall back to LIKE
+MIN_MATCH_LEN = 3
+
+# Columns of a row after dynamic_id, in add_many order
+COLUMNS = ("uid", "uname", "timestamp", "dtype", "text", "path")
+
+
+def event_text(event):
+    """Searchable text of a DynamicEvent, including the forwarded dynamic"""
+    parts = [event.title, event.text]
+    if event.origin is not None:
+        parts += [event.origin.uname, event.origin.title, event.origin.text]
+    return "\n".join(p for p in parts if p)
+
+
+class DynamicIndex:
+    """
+    SQLite FTS5 index over archived dynamics.
+    One connection guarded by a lock; the monitor adds rows as it writes
+    markdown files and the web server queries the same file.
+    """
+    def __init__(self, path="dynamic_index.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_many(self, rows, update=COLUMNS):
+        """
+        Insert (dynamic_id, uid, uname, timestamp, dtype, text, path) rows in one transaction.
+        Existing dynamics get the `update` columns overwritten (all by default,
+        none with an empty tuple).
+        """
+        on_conflict = (
+            "DO UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in update)
+        ) if update else "DO NOTHING"
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO dynamics (dynamic_id, uid, uname, timestamp, dtype, text, path) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(dynamic_id) {on_conflict}",
+                rows
+            )
+
+    def add(self, dynamic_id, uid, uname, timestamp, dtype, text, path=""):
+        self.add_many([(dynamic_id, uid, uname, timestamp, dtype, text, path)])
+
+    def add_event(self, event, uid, path=""):
+        self.add(event.dynamic_id, uid, event.uname, event.timestamp, event.dtype, event_text(event), path)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dynamics").fetchone()[0]
+
+    def search(self, query="", uid=None, since=None, until=None, limit=20):
+        """
+        Full-text search, newest first. Every whitespace-separated term must match
+        (as a substring of the text or author name).
+        """
+        sql = "SELECT d.* FROM dynamics d"
+        where, params = [], []
+        terms = query.split()
+        match_terms = [t for t in terms if len(t) >= MIN_MATCH_LEN]
+        if match_terms:
+            sql += " JOIN dynamics_fts f ON f.rowid = d.dynamic_id"
+            where.append("dynamics_fts MATCH ?")
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in match_terms))
+        for term in terms:
+            if len(term) < MIN_MATCH_LEN:
+                where.append("(d.text LIKE ? OR d.uname LIKE ?)")
+                params += [f"%{term}%"] * 2
+        if uid is not None:
+            where.append("d.uid = ?")
+            params.append(uid)
+        if since is not None:
+            where.append("d.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("d.timestamp < ?")
+            params.append(until)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY d.timestamp DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+
+def parse_markdown(name, content):
+    """(dynamic_id, uname, timestamp, dtype, text) from a dynamic's markdown file, or None"""
+    match = MD_NAME_RE.match(name)
+    uname = MD_UNAME_RE.search(content)
+    time_line = MD_TIME_RE.search(content)
+    if not (match and uname and time_line):
+        return None
+    timestamp = int(datetime.strptime(time_line.group(1).strip(), '%Y-%m-%d %H:%M:%S').timestamp())
+    # Body: between the time line and the image list / source link
+    body = content[time_line.end():]
+    has_images = "\n**图片**:" in body
+    for marker in ("\n**图片**:", "\n[查看原文]("):
+        body = body.split(marker, 1)[0]
+    body = body.strip()
+    # The card type is not written out; recover it from the markers the parsers emit
+    if body.startswith("**[转发动态]**"):
+        dtype = 1
+    elif body.startswith("**[发布视频]**"):
+        dtype = 8
+    else:
+        dtype = 2 if has_images else 4
+    return int(match.group(1)), uname.group(1), timestamp, dtype, body
+
+
+def backfill(index, root, batch_size=500):
+    """
+    Index every markdown file under the archive root: month shards
+    (<YYYY-MM>/<uid>/*.md, uid 0 for the legacy shard) and compacted month
+    archives. Already indexed dynamics keep their row and only get the
+    current path, so rows pointing at a compacted month's deleted .md files
+    now point into its zip. Returns the number of files read.
+    """
+    if not os.path.isdir(root):
+        return 0
+    indexed = 0
+    rows = []
+
+    def add(name, content, uid, path):
+        nonlocal indexed
+        parsed = parse_markdown(name, content)
+        if parsed:
+            dynamic_id, uname, timestamp, dtype, text = parsed
+            rows.append((dynamic_id, uid, uname, timestamp, dtype, text, path))
+            indexed += 1
+        if len(rows) >= batch_size:
+            # Rows added live by the monitor carry the parsed card, keep them
+            index.add_many(rows, update=("path",))
+            rows.clear()
+
+    for entry in sorted(os.listdir(root)):
+        entry_path = os.path.join(root, entry)
+        if MONTH_DIR_RE.match(entry) and os.path.isdir(entry_path):
+            for shard in sorted(os.listdir(entry_path)):
+                shard_path = os.path.join(entry_path, shard)
+                if not os.path.isdir(shard_path):
+                    continue
+                uid = int(shard) if shard.isdigit() else 0
+                for name in sorted(os.listdir(shard_path)):
+                    if name.endswith(".md"):
+                        with open(os.path.join(shard_path, name), 'r', encoding='utf-8') as f:
+                            add(name, f.read(), uid, os.path.join(shard_path, name))
+        elif entry.endswith(".zip") and os.path.exists(entry_path + INDEX_SUFFIX):
+            with zipfile.ZipFile(entry_path) as zf:
+                for arcname in zf.namelist():
+                    shard, _, name = arcname.rpartition("/")
+                    if name.endswith(".md") and "/" not in shard:
+                        uid = int(shard) if shard.isdigit() else 0
+                        add(name, zf.read(arcname).decode('utf-8'), uid, f"{entry_path}!{arcname}")
+    if rows:
+        index.add_many(rows, update=("path",))
+    logger.info(f"Backfilled {indexed} dynamics from {root}")
+    return indexed
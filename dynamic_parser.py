@@ -0,0 +1,127 @@
+import json
+import logging
+
+try:
+    # Optional, several times faster on large card payloads
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger("DynamicParser")
+
+# Dynamic card type -> parser function(event, card_data, desc)
+# 1: 转发, 2: 图文, 4: 文字, 8: 视频, 64: 专栏
+PARSERS = {}
+
+
+class DynamicEvent:
+    """Compact record of the fields we render and index; the raw card is not kept"""
+    __slots__ = ("dynamic_id", "uid", "uname", "timestamp", "dtype",
+                 "text", "title", "link", "image_urls", "content", "origin", "video")
+
+    def __init__(self, dynamic_id=0, uid=0, uname="", timestamp=0, dtype=0):
+        self.dynamic_id = dynamic_id
+        self.uid = uid
+        self.uname = uname
+        self.timestamp = timestamp
+        self.dtype = dtype
+        self.text = ""
+        self.title = ""
+        self.link = ""
+        self.image_urls = ()
+        self.content = ""  # Markdown body fragment
+        self.origin = None  # DynamicEvent of the forwarded dynamic
+        self.video = None  # {"aid", "bvid", "cid"} of a video dynamic
+
+    def __repr__(self):
+        return f"DynamicEvent({self.dynamic_id}, uid={self.uid}, type={self.dtype})"
+
+
+def register(dtype):
+    """Register a parser for a dynamic card type"""
+    def decorator(func):
+        PARSERS[dtype] = func
+        return func
+    return decorator
+
+
+def _load(data):
+    # bilibili-api already decodes 'card' for user.get_dynamics, raw feed APIs return strings
+    if isinstance(data, (str, bytes)):
+        return _loads(data)
+    return data or {}
+
+
+def parse_card(card):
+    """Parse a raw dynamic card ({'desc': ..., 'card': ...}) into a DynamicEvent"""
+    desc = card['desc']
+    event = DynamicEvent(
+        dynamic_id=desc['dynamic_id'],
+        uid=desc.get('uid', 0),
+        uname=desc['user_profile']['info']['uname'],
+        timestamp=desc['timestamp'],
+        dtype=desc['type']
+    )
+    _parse_body(event, _load(card['card']), desc)
+    return event
+
+
+def _parse_body(event, card_data, desc):
+    parser = PARSERS.get(event.dtype)
+    if parser is None:
+        event.content = f"**[未支持的动态类型 {event.dtype}]**"
+        return
+    parser(event, card_data, desc)
+
+
+@register(1)
+def _parse_forward(event, card_data, desc):
+    event.text = card_data.get('item', {}).get('content', '')
+    content = f"**[转发动态]**\n\n"
+    original = card_data.get('origin')
+    if original:
+        original = _load(original)
+        content += f"> {original.get('item', {}).get('description', '转发内容')}\n"
+        # Parse the forwarded dynamic with its own type's parser
+        origin_type = desc.get('orig_type') or card_data.get('item', {}).get('orig_type')
+        if origin_type:
+            origin_user = card_data.get('origin_user', {}).get('info', {})
+            event.origin = DynamicEvent(
+                dynamic_id=card_data.get('item', {}).get('orig_dy_id', 0),
+                uid=origin_user.get('uid', 0),
+                uname=origin_user.get('uname', ''),
+                dtype=origin_type
+            )
+            try:
+                _parse_body(event.origin, original, {})
+            except Exception as e:
+                logger.warning(f"Could not parse forwarded dynamic of {event.dynamic_id}: {e}")
+    content += f"\n评论: {event.text}"
+    event.content = content
+
+
+@register(2)
+def _parse_picture(event, card_data, desc):
+    item = card_data.get('item', {})
+    event.text = item.get('description', '')
+    event.image_urls = tuple(p.get('img_src') for p in item.get('pictures', []))
+    event.content = event.text
+
+
+@register(4)
+def _parse_text(event, card_data, desc):
+    event.text = card_data.get('item', {}).get('content', '')
+    event.content = event.text
+
+
+@register(8)
+def _parse_video(event, card_data, desc):
+    event.title = card_data.get('title', '')
+    event.text = card_data.get('desc', '')
+    event.link = card_data.get('short_link')
+    event.image_urls = (card_data.get('pic'),)
+    if card_data.get('aid'):
+        event.video = {"aid": card_data['aid'], "bvid": desc.get('bvid', ''), "cid": card_data.get('cid')}
+    event.content = f"**[发布视频]** {event.title}\n{event.text}"
+    event.content += f"\n[链接]({event.link})"
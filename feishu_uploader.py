@@ -1,14 +1,184 @@
 import os
+import asyncio
+import functools
 import requests
 import json
+from urllib3 import encode_multipart_formdata
 import time
+import random
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cpu_pool import file_md5
+from bandwidth import ThrottledReader
+
+# Feishu error codes that mean "slow down" and are safe to retry
+RATE_LIMIT_CODES = {
+    99991400,  # request trigger frequency limit
+    1061045,   # drive: can retry (frequency limit)
+}
+# Server-side hiccups that usually succeed on a second attempt
+TRANSIENT_CODES = {
+    1061001,   # drive: internal error
+}
+# Tenant access token expired or revoked before our local expiry
+TOKEN_INVALID_CODES = {
+    99991661,  # missing access token
+    99991663,  # invalid access token
+}
+# The part arrived corrupted; only that part needs to be sent again
+CHECKSUM_ERROR_CODES = {
+    1062008,   # drive: checksum param invalid
+}
+# The parent folder no longer exists, e.g. it was deleted or moved in Feishu
+PARENT_NOT_FOUND_CODES = {
+    1061003,   # drive: not found
+    1061007,   # drive: file has been deleted
+    1061044,   # drive: parent node not exist
+}
+RETRYABLE_HTTP_STATUS = (429, 500, 502, 503, 504)
+
+
+class FeishuAPIError(Exception):
+    def __init__(self, message, res):
+        super().__init__(f"{message}: {res}")
+        self.code = res.get("code")
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit shared by all requests of one uploader.
+    The limit grows by one slot per window of successful requests and is
+    halved when Feishu signals throttling.
+    """
+    def __init__(self, initial=2, minimum=1, maximum=8):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            # Requests already in flight report the same congestion event; only back off once per second
+            now = time.monotonic()
+            if now - self._last_decrease < 1:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class UploadCache:
+    """
+    Persistent content-hash index of uploaded files:
+    "<md5>:<folder token>" -> {"file_token", "name", "size", "verified"}.
+    One instance is shared by every uploader of a pool, so a file uploaded
+    through one app is found through all of them.
+    """
+    def __init__(self, path=None, revalidate_after=86400):
+        """
+        :param path: Optional JSON file persisting the index
+        :param revalidate_after: Seconds after which a hit is checked against Feishu before it is trusted
+        """
+        self.path = path
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Ignoring unreadable upload cache {self.path}: {e}")
+        return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(md5, folder_token):
+        return f"{md5.lower()}:{folder_token}"
+
+    def get(self, md5, folder_token):
+        with self._lock:
+            entry = self.entries.get(self._key(md5, folder_token))
+            return dict(entry) if entry else None
+
+    def needs_check(self, entry):
+        return time.time() - entry.get("verified", 0) > self.revalidate_after
+
+    def put(self, md5, folder_token, file_token, name="", size=0):
+        with self._lock:
+            self.entries[self._key(md5, folder_token)] = {
+                "file_token": file_token, "name": name, "size": size, "verified": time.time()
+            }
+            self._save()
+
+    def touch(self, md5, folder_token):
+        with self._lock:
+            entry = self.entries.get(self._key(md5, folder_token))
+            if entry:
+                entry["verified"] = time.time()
+                self._save()
+
+    def drop(self, md5, folder_token):
+        with self._lock:
+            if self.entries.pop(self._key(md5, folder_token), None):
+                self._save()
+
 
 class FeishuUploader:
-    def __init__(self, app_id, app_secret):
+    def __init__(self, app_id, app_secret, folder_cache_path=None, max_concurrency=4, max_retries=5,
+                 limiter=None, upload_cache=None):
+        """
+        :param app_id: Feishu app id
+        :param app_secret: Feishu app secret
+        :param folder_cache_path: Optional JSON file persisting the folder path -> token index
+        :param max_concurrency: Upper bound for concurrent API requests (AIMD adjusts below it)
+        :param max_retries: Retries for rate-limited or transient failures
+        :param limiter: Optional BandwidthLimiter shared by all uploads
+        :param upload_cache: Optional UploadCache; identical content already uploaded to a folder is not sent again
+        """
         self.app_id = app_id
         self.app_secret = app_secret
         self.token = None
         self.token_expiry = 0
+        self.session = requests.Session()
+
+        self.max_retries = max_retries
+        self.limiter = limiter
+        self.upload_cache = upload_cache
+        self.concurrency = AdaptiveConcurrency(initial=min(2, max_concurrency), maximum=max_concurrency)
+
+        # Folder index: "<root_token>:<a/b/c>" -> folder token
+        self.folder_cache_path = folder_cache_path
+        self.folder_cache = self._load_folder_cache()
+        self._folder_lock = threading.Lock()
 
     def get_tenant_access_token(self):
         if self.token and time.time() < self.token_expiry:
@@ -22,7 +192,7 @@ class FeishuUploader:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.session.post(url, headers=headers, json=data)
             response.raise_for_status()
             res_json = response.json()
             if res_json.get("code") == 0:
@@ -36,81 +206,312 @@ class FeishuUploader:
             print(f"Error getting tenant_access_token: {e}")
             raise
 
-    def get_folder_token(self, folder_name=None):
-        # Placeholder: ideally search for folder by name or return root
-        # For now, if no folder token is provided by user, we might need to create one or use root.
-        # But usually uploading to root requires the root folder token. 
-        # For now, return None, hoping the API defaults to root or user provides a specific token.
-        return None 
+    def _request(self, method, url, headers=None, files=None, **kwargs):
+        """
+        Authorized API call with retries. Rate-limit and transient errors are
+        retried with exponential backoff and full jitter; throttling also
+        shrinks the shared concurrency limit. Returns the last JSON response.
+        """
+        for attempt in range(self.max_retries + 1):
+            body = kwargs.get("data")
+            if hasattr(body, "seek"):
+                # Streamed body: resend from the start
+                body.seek(0)
+            req_headers = dict(headers or {})
+            req_headers["Authorization"] = f"Bearer {self.get_tenant_access_token()}"
+
+            self.concurrency.acquire()
+            try:
+                response = getattr(self.session, method)(url, headers=req_headers, files=files, **kwargs)
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Request to {url} failed ({e}), retrying...")
+                time.sleep(self._backoff(attempt))
+                continue
+            finally:
+                self.concurrency.release()
+
+            throttled = response.status_code == 429
+            try:
+                res = response.json()
+            except ValueError:
+                res = {"code": -1, "msg": f"HTTP {response.status_code}"}
+            code = res.get("code")
+            throttled = throttled or code in RATE_LIMIT_CODES
+
+            if code == 0:
+                self.concurrency.on_success()
+                return res
+            if code in TOKEN_INVALID_CODES and attempt < self.max_retries:
+                self.token = None
+                continue
+            if not (throttled or code in TRANSIENT_CODES or response.status_code in RETRYABLE_HTTP_STATUS):
+                return res
+            if attempt == self.max_retries:
+                return res
+
+            delay = self._backoff(attempt)
+            if throttled:
+                self.concurrency.on_throttle()
+                # Feishu tells us when the current rate-limit window resets
+                reset = response.headers.get("x-ogw-ratelimit-reset")
+                if reset and str(reset).isdigit():
+                    delay = max(delay, int(reset))
+            print(f"Feishu API busy (code {code}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+        return res
+
+    @staticmethod
+    def _backoff(attempt, base=0.5, cap=30):
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+    def _load_folder_cache(self):
+        if self.folder_cache_path and os.path.exists(self.folder_cache_path):
+            try:
+                with open(self.folder_cache_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Ignoring unreadable folder cache {self.folder_cache_path}: {e}")
+        return {}
+
+    def _save_folder_cache(self):
+        if not self.folder_cache_path:
+            return
+        # Write to a temp file first so a crash never leaves a truncated index
+        tmp_path = self.folder_cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.folder_cache, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.folder_cache_path)
+
+    @staticmethod
+    def _folder_key(root_folder_token, parts):
+        return f"{root_folder_token}:{'/'.join(parts)}"
+
+    def get_folder_token(self, folder_path, root_folder_token=""):
+        """
+        Resolve a folder path like "/downloads/anime" below root_folder_token,
+        creating missing folders on the way. Resolved tokens are cached, so
+        repeated lookups of the same folder cost no API call.
+        """
+        parts = [p for p in folder_path.replace("\\", "/").split("/") if p]
+        if not parts:
+            return root_folder_token
+
+        cached = self.folder_cache.get(self._folder_key(root_folder_token, parts))
+        if cached:
+            return cached
+
+        with self._folder_lock:
+            # Start from the deepest prefix we already know
+            token = root_folder_token
+            start = 0
+            for i in range(len(parts), 0, -1):
+                known = self.folder_cache.get(self._folder_key(root_folder_token, parts[:i]))
+                if known:
+                    token, start = known, i
+                    break
+
+            for i in range(start, len(parts)):
+                # One listing indexes every sibling folder, not just the one we need
+                children = self._list_child_folders(token)
+                for name, child_token in children.items():
+                    self.folder_cache[self._folder_key(root_folder_token, parts[:i] + [name])] = child_token
+
+                child_token = children.get(parts[i])
+                if not child_token:
+                    child_token = self._create_folder(parts[i], token)
+                    self.folder_cache[self._folder_key(root_folder_token, parts[:i + 1])] = child_token
+                token = child_token
+
+            self._save_folder_cache()
+        return token
+
+    def forget_folder(self, folder_path, root_folder_token=""):
+        """
+        Drop a folder path from the folder cache: the folder, everything below
+        it and the folders above it, so the next lookup walks the path again.
+        """
+        parts = [p for p in folder_path.replace("\\", "/").split("/") if p]
+        if not parts:
+            return
+        path_key = self._folder_key(root_folder_token, parts)
+        stale = {self._folder_key(root_folder_token, parts[:i]) for i in range(1, len(parts))}
+        with self._folder_lock:
+            for key in list(self.folder_cache):
+                if key in stale or key == path_key or key.startswith(path_key + "/"):
+                    del self.folder_cache[key]
+            self._save_folder_cache()
 
-    def upload_file(self, file_path, parent_folder_token=""):
+    def upload_to_folder(self, file_path, folder_path, root_folder_token="", content_md5=None):
+        """
+        upload_file into a folder path below root_folder_token (see get_folder_token).
+        When the cached folder turns out to be gone, the path is resolved again once.
+        """
+        return _upload_to_folder(self, file_path, folder_path, root_folder_token, content_md5)
+
+    def _list_child_folders(self, folder_token):
+        url = "https://open.feishu.cn/open-apis/drive/v1/files"
+        folders = {}
+        page_token = None
+        while True:
+            params = {"folder_token": folder_token, "page_size": 200}
+            if page_token:
+                params["page_token"] = page_token
+            res = self._request("get", url, params=params)
+            if res.get("code") != 0:
+                raise Exception(f"List folder failed: {res}")
+            data = res.get("data", {})
+            for item in data.get("files", []):
+                if item.get("type") == "folder":
+                    folders[item["name"]] = item["token"]
+            if not data.get("has_more"):
+                return folders
+            page_token = data.get("next_page_token")
+
+    def _create_folder(self, name, parent_folder_token):
+        url = "https://open.feishu.cn/open-apis/drive/v1/files/create_folder"
+        headers = {"Content-Type": "application/json"}
+        res = self._request("post", url, headers=headers, json={"name": name, "folder_token": parent_folder_token})
+        if res.get("code") != 0:
+            raise Exception(f"Create folder failed: {res}")
+        print(f"Created Feishu folder: {name}")
+        return res["data"]["token"]
+
+    def upload_file(self, file_path, parent_folder_token="", content_md5=None):
+        """
+        Upload a file into a folder. With an upload cache, content already
+        uploaded to that folder is not sent again; the cached file token is
+        returned instead (with "cached": True).
+        :param content_md5: md5 hex digest of the file if already known (e.g. from the download),
+                            saves hashing the file again
+        """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
         file_size = os.path.getsize(file_path)
         file_name = os.path.basename(file_path)
-        token = self.get_tenant_access_token()
+
+        md5 = None
+        if self.upload_cache is not None:
+            md5 = content_md5 or file_md5(file_path)
+            cached = self._cached_upload(md5, parent_folder_token, file_name)
+            if cached:
+                return cached
 
         # Simple threshold: 20MB
         if file_size < 20 * 1024 * 1024:
-            return self._upload_small_file(file_path, file_name, file_size, parent_folder_token)
+            res = self._upload_small_file(file_path, file_name, file_size, parent_folder_token)
         else:
-            return self._upload_large_file(file_path, file_name, file_size, parent_folder_token)
+            res = self._upload_large_file(file_path, file_name, file_size, parent_folder_token)
+
+        file_token = (res or {}).get("data", {}).get("file_token")
+        if md5 and file_token and res.get("code") == 0:
+            self.upload_cache.put(md5, parent_folder_token, file_token, file_name, file_size)
+        return res
+
+    def _cached_upload(self, md5, parent_folder_token, file_name):
+        """Result for content already in the folder, or None; old entries are checked against Feishu first"""
+        entry = self.upload_cache.get(md5, parent_folder_token)
+        if not entry:
+            return None
+        if self.upload_cache.needs_check(entry):
+            exists = self._file_exists(entry["file_token"])
+            if exists is False:
+                # Deleted on the Feishu side since: upload again
+                self.upload_cache.drop(md5, parent_folder_token)
+                return None
+            if exists:
+                self.upload_cache.touch(md5, parent_folder_token)
+        print(f"Skipping upload of {file_name}: identical content already uploaded as {entry['file_token']}")
+        return {"code": 0, "msg": "success", "data": {"file_token": entry["file_token"]}, "cached": True}
+
+    def _file_exists(self, file_token):
+        """True/False from Feishu's file metadata, None if the lookup itself failed"""
+        url = "https://open.feishu.cn/open-apis/drive/v1/metas/batch_query"
+        headers = {"Content-Type": "application/json"}
+        try:
+            res = self._request("post", url, headers=headers,
+                                json={"request_docs": [{"doc_token": file_token, "doc_type": "file"}]})
+        except requests.RequestException as e:
+            print(f"Could not check Feishu file {file_token}: {e}")
+            return None
+        if res.get("code") != 0:
+            return None
+        return any(meta.get("doc_token") == file_token for meta in res.get("data", {}).get("metas", []))
 
     def _upload_small_file(self, file_path, file_name, file_size, parent_folder_token):
         url = "https://open.feishu.cn/open-apis/drive/v1/files/upload_all"
-        headers = {"Authorization": f"Bearer {self.token}"}
         
-        # multipart/form-data
+        # Read once (< 20MB) so the Adler-32 checksum costs no second pass over the file
         with open(file_path, 'rb') as f:
-            files = {'file': (file_name, f)}
-            data = {
-                'file_name': file_name,
-                'parent_type': 'explorer',
-                'parent_node': parent_folder_token,
-                'size': str(file_size)
-            }
-            response = requests.post(url, headers=headers, files=files, data=data)
-            return response.json()
+            content = f.read()
+        data = {
+            'file_name': file_name,
+            'parent_type': 'explorer',
+            'parent_node': parent_folder_token,
+            'size': str(file_size),
+            'checksum': str(zlib.adler32(content))
+        }
+        res = self._post_multipart(url, data, file_name, content)
+        if res.get("code") != 0:
+            raise FeishuAPIError("Upload failed", res)
+        return res
+
+    def _post_multipart(self, url, data, file_name, content):
+        """multipart/form-data POST of form fields plus one file; paced by the upload limiter if any"""
+        if not self.limiter:
+            return self._request("post", url, files={'file': (file_name, content)}, data=data)
+        # Same field order as requests builds it: form fields, then the file
+        fields = [(k, str(v)) for k, v in data.items()] + [('file', (file_name, content))]
+        body, content_type = encode_multipart_formdata(fields)
+        return self._request("post", url, headers={"Content-Type": content_type},
+                             data=ThrottledReader(body, self.limiter))
 
     def _upload_large_file(self, file_path, file_name, file_size, parent_folder_token):
         # 1. Prepare
         url_prepare = "https://open.feishu.cn/open-apis/drive/v1/files/upload_prepare"
-        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        headers = {"Content-Type": "application/json"}
         data_prepare = {
             "file_name": file_name,
             "parent_type": "explorer",
             "parent_node": parent_folder_token,
             "size": file_size
         }
-        res_prepare = requests.post(url_prepare, headers=headers, json=data_prepare).json()
+        res_prepare = self._request("post", url_prepare, headers=headers, json=data_prepare)
         if res_prepare.get("code") != 0:
-            raise Exception(f"Upload prepare failed: {res_prepare}")
+            raise FeishuAPIError("Upload prepare failed", res_prepare)
         
         upload_id = res_prepare["data"]["upload_id"]
         block_size = res_prepare["data"]["block_size"]
         blocks = res_prepare["data"]["block_num"]
         
-        # 2. Upload parts
-        with open(file_path, 'rb') as f:
-            for i in range(blocks):
-                chunk = f.read(block_size)
-                url_part = "https://open.feishu.cn/open-apis/drive/v1/files/upload_part"
-                # multipart/form-data for part
-                files = {'file': (file_name, chunk)}
+        # 2. Upload parts, as many at once as the adaptive limit allows
+        def upload_part(i, max_attempts=3):
+            url_part = "https://open.feishu.cn/open-apis/drive/v1/files/upload_part"
+            for attempt in range(max_attempts):
+                with open(file_path, 'rb') as f:
+                    f.seek(i * block_size)
+                    chunk = f.read(block_size)
+                checksum = zlib.adler32(chunk)
                 data_part = {
                     'upload_id': upload_id,
                     'seq': i,
-                    'size': len(chunk)
+                    'size': len(chunk),
+                    'checksum': str(checksum)
                 }
-                # headers for multipart are auto-generated by requests if not set (or if specific auth header set)
-                # But here we need Authorization header
-                headers_part = {"Authorization": f"Bearer {self.token}"} 
-                
-                res_part = requests.post(url_part, headers=headers_part, files=files, data=data_part).json()
-                if res_part.get("code") != 0:
-                    raise Exception(f"Upload part {i} failed: {res_part}")
-                print(f"Uploaded part {i+1}/{blocks}")
+                res_part = self._post_multipart(url_part, data_part, file_name, chunk)
+                if res_part.get("code") == 0:
+                    print(f"Uploaded part {i+1}/{blocks}")
+                    return
+                if res_part.get("code") not in CHECKSUM_ERROR_CODES:
+                    break
+                print(f"Checksum mismatch on part {i+1}/{blocks}, resending it")
+            raise Exception(f"Upload part {i} failed: {res_part}")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency.maximum) as pool:
+            # list() re-raises the first failed part
+            list(pool.map(upload_part, range(blocks)))
 
         # 3. Finish
         url_finish = "https://open.feishu.cn/open-apis/drive/v1/files/upload_finish"
@@ -119,8 +520,123 @@ class FeishuUploader:
             "block_num": blocks
         }
         # re-use json header
-        res_finish = requests.post(url_finish, headers=headers, json=data_finish).json()
+        res_finish = self._request("post", url_finish, headers=headers, json=data_finish)
         if res_finish.get("code") != 0:
             raise Exception(f"Upload finish failed: {res_finish}")
         
         return res_finish
+
+
+class FeishuUploaderPool:
+    """
+    Shards uploads across several Feishu apps that can write to the same folders.
+    Every app keeps its own token cache and AIMD limit; each upload goes to the
+    app with the most spare capacity. Folder resolution always uses the first
+    app, so there is a single folder index. Results are returned unchanged.
+    """
+    def __init__(self, uploaders):
+        if not uploaders:
+            raise ValueError("FeishuUploaderPool needs at least one uploader")
+        self.uploaders = uploaders
+        self.in_flight = [0] * len(uploaders)
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.uploaders[0]
+
+    def _acquire(self):
+        with self._lock:
+            # Least busy relative to what the app's limiter currently allows
+            index = min(
+                range(len(self.uploaders)),
+                key=lambda i: self.in_flight[i] / max(1.0, self.uploaders[i].concurrency.limit)
+            )
+            self.in_flight[index] += 1
+            return index
+
+    def _release(self, index):
+        with self._lock:
+            self.in_flight[index] -= 1
+
+    def get_tenant_access_token(self):
+        return self.primary.get_tenant_access_token()
+
+    def get_folder_token(self, folder_path, root_folder_token=""):
+        return self.primary.get_folder_token(folder_path, root_folder_token)
+
+    def forget_folder(self, folder_path, root_folder_token=""):
+        self.primary.forget_folder(folder_path, root_folder_token)
+
+    def upload_to_folder(self, file_path, folder_path, root_folder_token="", content_md5=None):
+        return _upload_to_folder(self, file_path, folder_path, root_folder_token, content_md5)
+
+    def upload_file(self, file_path, parent_folder_token="", content_md5=None):
+        index = self._acquire()
+        try:
+            print(f"Uploading {os.path.basename(file_path)} via app {self.uploaders[index].app_id}")
+            if content_md5 is None:
+                return self.uploaders[index].upload_file(file_path, parent_folder_token)
+            return self.uploaders[index].upload_file(file_path, parent_folder_token, content_md5)
+        finally:
+            self._release(index)
+
+
+class AsyncFeishuUploader:
+    """
+    Awaitable front end for FeishuUploader.
+    The prepare/part/finish protocol runs on a small dedicated thread pool, so
+    an upload never blocks the caller's event loop. The wrapped uploader keeps
+    the token cache, folder index, HTTP session and concurrency limit, and can
+    be shared with synchronous callers.
+    """
+    def __init__(self, app_id=None, app_secret=None, uploader=None, max_workers=4, executor=None, **kwargs):
+        """
+        :param uploader: Existing FeishuUploader (or FeishuUploaderPool) to share; built from app_id/app_secret/kwargs otherwise
+        :param max_workers: Number of uploads that may run at the same time
+        :param executor: Shared executor to run on instead of a dedicated pool (e.g. a TransferScheduler view)
+        """
+        if uploader is None and not (app_id and app_secret):
+            raise ValueError("AsyncFeishuUploader needs an uploader or app_id and app_secret")
+        self.uploader = uploader or FeishuUploader(app_id, app_secret, **kwargs)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feishu-upload")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def get_tenant_access_token(self):
+        return await self._run(self.uploader.get_tenant_access_token)
+
+    async def get_folder_token(self, folder_path, root_folder_token=""):
+        return await self._run(self.uploader.get_folder_token, folder_path, root_folder_token)
+
+    async def upload_file(self, file_path, parent_folder_token="", content_md5=None):
+        args = (file_path, parent_folder_token) if content_md5 is None else (file_path, parent_folder_token, content_md5)
+        return await self._run(self.uploader.upload_file, *args)
+
+    async def upload_to_folder(self, file_path, folder_path, root_folder_token="", content_md5=None):
+        return await self._run(self.uploader.upload_to_folder, file_path, folder_path, root_folder_token, content_md5)
+
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+
+def _upload_to_folder(uploader, file_path, folder_path, root_folder_token, content_md5):
+    """upload_to_folder of FeishuUploader and FeishuUploaderPool"""
+    kwargs = {} if content_md5 is None else {"content_md5": content_md5}
+    for attempt in range(2):
+        folder_token = uploader.get_folder_token(folder_path, root_folder_token)
+        try:
+            res = uploader.upload_file(file_path, folder_token, **kwargs)
+            code = (res or {}).get("code")
+        except FeishuAPIError as e:
+            if attempt or e.code not in PARENT_NOT_FOUND_CODES:
+                raise
+            code = e.code
+        if attempt or code not in PARENT_NOT_FOUND_CODES:
+            return res
+        print(f"Cached Feishu folder for {folder_path} is gone (code {code}), resolving it again")
+        uploader.forget_folder(folder_path, root_folder_token)
@@ -0,0 +1,49 @@
+import time
+import importlib
+import threading
+
+# (module name, seconds) for every module loaded through this helper, in load order
+IMPORT_TIMES = []
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    Attributes set on the proxy (e.g. by unittest.mock.patch) shadow the real
+    module's, so `patch('pkg.mod.Name')` keeps working.
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self.__dict__["_module"] = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def timed_import(name):
+    """importlib.import_module that records how long the import took"""
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES.append((name, time.perf_counter() - start))
+    return module
+
+
+def import_report():
+    """Human-readable summary of the imports recorded so far"""
+    lines = ["Import times:"]
+    for name, seconds in IMPORT_TIMES:
+        lines.append(f"  {seconds * 1000:8.1f} ms  {name}")
+    total = sum(seconds for _, seconds in IMPORT_TIMES)
+    lines.append(f"  {total * 1000:8.1f} ms  total")
+    return "\n".join(lines)
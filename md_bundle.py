@@ -0,0 +1,54 @@
+import os
+import zipfile
+import logging
+
+from digest import IMAGE_LINK_RE
+
+logger = logging.getLogger("MarkdownBundle")
+
+# Formats that are already compressed; deflating them again only burns CPU
+PRECOMPRESSED_EXTS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif",
+    ".mp4", ".m4a", ".m4s", ".flv", ".mp3", ".zip", ".gz", ".7z"
+}
+
+
+def compress_type_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    return zipfile.ZIP_STORED if ext in PRECOMPRESSED_EXTS else zipfile.ZIP_DEFLATED
+
+
+def bundle_markdown(md_path, output_dir=None):
+    """
+    Pack a markdown file and the local images it links to into one zip.
+    Images are stored under images/ inside the archive (links are rewritten to
+    match), already-compressed formats without recompression.
+    Returns the zip path (default: <md dir>/bundles/<name>.zip).
+    """
+    md_dir = os.path.dirname(os.path.abspath(md_path))
+    output_dir = output_dir or os.path.join(md_dir, "bundles")
+    os.makedirs(output_dir, exist_ok=True)
+    zip_path = os.path.join(output_dir, os.path.splitext(os.path.basename(md_path))[0] + ".zip")
+
+    with open(md_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    images = {}  # arcname -> local path
+
+    def repl(match):
+        link = match.group(2)
+        local = os.path.join(md_dir, link)
+        if "://" in link or not os.path.isfile(local):
+            return match.group(0)
+        arcname = f"images/{os.path.basename(link)}"
+        images[arcname] = local
+        return f"{match.group(1)}{arcname}{match.group(3)}"
+
+    content = IMAGE_LINK_RE.sub(repl, content)
+
+    with zipfile.ZipFile(zip_path, 'w') as zf:
+        zf.writestr(os.path.basename(md_path), content, compress_type=zipfile.ZIP_DEFLATED)
+        for arcname, local in images.items():
+            zf.write(local, arcname, compress_type=compress_type_for(local))
+    logger.info(f"Bundled {md_path} with {len(images)} images into {zip_path}")
+    return zip_path
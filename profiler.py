@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+
+logger = logging.getLogger("Profiler")
+
+# Longest session an admin request may start
+MAX_DURATION = 300
+
+
+def _frame_stack(frame):
+    """Stack of "function (file:line)" entries, outermost first"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def sample_stacks(duration=10, interval=0.01):
+    """
+    Sample every thread's stack for `duration` seconds and return them in
+    collapsed format ("thread;outer;...;inner count" per line), which
+    flamegraph.pl, speedscope and similar tools read directly.
+    Nothing is installed in the interpreter: the sampler thread only reads
+    sys._current_frames(), so there is no cost outside a session.
+    """
+    duration = min(max(duration, 0.1), MAX_DURATION)
+    names = {}
+    counts = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if len(names) != threading.active_count():
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = [names.get(ident, f"thread-{ident}")] + _frame_stack(frame)
+            counts[";".join(s.replace(";", ":") for s in stack)] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+def dump_stacks():
+    """Current stack of every thread, formatted like a traceback"""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f"--- {names.get(ident, 'unknown')} ({ident}) ---\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(parts)
+
+
+# Only one session at a time: two samplers would just measure each other
+_session_lock = threading.Lock()
+
+
+def run_session(duration=10, interval=0.01):
+    """sample_stacks, refusing to start while another session is running (returns None then)"""
+    if not _session_lock.acquire(blocking=False):
+        return None
+    try:
+        logger.info(f"Profiling all threads for {duration}s")
+        return sample_stacks(duration, interval)
+    finally:
+        _session_lock.release()
@@ -1,5 +1,11 @@
 import os
 import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import timedelta
 
 # Ensure current directory is in path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -9,59 +15,401 @@ libs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baidu-auto
 if os.path.exists(libs_path):
     sys.path.insert(0, libs_path)
 
-from webhook_server import app
+from lazy_import import timed_import, import_report
 
-if __name__ == "__main__":
+CONFIG_FILE = "integration_config.json"
+
+# Subsystems are imported inside the command that needs them, so e.g. a cron
+# `transfer` run never loads Flask or bilibili_api.
+
+# Cleanup run when the process shuts down cleanly (e.g. flushing the digest buffer)
+_shutdown_hooks = []
+
+
+def shutdown():
+    while _shutdown_hooks:
+        hook = _shutdown_hooks.pop()
+        try:
+            hook()
+        except Exception as e:
+            print(f"Error during shutdown: {e}")
+
+
+def load_integration_config():
+    if not os.path.exists(CONFIG_FILE):
+        return None
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def start_bilibili_monitor(conf):
+    """Start the Bilibili monitor in the background if UIDs are configured; returns it or None"""
+    users = conf.get('bilibili_users', [])
+    interval = conf.get('bilibili_interval', 300)
+    cookies = conf.get('bilibili_cookies', {})
+    if not users:
+        return None
+
+    print(f"Starting Bilibili Monitor for {len(users)} users...")
+    BilibiliMonitor = timed_import("bilibili_monitor").BilibiliMonitor
+    transfer = timed_import("transfer")
+    AsyncFeishuUploader = timed_import("feishu_uploader").AsyncFeishuUploader
+    PRIORITY_DYNAMIC = timed_import("transfer_scheduler").PRIORITY_DYNAMIC
+
+    # Share the server's uploader so token/folder caches and rate limits are common,
+    # and its scheduler so dynamics are uploaded ahead of queued Baidu files
+    scheduler = transfer.get_transfer_scheduler(conf, transfer.get_baidu_pcs())
+    uploader = None
+    feishu = transfer.get_feishu_uploader()
+    if feishu is None:
+        print("Warning: Feishu is not configured, dynamics are archived locally but not uploaded.")
+    else:
+        uploader = AsyncFeishuUploader(uploader=feishu, executor=scheduler.executor(PRIORITY_DYNAMIC))
+    token = conf.get('feishu_folder_token')
+    bundle = conf.get('bilibili_bundle', False)
+    if bundle:
+        bundle_markdown = timed_import("md_bundle").bundle_markdown
+        cpu_pool = timed_import("cpu_pool")
+        # Compressing the bundle runs in the CPU pool when one is configured
+        pool = cpu_pool.get_cpu_pool(conf)
+
+    # Digest mode: buffer dynamics and upload one combined document per window
+    digest = None
+    digest_conf = conf.get('bilibili_digest', {})
+    if digest_conf.get('enabled') and uploader:
+        DigestBuffer = timed_import("digest").DigestBuffer
+
+        def upload_digest(digest_path):
+            # Runs on the digest's own thread
+            path = cpu_pool.run_cpu(pool, bundle_markdown, digest_path) if bundle else digest_path
+            res = scheduler.submit(
+                uploader.uploader.upload_file, path, token, priority=PRIORITY_DYNAMIC, label=path
+            ).result()
+            print(f"Digest upload result: {res}")
+            if bundle and res and res.get('code') == 0:
+                os.remove(path)
+
+        digest = DigestBuffer(
+            upload_digest,
+            os.path.join(os.getcwd(), "downloaded_dynamics", "digests"),
+            group_by=digest_conf.get('group_by', 'uid'),
+            window=digest_conf.get('window_minutes', 60) * 60,
+            max_items=digest_conf.get('max_items', 50)
+        )
+        digest.start()
+        # Hand over what is buffered on exit; the journal covers unclean exits
+        _shutdown_hooks.append(digest.stop)
+
+    # Full-text index of everything the monitor archives
+    index = None
+    index_conf = conf.get('bilibili_index', {})
+    if index_conf.get('enabled'):
+        DynamicIndex = timed_import("dynamic_index").DynamicIndex
+        index = DynamicIndex(index_conf.get('path', 'dynamic_index.db'))
+
+    # Video archival: DASH streams downloaded in ranged segments and muxed with ffmpeg
+    archiver = None
+    upload_video = None
+    video_conf = conf.get('bilibili_video', {})
+    if video_conf.get('enabled'):
+        try:
+            first_account = cookies[0] if isinstance(cookies, list) and cookies else cookies
+            archiver = timed_import("video_archive").VideoArchiver(
+                cookies=first_account,
+                max_quality=video_conf.get('max_quality', 80),
+                codec=video_conf.get('codec', 'avc'),
+                max_videos=video_conf.get('max_videos', 1),
+                max_connections=video_conf.get('max_connections', 4),
+                segment_mb=video_conf.get('segment_mb', 4),
+                ffmpeg=video_conf.get('ffmpeg', 'ffmpeg')
+            )
+        except Exception as e:
+            print(f"Video archival disabled: {e}")
+
+        async def upload_video(path):
+            # Queued by size, so a large video does not hold up dynamics and small files
+            print(f"Uploading video {path} to Feishu...")
+            res = await asyncio.wrap_future(scheduler.submit(
+                uploader.uploader.upload_file, path, token, size=os.path.getsize(path), label=path
+            ))
+            print(f"Video upload result: {res}")
+
+    # Awaited on the monitor's event loop, so polling continues while uploads run
+    async def upload_callback(file_path):
+        print(f"New dynamic found: {file_path}")
+        if digest:
+            digest.add(file_path)
+            print("Buffered for the next digest upload.")
+            return
+        try:
+            path = file_path
+            if bundle:
+                # Markdown plus its images in one archive: still a single upload call
+                path = await asyncio.to_thread(cpu_pool.run_cpu, pool, bundle_markdown, file_path)
+            print(f"Uploading {path} to Feishu...")
+            res = await uploader.upload_file(path, token)
+            print(f"Upload result: {res}")
+
+            # Cleanup
+            if res and res.get('code') == 0:
+                if bundle:
+                    os.remove(path)
+                # os.remove(file_path)  # Keep file for local archive as requested
+                print("File uploaded. Local copy preserved in 'downloaded_dynamics'.")
+            else:
+                print("Upload failed, file kept.")
+
+        except Exception as e:
+            print(f"Error in upload callback: {e}")
+
+    monitor = BilibiliMonitor(
+        users, interval, upload_callback if uploader else None, cookies,
+        feed_mode=conf.get('bilibili_feed_mode', False),
+        guest_in_pool=conf.get('bilibili_guest_in_pool', False),
+        requests_per_minute=conf.get('bilibili_requests_per_minute', 20),
+        cooldown=conf.get('bilibili_cooldown_minutes', 10) * 60,
+        image_policy=conf.get('bilibili_images'),
+        index=index,
+        video_archiver=archiver,
+        video_callback=upload_video if uploader else None
+    )
+    monitor.start()
+    return monitor
+
+
+def watch_bilibili_users(monitor, conf):
+    """Apply edits of bilibili_users in the config file to the running monitor"""
+    interval = conf.get('config_watch_seconds', 5)
+    if not interval:
+        return None
+    ConfigWatcher = timed_import("config_watcher").ConfigWatcher
+
+    def on_change(old, new):
+        # Diff against the previous file, so UIDs changed through the admin API are left alone
+        old_uids = old.get('bilibili_users', [])
+        new_uids = new.get('bilibili_users', [])
+        monitor.add_uids([uid for uid in new_uids if uid not in old_uids])
+        monitor.remove_uids([uid for uid in old_uids if uid not in new_uids])
+
+    watcher = ConfigWatcher(CONFIG_FILE, on_change, interval=interval)
+    watcher.start()
+    return watcher
+
+
+def start_share_watcher(conf):
+    """Watch baidu_tasks share links in-process if native_watch is enabled; returns the watcher or None"""
+    tasks = conf.get('baidu_tasks', [])
+    if not (conf.get('baidu_native_watch', False) and tasks):
+        return None
+    transfer = timed_import("transfer")
+    share_watcher = timed_import("share_watcher")
+    accounts = transfer.load_baidu_accounts()
+    if not accounts:
+        print("Share watcher: no Baidu account configured")
+        return None
+    _, bduss, stoken = accounts[0]
+
+    def on_files(paths):
+        pcs = transfer.get_baidu_pcs()
+        uploader = transfer.get_feishu_uploader()
+        if not (pcs and uploader):
+            return [{"file": path, "status": "error", "message": "Transfer not configured"} for path in paths]
+        return transfer.transfer_files(paths, pcs, uploader, transfer.load_config())
+
+    print(f"Watching {len(tasks)} Baidu shares...")
+    return share_watcher.ShareWatcher(
+        share_watcher.BaiduShareClient(bduss, stoken), tasks, on_files,
+        interval=conf.get('baidu_watch_interval_minutes', 10) * 60,
+        full_rescan_every=conf.get('baidu_full_rescan_every', 12)
+    )
+
+
+def cmd_serve(args):
     print("Starting Feishu Integration Server...")
     print("Please ensure 'integration_config.json' is configured with your Feishu credentials.")
-    
-    # Check if config exists
-    config_file = "integration_config.json"
-    if not os.path.exists(config_file):
-        print(f"Warning: {config_file} not found. A template will be created when server starts.")
+
+    monitor = None
+    conf = load_integration_config()
+    if conf is None:
+        print(f"Warning: {CONFIG_FILE} not found. A template will be created when server starts.")
     else:
         # Start Bilibili Monitor if configured
         try:
-            with open(config_file, 'r') as f:
-                conf = json.load(f)
-                users = conf.get('bilibili_users', [])
-                interval = conf.get('bilibili_interval', 300)
-                cookies = conf.get('bilibili_cookies', {})
-                
-                if users:
-                    print(f"Starting Bilibili Monitor for {len(users)} users...")
-                    from bilibili_monitor import BilibiliMonitor
-                    from webhook_server import get_feishu_uploader # Helper we might need to expose or duplicate logic
-                    
-                    # Define callback to upload file
-                    def upload_callback(file_path):
-                        print(f"New dynamic found: {file_path}")
-                        try:
-                            # We need to instantiate uploader here or use a shared instance
-                            # For simplicity, create new instance or fetch from server config
-                            # But server config is loaded inside app context. 
-                            # Let's load from conf directly.
-                            from feishu_uploader import FeishuUploader
-                            uploader = FeishuUploader(conf.get('feishu_app_id'), conf.get('feishu_app_secret'))
-                            token = conf.get('feishu_folder_token')
-                            
-                            print(f"Uploading {file_path} to Feishu...")
-                            res = uploader.upload_file(file_path, token)
-                            print(f"Upload result: {res}")
-                            
-                            # Cleanup
-                            if res and res.get('code') == 0:
-                                # os.remove(file_path)  # Keep file for local archive as requested
-                                print("File uploaded. Local copy preserved in 'downloaded_dynamics'.")
-                            else:
-                                print("Upload failed, file kept.")
-                                
-                        except Exception as e:
-                            print(f"Error in upload callback: {e}")
-
-                    monitor = BilibiliMonitor(users, interval, upload_callback, cookies)
-                    monitor.start()
+            monitor = start_bilibili_monitor(conf)
         except Exception as e:
             print(f"Failed to start Bilibili Monitor: {e}")
-        
-    app.run(host='0.0.0.0', port=12345)
+        try:
+            shares = start_share_watcher(conf)
+            if shares:
+                shares.start()
+        except Exception as e:
+            print(f"Failed to start share watcher: {e}")
+
+    webhook_server = timed_import("webhook_server")
+    if monitor:
+        webhook_server.register_monitor(monitor)
+        watch_bilibili_users(monitor, conf)
+    app = webhook_server.app
+    if args.import_report:
+        print(import_report())
+    try:
+        app.run(host='0.0.0.0', port=12345)
+    finally:
+        if monitor:
+            monitor.stop()
+        shutdown()
+    return 0
+
+
+def cmd_monitor(args):
+    conf = load_integration_config()
+    if conf is None:
+        print(f"Error: {CONFIG_FILE} not found. Run 'apply-config' first.")
+        return 1
+    monitor = start_bilibili_monitor(conf)
+    if args.import_report:
+        print(import_report())
+    if not monitor:
+        print("No Bilibili users configured.")
+        return 1
+    watch_bilibili_users(monitor, conf)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        monitor.stop()
+    finally:
+        shutdown()
+    return 0
+
+
+def cmd_transfer(args):
+    """Download the given Baidu files and upload them to Feishu, without the web server"""
+    transfer = timed_import("transfer")
+    if args.import_report:
+        print(import_report())
+    pcs = transfer.get_baidu_pcs()
+    uploader = transfer.get_feishu_uploader()
+    if not pcs:
+        print("Error: Baidu PCS not configured")
+        return 1
+    if not uploader:
+        print("Error: Feishu uploader not configured")
+        return 1
+    results = transfer.transfer_files(args.files, pcs, uploader, transfer.load_config())
+    print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+    return 0 if all(r["status"] == "success" for r in results) else 1
+
+
+def cmd_watch_shares(args):
+    """Check the configured Baidu shares (once, or every interval) and transfer what changed"""
+    conf = load_integration_config()
+    if conf is None:
+        print(f"Error: {CONFIG_FILE} not found. Run 'apply-config' first.")
+        return 1
+    watcher = start_share_watcher(conf)
+    if args.import_report:
+        print(import_report())
+    if not watcher:
+        print("Share watching is disabled or no shares are configured.")
+        return 1
+    if args.once:
+        results = watcher.check_all()
+        print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+        return 0 if all(r["status"] == "success" for r in results) else 1
+    watcher.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+def cmd_apply_config(args):
+    timed_import("apply_config").main()
+    if args.import_report:
+        print(import_report())
+    return 0
+
+
+def cmd_archive(args):
+    """Migrate flat downloaded_dynamics files into shards and pack finished months"""
+    dynamic_archive = timed_import("dynamic_archive")
+    if args.import_report:
+        print(import_report())
+    root = os.path.join(os.getcwd(), "downloaded_dynamics")
+    moved = dynamic_archive.migrate_flat_layout(root)
+    print(f"Migrated {moved} dynamics into the sharded layout.")
+    if not args.no_compact:
+        conf = load_integration_config() or {}
+        pool = timed_import("cpu_pool").get_cpu_pool(conf)
+        grace = timedelta(days=args.grace_days)
+        archives = dynamic_archive.compact_closed_months(root, executor=pool, grace=grace)
+        for archive in archives:
+            print(f"Compacted {archive}")
+        index_path = conf.get('bilibili_index', {}).get('path', 'dynamic_index.db')
+        if archives and os.path.exists(index_path):
+            # Indexed rows still point at the .md files that were just packed
+            dynamic_index = timed_import("dynamic_index")
+            index = dynamic_index.DynamicIndex(index_path)
+            dynamic_index.backfill(index, root)
+            index.close()
+    return 0
+
+
+def cmd_backfill_index(args):
+    """Add every archived dynamic (including compacted months) to the search index"""
+    dynamic_index = timed_import("dynamic_index")
+    if args.import_report:
+        print(import_report())
+    conf = load_integration_config() or {}
+    index = dynamic_index.DynamicIndex(conf.get('bilibili_index', {}).get('path', 'dynamic_index.db'))
+    count = dynamic_index.backfill(index, os.path.join(os.getcwd(), "downloaded_dynamics"))
+    print(f"Read {count} archived dynamics; the index now holds {index.count()}.")
+    index.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Baidu / Bilibili -> Feishu integration")
+    parser.add_argument("--import-report", action="store_true",
+                        help="Print how long each subsystem took to import")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("serve", help="Run the webhook server and the Bilibili monitor (default)")
+    subparsers.add_parser("monitor", help="Run only the Bilibili monitor")
+    transfer_parser = subparsers.add_parser("transfer", help="Transfer Baidu files to Feishu once and exit")
+    transfer_parser.add_argument("files", nargs="+", help="Remote Baidu paths, e.g. /apps/video.mp4")
+    shares_parser = subparsers.add_parser("watch-shares", help="Watch the Baidu share links in config.yaml")
+    shares_parser.add_argument("--once", action="store_true", help="Check every share once and exit")
+    subparsers.add_parser("apply-config", help="Apply config.yaml to the service configs")
+    archive_parser = subparsers.add_parser(
+        "archive", help="Shard downloaded_dynamics and pack finished months into indexed zips"
+    )
+    archive_parser.add_argument("--no-compact", action="store_true", help="Only migrate the flat layout")
+    archive_parser.add_argument("--grace-days", type=float, default=2,
+                                help="Only pack months that ended at least this many days ago")
+    subparsers.add_parser("backfill-index", help="Add the existing archive to the dynamics search index")
+    return parser
+
+
+COMMANDS = {
+    "serve": cmd_serve,
+    "monitor": cmd_monitor,
+    "transfer": cmd_transfer,
+    "watch-shares": cmd_watch_shares,
+    "apply-config": cmd_apply_config,
+    "archive": cmd_archive,
+    "backfill-index": cmd_backfill_index,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return COMMANDS[args.command or "serve"](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import time
+import logging
+import posixpath
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from transfer import BaiduPCSError
+
+logger = logging.getLogger("ShareWatcher")
+
+# Share page embeds the ids needed by the list/transfer APIs
+SHAREID_RE = re.compile(r'"shareid"\s*:\s*"?(\d+)')
+SHARE_UK_RE = re.compile(r'"(?:share_uk|uk)"\s*:\s*"?(\d+)')
+
+# errno of /api/create when the directory already exists
+ERRNO_EXISTS = -8
+
+
+def parse_surl(link):
+    """Short id of a share link: .../s/1AbC... -> "1AbC...", ...init?surl=AbC... -> "1AbC..." """
+    parsed = urlparse(link)
+    if parsed.path.startswith("/s/"):
+        return parsed.path[len("/s/"):].strip("/")
+    surl = parse_qs(parsed.query).get("surl", [""])[0]
+    if not surl:
+        raise ValueError(f"Not a Baidu share link: {link}")
+    return "1" + surl
+
+
+class BaiduShareClient:
+    """Minimal client for the pan.baidu.com share APIs: open, list and save a share"""
+    API = "https://pan.baidu.com"
+
+    def __init__(self, bduss, stoken=None):
+        self.session = requests.Session()
+        self.session.cookies.update({"BDUSS": bduss})
+        if stoken:
+            self.session.cookies.update({"STOKEN": stoken})
+        self.session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                          "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+            "Referer": "https://pan.baidu.com/"
+        })
+        self._bdstoken = None
+
+    @staticmethod
+    def _check(r):
+        r.raise_for_status()
+        data = r.json()
+        errno = data.get("errno", 0)
+        if errno != 0:
+            raise BaiduPCSError(errno, data.get("show_msg") or data.get("errmsg", ""))
+        return data
+
+    def open_share(self, link, pwd=""):
+        """Verify the extraction code and return {"surl", "shareid", "uk"} for the share"""
+        surl = parse_surl(link)
+        if pwd:
+            r = self.session.post(
+                f"{self.API}/share/verify",
+                params={"surl": surl[1:], "t": int(time.time() * 1000), "channel": "chunlei", "web": 1, "clienttype": 0},
+                data={"pwd": pwd, "vcode": "", "vcode_str": ""}
+            )
+            # randsk unlocks the share for this session
+            self.session.cookies.set("BDCLND", self._check(r)["randsk"], domain=".baidu.com")
+        r = self.session.get(f"https://pan.baidu.com/s/{surl}")
+        r.raise_for_status()
+        shareid, uk = SHAREID_RE.search(r.text), SHARE_UK_RE.search(r.text)
+        if not (shareid and uk):
+            raise BaiduPCSError(-1, f"Share {link} is unavailable or expired")
+        return {"surl": surl, "shareid": shareid.group(1), "uk": uk.group(1)}
+
+    def list_dir(self, share, remote_dir=None, page_size=1000):
+        """Entries of one directory of the share (its root when remote_dir is None)"""
+        items = []
+        page = 1
+        while True:
+            params = {
+                "uk": share["uk"], "shareid": share["shareid"], "page": page, "num": page_size,
+                "order": "name", "desc": 0, "showempty": 0, "web": 1, "clienttype": 0
+            }
+            if remote_dir is None:
+                params["root"] = 1
+            else:
+                params["dir"] = remote_dir
+            batch = self._check(self.session.get(f"{self.API}/share/list", params=params)).get("list", [])
+            items.extend(batch)
+            if len(batch) < page_size:
+                return items
+            page += 1
+
+    def bdstoken(self):
+        if self._bdstoken is None:
+            r = self.session.get(f"{self.API}/api/gettemplatevariable", params={"fields": '["bdstoken"]'})
+            self._bdstoken = self._check(r)["result"]["bdstoken"]
+        return self._bdstoken
+
+    def create_dir(self, path):
+        """Create a directory in the account's own netdisk; existing directories are fine"""
+        r = self.session.post(
+            f"{self.API}/api/create",
+            params={"a": "commit", "bdstoken": self.bdstoken()},
+            data={"path": path, "isdir": 1, "block_list": "[]", "rtype": 0}
+        )
+        try:
+            self._check(r)
+        except BaiduPCSError as e:
+            if e.error_code != ERRNO_EXISTS:
+                raise
+
+    def save(self, share, fs_ids, dest_dir, poll_interval=2, timeout=600):
+        """Save share entries into dest_dir, overwriting older copies; waits for async save tasks"""
+        r = self.session.post(
+            f"{self.API}/share/transfer",
+            params={
+                "shareid": share["shareid"], "from": share["uk"], "ondup": "overwrite", "async": 1,
+                "bdstoken": self.bdstoken(), "channel": "chunlei", "web": 1, "clienttype": 0
+            },
+            data={"fsidlist": json.dumps(fs_ids), "path": dest_dir},
+            headers={"Referer": f"https://pan.baidu.com/s/{share['surl']}"}
+        )
+        task_id = self._check(r).get("task_id")
+        if not task_id:
+            return
+        # Large saves run as a server-side task
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            status = self._check(self.session.get(f"{self.API}/share/taskquery", params={"taskid": task_id}))
+            if status.get("status") == "success":
+                return
+            if status.get("status") == "failed":
+                raise BaiduPCSError(status.get("task_errno", -1), f"Save task {task_id} failed")
+        raise TimeoutError(f"Save task {task_id} did not finish within {timeout}s")
+
+
+def _entry(item):
+    return {
+        "fs_id": item["fs_id"],
+        "path": item["path"],
+        "isdir": bool(int(item.get("isdir", 0))),
+        "size": int(item.get("size", 0)),
+        "mtime": item.get("server_mtime"),
+        "md5": item.get("md5", "")
+    }
+
+
+def _changed(prev, entry):
+    return prev is None or prev["isdir"] or any(prev[k] != entry[k] for k in ("size", "mtime", "md5"))
+
+
+def diff_share(list_dir, old=None, full=False):
+    """
+    List a share against its previous snapshot.
+    A snapshot maps each directory's path relative to the share root ("" for
+    the root) to {name: entry}. The root is always listed; a subdirectory is
+    only listed again when its own entry (mtime) changed or it was not seen
+    before, otherwise its subtree is copied from the old snapshot. Changes
+    that do not touch a folder's mtime are caught by a full rescan.
+    :param list_dir: Called with the remote directory path (None for the root), returns API items
+    :return: (new snapshot, [(relative dir, entry) for every new or modified file], directories listed)
+    """
+    old = old or {}
+    snapshot = {}
+    changed = []
+    listed = 0
+
+    def walk(rel, remote_dir):
+        nonlocal listed
+        listed += 1
+        entries = {item["server_filename"]: _entry(item) for item in list_dir(remote_dir)}
+        snapshot[rel] = entries
+        previous = old.get(rel, {})
+        for name, entry in entries.items():
+            prev = previous.get(name)
+            child = posixpath.join(rel, name) if rel else name
+            if not entry["isdir"]:
+                if _changed(prev, entry):
+                    changed.append((rel, entry))
+            elif full or prev is None or not prev["isdir"] or prev["mtime"] != entry["mtime"] or child not in old:
+                walk(child, entry["path"])
+            else:
+                for key, value in old.items():
+                    if key == child or key.startswith(child + "/"):
+                        snapshot[key] = value
+
+    walk("", None)
+    return snapshot, changed, listed
+
+
+def invalidate(snapshot, rel, name):
+    """Forget a file so the next diff reports it again, re-listing every directory above it"""
+    snapshot.get(rel, {}).pop(name, None)
+    while rel:
+        parent, base = posixpath.split(rel)
+        if base in snapshot.get(parent, {}):
+            snapshot[parent][base]["mtime"] = None
+        rel = parent
+
+
+class ShareWatcher:
+    """
+    Polls Baidu share links in-process and feeds new or modified files into
+    the transfer pipeline: changed entries are saved into the account's
+    netdisk under the task's save_to (keeping the share's layout) and then
+    passed to on_files. Snapshots are kept in a JSON file, and a file only
+    enters the snapshot once it was transferred, so failures are retried.
+    """
+    def __init__(self, client, tasks, on_files, interval=600,
+                 snapshot_path="share_snapshots.json", full_rescan_every=12):
+        """
+        :param client: BaiduShareClient of the account that saves the shares
+        :param tasks: [{"link", "pwd", "save_to", "sync_existing"}], as in config.yaml baidu.tasks
+        :param on_files: Called with saved netdisk paths, returns transfer_files-style results
+        :param interval: Seconds between checks
+        :param snapshot_path: JSON file holding each share's last listing
+        :param full_rescan_every: Every Nth check lists the whole share (0 = only the first)
+        """
+        self.client = client
+        self.tasks = tasks
+        self.on_files = on_files
+        self.interval = interval
+        self.snapshot_path = snapshot_path
+        self.full_rescan_every = full_rescan_every
+        self._snapshots = self._load()
+        self._shares = {}
+        self._checks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._snapshots, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _list(self, task, remote_dir):
+        link = task["link"]
+        if link not in self._shares:
+            self._shares[link] = self.client.open_share(link, task.get("pwd", ""))
+        try:
+            return self.client.list_dir(self._shares[link], remote_dir)
+        except BaiduPCSError:
+            # The verification cookie may have expired: open the share once more
+            self._shares[link] = self.client.open_share(link, task.get("pwd", ""))
+            return self.client.list_dir(self._shares[link], remote_dir)
+
+    def check_task(self, task):
+        """Diff one share and transfer what changed; returns the transfer results"""
+        link = task["link"]
+        old = self._snapshots.get(link)
+        self._checks[link] += 1
+        full = old is None or (self.full_rescan_every and self._checks[link] % self.full_rescan_every == 0)
+        snapshot, changed, listed = diff_share(lambda d: self._list(task, d), old, full)
+        logger.info(f"Share {link}: listed {listed} directories, {len(changed)} new or modified files")
+
+        if old is None and not task.get("sync_existing", False):
+            # First sight: only record what is already shared
+            self._snapshots[link] = snapshot
+            self._save()
+            return []
+
+        results = []
+        if changed:
+            saved = {}  # netdisk path -> (rel, name)
+            by_dir = defaultdict(list)
+            for rel, entry in changed:
+                by_dir[rel].append(entry)
+            for rel, entries in by_dir.items():
+                dest = posixpath.join(task.get("save_to", "/"), rel) if rel else task.get("save_to", "/")
+                names = [posixpath.basename(e["path"]) for e in entries]
+                try:
+                    if rel:
+                        self.client.create_dir(dest)
+                    self.client.save(self._shares[link], [e["fs_id"] for e in entries], dest)
+                except Exception as e:
+                    logger.error(f"Failed to save {len(entries)} files of {link} to {dest}: {e}")
+                    for name in names:
+                        invalidate(snapshot, rel, name)
+                    continue
+                for name in names:
+                    saved[posixpath.join(dest, name)] = (rel, name)
+
+            if saved:
+                results = self.on_files(list(saved))
+                for result in results:
+                    if result["status"] != "success" and result["file"] in saved:
+                        invalidate(snapshot, *saved[result["file"]])
+
+        self._snapshots[link] = snapshot
+        self._save()
+        return results
+
+    def check_all(self):
+        results = []
+        for task in self.tasks:
+            try:
+                results += self.check_task(task)
+            except Exception as e:
+                logger.error(f"Failed to check share {task.get('link')}: {e}")
+        return results
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.interval)
@@ -0,0 +1,60 @@
+import unittest
+import os
+import sys
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bandwidth import BandwidthLimiter, ThrottledReader, parse_schedule, MB
+
+class TestBandwidthLimiter(unittest.TestCase):
+    def test_schedule_overrides_default_rate(self):
+        schedule = parse_schedule([
+            {"from": "09:00", "to": "19:00", "download_mb": 2, "upload_mb": 1},
+            {"from": "22:30", "to": "06:00", "upload_mb": 0},
+        ], "upload_mb")
+        limiter = BandwidthLimiter(rate=5 * MB, schedule=schedule)
+
+        self.assertEqual(limiter.current_rate(datetime(2024, 1, 1, 12, 0)), 1 * MB)
+        self.assertEqual(limiter.current_rate(datetime(2024, 1, 1, 20, 0)), 5 * MB)
+        # Window wrapping past midnight; 0 lifts the limit at night
+        self.assertEqual(limiter.current_rate(datetime(2024, 1, 1, 23, 0)), 0)
+        self.assertEqual(limiter.current_rate(datetime(2024, 1, 2, 5, 59)), 0)
+
+    @patch('bandwidth.time.sleep')
+    @patch('bandwidth.time.monotonic', return_value=100.0)
+    def test_concurrent_consumers_share_one_budget(self, mock_monotonic, mock_sleep):
+        limiter = BandwidthLimiter(rate=1 * MB, burst_seconds=1.0)
+
+        # First MB rides on the burst allowance
+        limiter.consume(1 * MB)
+        mock_sleep.assert_not_called()
+        # Two more callers at the same instant queue behind it: 1s and 2s
+        limiter.consume(1 * MB)
+        limiter.consume(1 * MB)
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [1.0, 2.0])
+
+    @patch('bandwidth.time.sleep')
+    def test_unlimited_never_sleeps(self, mock_sleep):
+        limiter = BandwidthLimiter(rate=0)
+        limiter.consume(100 * MB)
+        mock_sleep.assert_not_called()
+
+    def test_reader_charges_limiter_per_chunk(self):
+        body = os.urandom(200 * 1024)
+        limiter = MagicMock()
+        reader = ThrottledReader(body, limiter, chunk_size=64 * 1024)
+        self.assertEqual(len(reader), len(body))
+        # The client asks for more than a chunk; the limiter is never charged more than 64 KB at once
+        sent = b"".join(iter(lambda: reader.read(1 * MB), b""))
+        self.assertEqual(sent, body)
+        self.assertEqual([c.args[0] for c in limiter.consume.call_args_list],
+                         [64 * 1024, 64 * 1024, 64 * 1024, 8 * 1024])
+        # A retry rewinds and sends the whole body again
+        reader.seek(0)
+        self.assertEqual(reader.read(16), body[:16])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,9 +43,9 @@ class TestBilibiliMonitorWithAuth(unittest.TestCase):
         self.assertEqual(monitor.credential.bili_jct, 'fake_jct')
         print("✓ Credential object created correctly")
         
-        # Check if User is initialized with credential
-        mock_user_instance = MockUser.return_value
-        monitor._get_user(123456)
+        # Check if User is initialized with the pooled credential
+        MockUser.return_value.get_dynamics = AsyncMock(return_value={"cards": []})
+        asyncio.run(monitor._get_dynamics(123456))
         MockUser.assert_called_with(123456, credential=monitor.credential)
         print("✓ User object initialized with credential")
 
@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import asyncio
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bilibili_credentials import CredentialPool, PooledCredential, CredentialUnavailable
+
+class RiskControlError(Exception):
+    code = -412
+
+class TestCredentialPool(unittest.TestCase):
+    def test_from_cookies_builds_accounts_and_guest(self):
+        pool = CredentialPool.from_cookies(
+            [{'sessdata': 'a', 'name': 'main'}, {'sessdata': ''}, {'sessdata': 'b'}],
+            include_guest=True
+        )
+        self.assertEqual([e.name for e in pool.entries], ['main', 'account3', 'guest'])
+        self.assertEqual(pool.primary.sessdata, 'a')
+
+        # No usable cookies at all: guest mode only
+        guest_only = CredentialPool.from_cookies([None])
+        self.assertIsNone(guest_only.primary)
+
+    def test_requests_spread_and_throttled_credential_rotated_out(self):
+        first = PooledCredential("first", "cred1", requests_per_minute=600)
+        second = PooledCredential("second", "cred2", requests_per_minute=600)
+        pool = CredentialPool([first, second], strategy="round_robin", cooldown=600)
+
+        async def scenario():
+            used = []
+            for _ in range(4):
+                async with pool.use() as credential:
+                    used.append(credential)
+            self.assertEqual(used, ["cred1", "cred2", "cred1", "cred2"])
+
+            with self.assertRaises(RiskControlError):
+                async with pool.use() as credential:
+                    raise RiskControlError()
+
+            used = []
+            for _ in range(3):
+                async with pool.use() as credential:
+                    used.append(credential)
+            return used
+
+        # The throttled identity sits out its cooldown
+        self.assertEqual(asyncio.run(scenario()), ["cred2", "cred2", "cred2"])
+        self.assertEqual(first.strikes, 1)
+
+    def test_required_credential_without_wait_fails_fast(self):
+        first = PooledCredential("first", "cred1", requests_per_minute=600)
+        second = PooledCredential("second", "cred2", requests_per_minute=600)
+        pool = CredentialPool([first, second], cooldown=600)
+        pool.report_throttled(first)
+
+        async def scenario():
+            with self.assertRaises(CredentialUnavailable):
+                async with pool.use(require="cred1", wait=False):
+                    pass
+            async with pool.use(wait=False) as credential:
+                return credential
+
+        self.assertEqual(asyncio.run(asyncio.wait_for(scenario(), timeout=1)), "cred2")
+        self.assertEqual(first.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import shutil
 import shutil
 import asyncio
 import json
+import concurrent.futures
 from unittest.mock import MagicMock, patch, AsyncMock
 
 # Ensure paths
@@ -13,7 +14,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
-from bilibili_monitor import BilibiliMonitor
+from bilibili_monitor import BilibiliMonitor, image_variant_url
 
 class TestBilibiliMonitor(unittest.TestCase):
     def setUp(self):
@@ -106,5 +107,174 @@ class TestBilibiliMonitor(unittest.TestCase):
         self.assertTrue(len(files) > 0)
         print(f"✓ Image file downloaded: {files[0]}")
 
+    @patch('bilibili_monitor.user.User')
+    def test_async_callback_runs_as_task(self, MockUser):
+        card = {
+            'desc': {
+                'dynamic_id': 3000,
+                'type': 4,
+                'timestamp': 1700000000,
+                'user_profile': {'info': {'uname': 'TestUser'}}
+            },
+            'card': '{"item": {"content": "Hello"}}'
+        }
+        uploaded = []
+
+        async def async_callback(file_path):
+            await asyncio.sleep(0)
+            uploaded.append(file_path)
+
+        monitor = BilibiliMonitor([123456], 1, async_callback)
+
+        async def scenario():
+            await monitor._process_dynamic(card, 123456)
+            # Scheduled, not awaited inline
+            self.assertEqual(len(monitor._pending_callbacks), 1)
+            await asyncio.gather(*monitor._pending_callbacks)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(uploaded), 1)
+        self.assertIn("TestUser_3000.md", uploaded[0])
+        os.remove(uploaded[0])
+
+    @patch('bilibili_monitor.requests.get')
+    def test_video_is_archived_and_handed_to_video_callback(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=404)
+        card = {
+            'desc': {
+                'dynamic_id': 3100,
+                'type': 8,
+                'bvid': 'BV1xx',
+                'timestamp': 1700000000,
+                'user_profile': {'info': {'uname': 'TestUser'}}
+            },
+            'card': '{"aid": 11, "cid": 22, "title": "T", "pic": "http://p.jpg"}'
+        }
+        videos = []
+
+        async def video_callback(path):
+            videos.append(path)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+
+            def submit(video, out_path):
+                # Finishes later, on another thread in the real archiver
+                future = concurrent.futures.Future()
+                loop.call_later(0.01, future.set_result, out_path)
+                return future
+
+            archiver.submit.side_effect = submit
+            await monitor._process_dynamic(card, 123456)
+            # Not awaited inline: polling continues while the video downloads
+            self.assertEqual(videos, [])
+            self.assertEqual(len(monitor._pending_callbacks), 1)
+            while monitor._pending_callbacks:
+                await asyncio.gather(*monitor._pending_callbacks)
+
+        archiver = MagicMock()
+        monitor = BilibiliMonitor([123456], 1, MagicMock(), video_archiver=archiver, video_callback=video_callback)
+        asyncio.run(scenario())
+
+        video, out_path = archiver.submit.call_args[0]
+        self.assertEqual(video, {"aid": 11, "bvid": "BV1xx", "cid": 22})
+        self.assertEqual(os.path.basename(os.path.dirname(out_path)), "videos")
+        self.assertEqual(videos, [out_path])
+        self.assertTrue(os.path.basename(out_path).endswith("TestUser_3100.mp4"))
+        os.remove(out_path[:-len(".mp4")].replace(os.sep + "videos" + os.sep, os.sep) + ".md")
+
+    @patch('bilibili_monitor.user.User')
+    def test_feed_mode_replaces_per_uid_requests(self, MockUser):
+        def make_card(uid, dyn_id):
+            return {
+                'desc': {
+                    'uid': uid,
+                    'dynamic_id': dyn_id,
+                    'type': 4,
+                    'timestamp': 1700000000,
+                    'user_profile': {'info': {'uname': f'User{uid}'}}
+                },
+                'card': '{"item": {"content": "Hi"}}'
+            }
+
+        mock_user_instance = MockUser.return_value
+        # Only the unfollowed UID 3 is still checked individually
+        mock_user_instance.get_dynamics = AsyncMock(return_value={'cards': []})
+
+        monitor = BilibiliMonitor([1, 2, 3], 1, MagicMock(), {'sessdata': 'fake'}, feed_mode=True)
+        monitor.last_dynamic_ids = {1: 100, 2: 200, 3: 300}
+        monitor._followed = {1, 2, 99}
+        monitor._followed_at = float("inf")
+        monitor._get_feed_page = AsyncMock(return_value={
+            'cards': [make_card(2, 250), make_card(99, 240), make_card(1, 120), make_card(2, 90)],
+            'has_more': 0
+        })
+        monitor._process_dynamic = AsyncMock()
+
+        asyncio.run(monitor._check_updates())
+
+        monitor._get_feed_page.assert_called_once()
+        self.assertEqual(mock_user_instance.get_dynamics.call_count, 1)
+        MockUser.assert_called_with(3, credential=monitor.credential)
+        processed = [(c.args[1], c.args[0].dynamic_id) for c in monitor._process_dynamic.call_args_list]
+        self.assertEqual(sorted(processed), [(1, 120), (2, 250)])
+        self.assertEqual(monitor.last_dynamic_ids, {1: 120, 2: 250, 3: 300})
+
+    @patch('bilibili_monitor.network.Api')
+    @patch('bilibili_monitor.user.User')
+    def test_feed_mode_falls_back_while_primary_cools_down(self, MockUser, MockApi):
+        MockUser.return_value.get_dynamics = AsyncMock(return_value={'cards': []})
+        monitor = BilibiliMonitor([1, 2], 1, MagicMock(), [{'sessdata': 'main'}, {'sessdata': 'spare'}],
+                                  feed_mode=True)
+        monitor.last_dynamic_ids = {1: 100, 2: 200}
+        monitor._self_mid = 42
+        monitor._followed = {1, 2}
+        monitor._followed_at = float("inf")
+        primary, spare = monitor.credential_pool.entries
+        monitor.credential_pool.report_throttled(primary)
+
+        # Returns at once instead of sleeping out the 600 s cooldown
+        asyncio.run(asyncio.wait_for(monitor._check_updates(), timeout=2))
+
+        MockApi.assert_not_called()
+        self.assertEqual(MockUser.return_value.get_dynamics.call_count, 2)
+        MockUser.assert_called_with(2, credential=spare.credential)
+
+    @patch('bilibili_monitor.user.User')
+    def test_add_and_remove_uids_at_runtime(self, MockUser):
+        mock_user_instance = MockUser.return_value
+        mock_user_instance.get_dynamics = AsyncMock(return_value={
+            'cards': [{'desc': {'dynamic_id': 500}}]
+        })
+        monitor = BilibiliMonitor([1, 2], 1, MagicMock())
+        monitor.last_dynamic_ids = {1: 100, 2: 200}
+
+        self.assertEqual(monitor.add_uids([2, 3]), [3])
+        self.assertEqual(monitor.remove_uids([1, 42]), [1])
+        # Not checked until its baseline exists
+        self.assertEqual(monitor._watched_uids(), [2])
+
+        asyncio.run(monitor._baseline_pending())
+
+        # Only the new UID was fetched for a baseline; existing state is kept
+        MockUser.assert_called_once_with(3, credential=monitor.credential)
+        self.assertEqual(monitor.last_dynamic_ids, {2: 200, 3: 500})
+        self.assertEqual(monitor._watched_uids(), [2, 3])
+
+    def test_image_variant_url(self):
+        url = "https://i0.hdslb.com/bfs/album/abc.png"
+        self.assertEqual(
+            image_variant_url(url, {"mode": "resized", "max_width": 1280, "quality": 80, "format": "webp"}),
+            ("https://i0.hdslb.com/bfs/album/abc.png@1280w_80q.webp", ".webp")
+        )
+        self.assertEqual(
+            image_variant_url(url, {"mode": "resized", "max_width": 1280, "format": ""}),
+            ("https://i0.hdslb.com/bfs/album/abc.png@1280w", ".png")
+        )
+        # Originals on request, animated GIFs and foreign hosts untouched
+        self.assertEqual(image_variant_url(url, {"mode": "original"}), (url, ".png"))
+        self.assertEqual(image_variant_url("https://i0.hdslb.com/a.gif")[0], "https://i0.hdslb.com/a.gif")
+        self.assertEqual(image_variant_url("http://example.com/pic.jpg"), ("http://example.com/pic.jpg", ".jpg"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_watcher import ConfigWatcher
+
+class TestConfigWatcher(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "integration_config.json")
+        self.write({"bilibili_users": [1, 2]})
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, config, mtime=None):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(config if isinstance(config, str) else json.dumps(config))
+        if mtime:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_change_is_reported_with_previous_config(self):
+        on_change = MagicMock()
+        watcher = ConfigWatcher(self.path, on_change)
+        self.assertFalse(watcher.check())
+
+        self.write({"bilibili_users": [2, 3]}, mtime=2000000000)
+        self.assertTrue(watcher.check())
+        on_change.assert_called_once_with({"bilibili_users": [1, 2]}, {"bilibili_users": [2, 3]})
+
+        # Unchanged mtime: nothing to do
+        self.assertFalse(watcher.check())
+
+    def test_invalid_json_is_retried(self):
+        on_change = MagicMock()
+        watcher = ConfigWatcher(self.path, on_change)
+
+        self.write("{not json", mtime=2000000000)
+        self.assertFalse(watcher.check())
+        self.write({"bilibili_users": [5]}, mtime=2000000000)
+        self.assertTrue(watcher.check())
+        on_change.assert_called_once_with({"bilibili_users": [1, 2]}, {"bilibili_users": [5]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import os
+import sys
+import hashlib
+import tempfile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cpu_pool
+from cpu_pool import get_cpu_pool, run_cpu, file_md5
+
+class TestCPUPool(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_helpers_inline(self):
+        self.assertIsNone(get_cpu_pool({"cpu_workers": 0}))
+        self.assertEqual(run_cpu(None, file_md5, self.path), hashlib.md5(self.data).hexdigest())
+
+    def test_pool_returns_small_results(self):
+        pool = get_cpu_pool({"cpu_workers": 1})
+        try:
+            self.assertIs(get_cpu_pool({"cpu_workers": 1}), pool)
+            self.assertEqual(run_cpu(pool, file_md5, self.path), hashlib.md5(self.data).hexdigest())
+        finally:
+            pool.shutdown()
+            cpu_pool._pool = None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digest import DigestBuffer, digest_key
+
+class TestDigestBuffer(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.digest_dir = os.path.join(self.root, "digests")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_dynamic(self, name, body):
+        path = os.path.join(self.root, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        return path
+
+    def test_flush_on_max_items_per_uid(self):
+        flushed = MagicMock()
+        buffer = DigestBuffer(flushed, self.digest_dir, group_by="uid", window=3600, max_items=2)
+        buffer.add(self.write_dynamic("[2023-11-15_06-13] Alice_1.md", "first ![img](images/a.jpg)"))
+        buffer.add(self.write_dynamic("[2023-11-15_06-14] Bob_2.md", "other"))
+        buffer.add(self.write_dynamic("[2023-11-15_06-15] Alice_3.md", "second"))
+
+        buffer.flush()
+        # Only Alice's group is full; Bob waits for the window
+        flushed.assert_called_once()
+        digest_path = flushed.call_args.args[0]
+        with open(digest_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn("first", content)
+        self.assertIn("second", content)
+        self.assertNotIn("other", content)
+        # Image links still resolve from the digests folder
+        self.assertIn("![img](../images/a.jpg)", content)
+
+        buffer.flush(force=True)
+        self.assertEqual(flushed.call_count, 2)
+
+    def test_digest_key(self):
+        self.assertEqual(digest_key("/x/[2023-11-15_06-13] Test_User_2000.md"), "Test_User")
+        self.assertEqual(digest_key("/x/[2023-11-15_06-13] TestUser_2000.md", group_by="global"), "all")
+        # Inside a <month>/<uid> shard the UID is the key, whatever the author is called
+        self.assertEqual(digest_key("/d/2023-11/123/[2023-11-15_06-13] Renamed_2001.md"), "123")
+        self.assertEqual(digest_key("/d/2023-11/456/[2023-11-15_06-13] TestUser_2002.md"), "456")
+
+    def test_buffer_survives_restart(self):
+        flushed = MagicMock()
+        shard = os.path.join(self.root, "2023-11", "123")
+        os.makedirs(shard)
+        old_name = os.path.join(shard, "[2023-11-15_06-13] OldName_1.md")
+        new_name = os.path.join(shard, "[2023-11-15_06-14] NewName_2.md")
+        for path in (old_name, new_name):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(os.path.basename(path))
+
+        buffer = DigestBuffer(flushed, self.digest_dir, window=3600)
+        buffer.add(old_name)
+        buffer.add(new_name)
+        # Process dies without stop(): a new buffer picks the items up from the journal
+        restarted = DigestBuffer(flushed, self.digest_dir, window=3600)
+        restarted.start()
+        restarted.stop()
+
+        flushed.assert_called_once()
+        with open(flushed.call_args.args[0], 'r', encoding='utf-8') as f:
+            content = f.read()
+        # One group for the UID, titled with the latest name
+        self.assertIn("# 动态汇总: NewName (UID 123)", content)
+        self.assertIn("OldName_1.md", content)
+
+        # Handed over: nothing is replayed on the next start
+        again = DigestBuffer(flushed, self.digest_dir, window=3600)
+        again.start()
+        again.stop()
+        flushed.assert_called_once()
+
+    def test_failed_flush_stays_buffered(self):
+        flushed = MagicMock(side_effect=[IOError("upload failed"), None])
+        buffer = DigestBuffer(flushed, self.digest_dir, window=3600)
+        buffer.add(self.write_dynamic("[2023-11-15_06-13] Alice_1.md", "first"))
+        buffer.flush(force=True)
+        buffer.flush(force=True)
+        self.assertEqual(flushed.call_count, 2)
+        self.assertEqual(DigestBuffer(flushed, self.digest_dir)._load_journal(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from disk_budget import DiskBudget, DiskSpaceError, cleanup_partials
+
+class TestDiskBudget(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    @patch.object(DiskBudget, '_free_bytes', return_value=10 * 1024)
+    def test_transfer_waits_for_budget(self, mock_free):
+        budget = DiskBudget(self.dir, budget_bytes=1000, min_free_bytes=0)
+        order = []
+
+        def second_transfer():
+            with budget.reserve(600, label="second"):
+                order.append("second")
+
+        with budget.reserve(600, label="first"):
+            worker = threading.Thread(target=second_transfer)
+            worker.start()
+            time.sleep(0.2)
+            # 600 + 600 exceeds the budget, so the second transfer is queued
+            self.assertEqual(order, [])
+            order.append("first done")
+        worker.join(timeout=5)
+
+        self.assertEqual(order, ["first done", "second"])
+        self.assertEqual(budget.reserved, 0)
+
+    @patch.object(DiskBudget, '_free_bytes', return_value=1000)
+    def test_written_bytes_are_not_counted_twice(self, mock_free):
+        budget = DiskBudget(self.dir, min_free_bytes=0)
+        admitted = threading.Event()
+
+        def second_transfer():
+            with budget.reserve(900, label="second"):
+                admitted.set()
+
+        with budget.reserve(600, label="first") as reservation:
+            reservation.track(self.dir)
+            # Fully downloaded: the 600 bytes are already missing from the free space
+            with open(os.path.join(self.dir, "movie.mp4"), 'wb') as f:
+                f.write(b"\0" * 600)
+            worker = threading.Thread(target=second_transfer)
+            worker.start()
+            self.assertTrue(admitted.wait(timeout=2))
+        worker.join(timeout=5)
+        self.assertEqual(budget.reserved, 0)
+
+    @patch.object(DiskBudget, '_free_bytes', return_value=1000)
+    def test_file_larger_than_disk_fails_fast(self, mock_free):
+        budget = DiskBudget(self.dir, min_free_bytes=100)
+        with self.assertRaises(DiskSpaceError):
+            with budget.reserve(950):
+                pass
+
+    def test_cleanup_partials(self):
+        open(os.path.join(self.dir, "movie.mp4.part"), 'wb').close()
+        open(os.path.join(self.dir, "done.mp4"), 'wb').close()
+        os.makedirs(os.path.join(self.dir, "transfer-abc123"))
+        open(os.path.join(self.dir, "transfer-abc123", "cover.jpg.part"), 'wb').close()
+        self.assertEqual(cleanup_partials(self.dir), 2)
+        self.assertEqual(os.listdir(self.dir), ["done.mp4"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynamic_archive import (
+    shard_dir, migrate_flat_layout, compact_month, compact_closed_months, load_index, read_archived
+)
+
+class TestDynamicArchive(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, rel, data):
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+        return path
+
+    def test_shard_dir(self):
+        ts = datetime(2023, 11, 15, 6, 13).timestamp()
+        self.assertEqual(shard_dir(self.root, ts, 123), os.path.join(self.root, "2023-11", "123"))
+
+    def test_migrate_flat_layout(self):
+        self.write("[2023-11-15_06-13] Alice_1.md", "![img](images/[2023-11-15_06-13] Alice_1_img_1.jpg)")
+        self.write("images/[2023-11-15_06-13] Alice_1_img_1.jpg", b"jpg")
+        self.write("notes.txt", "not a dynamic")
+
+        self.assertEqual(migrate_flat_layout(self.root), 1)
+
+        shard = os.path.join(self.root, "2023-11", "legacy")
+        self.assertTrue(os.path.isfile(os.path.join(shard, "[2023-11-15_06-13] Alice_1.md")))
+        self.assertTrue(os.path.isfile(os.path.join(shard, "images", "[2023-11-15_06-13] Alice_1_img_1.jpg")))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "images")))
+        self.assertTrue(os.path.isfile(os.path.join(self.root, "notes.txt")))
+        # Idempotent
+        self.assertEqual(migrate_flat_layout(self.root), 0)
+
+    def test_compact_closed_months_and_read_single_item(self):
+        self.write("2023-10/1/[2023-10-01_10-00] Alice_1.md", "hello " * 100)
+        self.write("2023-10/1/images/a.jpg", b"\xff\xd8" * 50)
+        self.write("2023-11/1/[2023-11-01_10-00] Alice_2.md", "current month")
+
+        archives = compact_closed_months(self.root, now=datetime(2023, 11, 20))
+
+        self.assertEqual(archives, [os.path.join(self.root, "2023-10.zip")])
+        self.assertFalse(os.path.exists(os.path.join(self.root, "2023-10")))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "2023-11")))
+
+        index = load_index(self.root, "2023-10")
+        self.assertEqual(read_archived(self.root, "2023-10", "1/[2023-10-01_10-00] Alice_1.md", index),
+                         ("hello " * 100).encode('utf-8'))
+        self.assertEqual(read_archived(self.root, "2023-10", "1/images/a.jpg"), b"\xff\xd8" * 50)
+        with zipfile.ZipFile(archives[0]) as zf:
+            self.assertEqual(zf.getinfo("1/images/a.jpg").compress_type, zipfile.ZIP_STORED)
+
+        # A late arrival for the compacted month is appended, not overwritten
+        self.write("2023-10/2/[2023-10-31_23-59] Bob_3.md", "late")
+        compact_closed_months(self.root, now=datetime(2023, 11, 20))
+        self.assertEqual(read_archived(self.root, "2023-10", "2/[2023-10-31_23-59] Bob_3.md"), b"late")
+        self.assertIn("1/[2023-10-01_10-00] Alice_1.md", load_index(self.root, "2023-10"))
+
+    def test_recently_closed_month_waits_for_grace_period(self):
+        self.write("2023-10/1/[2023-10-31_23-00] Alice_1.md", "late in the month")
+        self.assertEqual(compact_closed_months(self.root, now=datetime(2023, 11, 1, 6, 0)), [])
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "2023-10")))
+        self.assertEqual(len(compact_closed_months(self.root, now=datetime(2023, 11, 3, 1, 0))), 1)
+
+    def test_file_arriving_during_compaction_is_kept(self):
+        self.write("2023-10/1/[2023-10-01_10-00] Alice_1.md", "packed")
+        late = os.path.join(self.root, "2023-10", "2", "[2023-10-31_23-59] Bob_3.md")
+        real_write = zipfile.ZipFile.write
+
+        def write_then_arrive(zf, *args, **kwargs):
+            real_write(zf, *args, **kwargs)
+            # The monitor saves another dynamic of the month after the directory was walked
+            if not os.path.exists(late):
+                self.write("2023-10/2/[2023-10-31_23-59] Bob_3.md", "late")
+
+        with patch.object(zipfile.ZipFile, "write", write_then_arrive):
+            compact_month(self.root, "2023-10")
+        self.assertTrue(os.path.isfile(late))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "2023-10", "1")))
+        self.assertNotIn("2/[2023-10-31_23-59] Bob_3.md", load_index(self.root, "2023-10"))
+
+        compact_month(self.root, "2023-10")
+        self.assertEqual(read_archived(self.root, "2023-10", "2/[2023-10-31_23-59] Bob_3.md"), b"late")
+        self.assertFalse(os.path.exists(os.path.join(self.root, "2023-10")))
+
+if __name__ == '__main__':
+    unittest.main()
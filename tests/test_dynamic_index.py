@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynamic_index import DynamicIndex, backfill, parse_markdown
+from dynamic_archive import compact_month
+
+def render(uname, when, body, dynamic_id):
+    return (f"# {uname} 的新动态\n\n**时间**: {when}\n\n{body}\n\n"
+            f"**图片**:\n![img](images/x.jpg)\n\n[查看原文](https://t.bilibili.com/{dynamic_id})")
+
+class TestDynamicIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index = DynamicIndex(os.path.join(self.root, "index.db"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root)
+
+    def test_search_terms_and_filters(self):
+        self.index.add(1, 100, "Alice", 1700000000, 4, "今天发布了新视频 预告")
+        self.index.add(2, 200, "Bob", 1700000100, 2, "新视频的幕后花絮")
+        self.index.add(3, 100, "Alice", 1600000000, 4, "old post")
+
+        self.assertEqual([r["dynamic_id"] for r in self.index.search("新视频")], [2, 1])
+        self.assertEqual([r["dynamic_id"] for r in self.index.search("新视频", uid=100)], [1])
+        # Short terms fall back to LIKE
+        self.assertEqual([r["dynamic_id"] for r in self.index.search("新视频 预告")], [1])
+        self.assertEqual([r["dynamic_id"] for r in self.index.search("花絮")], [2])
+        # Author names are searchable too
+        self.assertEqual([r["dynamic_id"] for r in self.index.search("Alice", since=1650000000)], [1])
+
+        # Re-adding updates the row instead of duplicating it
+        self.index.add(2, 200, "Bob", 1700000100, 2, "edited text")
+        self.assertEqual(self.index.search("花絮"), [])
+        self.assertEqual(self.index.count(), 3)
+
+    def test_backfill_from_shards_and_archives(self):
+        when = datetime(2023, 10, 1, 10, 0).strftime('%Y-%m-%d %H:%M:%S')
+        for month, shard, dynamic_id in (("2023-10", "100", 11), ("2023-11", "legacy", 12)):
+            shard_dir = os.path.join(self.root, "archive", month, shard)
+            os.makedirs(shard_dir)
+            name = f"[{month}-01_10-00] Alice_{dynamic_id}.md"
+            with open(os.path.join(shard_dir, name), 'w', encoding='utf-8') as f:
+                f.write(render("Alice", when, f"archived post {dynamic_id}", dynamic_id))
+        compact_month(os.path.join(self.root, "archive"), "2023-10")
+
+        self.assertEqual(backfill(self.index, os.path.join(self.root, "archive")), 2)
+        rows = {r["dynamic_id"]: r for r in self.index.search("archived post")}
+        self.assertEqual(set(rows), {11, 12})
+        self.assertEqual(rows[11]["uid"], 100)
+        self.assertEqual(rows[12]["uid"], 0)
+        self.assertEqual(rows[11]["dtype"], 2)
+        self.assertEqual(rows[11]["text"], "archived post 11")
+
+    def test_backfill_repoints_live_rows_at_compacted_archive(self):
+        archive = os.path.join(self.root, "archive")
+        shard_dir = os.path.join(archive, "2023-10", "100")
+        os.makedirs(shard_dir)
+        name = "[2023-10-01_10-00] Alice_21.md"
+        md_path = os.path.join(shard_dir, name)
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write(render("Alice", "2023-10-01 10:00:00", "markdown body", 21))
+        # Added live by the monitor with the parsed card's text
+        self.index.add(21, 100, "Alice", 1696125600, 8, "live card text", md_path)
+        compact_month(archive, "2023-10")
+
+        backfill(self.index, archive)
+        row = self.index.search("live card text")[0]
+        self.assertEqual(row["path"], f"{os.path.join(archive, '2023-10.zip')}!100/{name}")
+        self.assertEqual(row["dtype"], 8)
+
+    def test_parse_markdown_ignores_other_files(self):
+        self.assertIsNone(parse_markdown("notes.md", "# hi"))
+
+if __name__ == '__main__':
+    unittest.main()
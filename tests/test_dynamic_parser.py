@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import json
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dynamic_parser
+from dynamic_parser import parse_card, register, PARSERS
+
+def make_card(dtype, card_data, **desc):
+    return {
+        'desc': dict({
+            'dynamic_id': 42,
+            'uid': 7,
+            'type': dtype,
+            'timestamp': 1700000000,
+            'user_profile': {'info': {'uname': 'TestUser'}}
+        }, **desc),
+        'card': json.dumps(card_data)
+    }
+
+class TestDynamicParser(unittest.TestCase):
+    def test_forward_parses_origin_recursively(self):
+        origin = {"item": {"description": "Original pics", "pictures": [{"img_src": "http://i0.hdslb.com/a.jpg"}]}}
+        card = make_card(1, {
+            "item": {"content": "Nice", "orig_dy_id": 41},
+            "origin": json.dumps(origin),
+            "origin_user": {"info": {"uid": 8, "uname": "OrigUser"}}
+        }, orig_type=2)
+
+        event = parse_card(card)
+        self.assertEqual(event.content, "**[转发动态]**\n\n> Original pics\n\n评论: Nice")
+        self.assertEqual(event.origin.dtype, 2)
+        self.assertEqual(event.origin.uname, "OrigUser")
+        self.assertEqual(event.origin.image_urls, ("http://i0.hdslb.com/a.jpg",))
+        # Forwarded images are not downloaded, same as before
+        self.assertEqual(event.image_urls, ())
+
+    def test_video_content_matches_markdown(self):
+        card = make_card(8, {"title": "T", "desc": "D", "short_link": "https://b23.tv/x", "pic": "http://p.jpg"})
+        event = parse_card(card)
+        self.assertEqual(event.content, "**[发布视频]** T\nD\n[链接](https://b23.tv/x)")
+        self.assertEqual(event.image_urls, ("http://p.jpg",))
+        self.assertIsNone(event.video)
+
+        card = make_card(8, {"aid": 170001, "cid": 279786, "title": "T"}, bvid="BV17x411w7KC")
+        self.assertEqual(parse_card(card).video, {"aid": 170001, "bvid": "BV17x411w7KC", "cid": 279786})
+
+    def test_unknown_type_and_registry(self):
+        card = make_card(64, {"title": "Article"})
+        self.assertEqual(parse_card(card).content, "**[未支持的动态类型 64]**")
+        self.assertFalse(hasattr(parse_card(card), '__dict__'))
+
+        @register(64)
+        def parse_article(event, card_data, desc):
+            event.title = card_data.get('title', '')
+            event.content = f"**[专栏]** {event.title}"
+        try:
+            self.assertEqual(parse_card(card).content, "**[专栏]** Article")
+        finally:
+            del PARSERS[64]
+
+if __name__ == '__main__':
+    unittest.main()
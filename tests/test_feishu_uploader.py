@@ -2,17 +2,22 @@ import unittest
 from unittest.mock import MagicMock, patch, mock_open
 import sys
 import os
+import json
+import zlib
+import asyncio
+import hashlib
+import tempfile
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from feishu_uploader import FeishuUploader
+from feishu_uploader import FeishuUploader, FeishuUploaderPool, AsyncFeishuUploader, UploadCache, FeishuAPIError
 
 class TestFeishuUploader(unittest.TestCase):
     def setUp(self):
         self.uploader = FeishuUploader("app_id", "app_secret")
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_tenant_access_token(self, mock_post):
         mock_post.return_value.json.return_value = {
             "code": 0,
@@ -23,7 +28,7 @@ class TestFeishuUploader(unittest.TestCase):
         self.assertEqual(token, "fake_token")
         self.assertEqual(self.uploader.token, "fake_token")
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('os.path.exists', return_value=True)
     @patch('os.path.getsize', return_value=1024)
     @patch('builtins.open', new_callable=mock_open, read_data=b'data')
@@ -40,6 +45,199 @@ class TestFeishuUploader(unittest.TestCase):
         # Verify upload called
         args, kwargs = mock_post.call_args_list[1]
         self.assertEqual(args[0], "https://open.feishu.cn/open-apis/drive/v1/files/upload_all")
+        # Adler-32 of the bytes actually sent
+        self.assertEqual(kwargs["data"]["checksum"], str(zlib.adler32(b'data')))
+
+    @patch('requests.Session.post')
+    @patch('os.path.exists', return_value=True)
+    @patch('os.path.getsize', return_value=1024)
+    @patch('builtins.open', new_callable=mock_open, read_data=b'data')
+    def test_limited_upload_streams_body(self, mock_file, mock_getsize, mock_exists, mock_post):
+        self.uploader.limiter = MagicMock()
+        mock_post.side_effect = [
+            MagicMock(json=lambda: {"code": 0, "tenant_access_token": "token"}),
+            MagicMock(json=lambda: {"code": 0, "data": {"file_token": "f123"}})
+        ]
+        self.assertEqual(self.uploader.upload_file("test.txt", "parent_token")["code"], 0)
+
+        # The multipart body is charged while requests reads it, not up front
+        self.uploader.limiter.consume.assert_not_called()
+        _, kwargs = mock_post.call_args_list[1]
+        self.assertIsNone(kwargs["files"])
+        self.assertTrue(kwargs["headers"]["Content-Type"].startswith("multipart/form-data; boundary="))
+        body = kwargs["data"].read()
+        self.uploader.limiter.consume.assert_called_once_with(len(body))
+        self.assertIn(b'name="checksum"\r\n\r\n' + str(zlib.adler32(b'data')).encode(), body)
+        self.assertIn(b'filename="test.txt"', body)
+
+    @patch('feishu_uploader.time.sleep')
+    @patch('requests.Session.post')
+    @patch('os.path.exists', return_value=True)
+    @patch('os.path.getsize', return_value=1024)
+    @patch('builtins.open', new_callable=mock_open, read_data=b'data')
+    def test_rejected_small_upload_raises(self, mock_file, mock_getsize, mock_exists, mock_post, mock_sleep):
+        self.uploader.token = "token"
+        self.uploader.token_expiry = float("inf")
+        mock_post.return_value = MagicMock(status_code=400, json=lambda: {"code": 1061002, "msg": "params error"})
+        with self.assertRaises(FeishuAPIError) as ctx:
+            self.uploader.upload_file("test.txt", "parent_token")
+        self.assertEqual(ctx.exception.code, 1061002)
+
+    @patch('requests.Session.post')
+    @patch('requests.Session.get')
+    def test_get_folder_token_uses_cache(self, mock_get, mock_post):
+        cache_path = os.path.join(tempfile.mkdtemp(), "folders.json")
+        uploader = FeishuUploader("app_id", "app_secret", folder_cache_path=cache_path)
+        uploader.token = "token"
+        uploader.token_expiry = float("inf")
+
+        # "downloads" exists under root, "anime" has to be created
+        mock_get.side_effect = [
+            MagicMock(json=lambda: {"code": 0, "data": {"files": [
+                {"name": "downloads", "token": "fld_dl", "type": "folder"},
+                {"name": "movies", "token": "fld_mv", "type": "folder"}
+            ], "has_more": False}}),
+            MagicMock(json=lambda: {"code": 0, "data": {"files": [], "has_more": False}})
+        ]
+        mock_post.return_value = MagicMock(json=lambda: {"code": 0, "data": {"token": "fld_anime"}})
+
+        self.assertEqual(uploader.get_folder_token("/downloads/anime", "root"), "fld_anime")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_post.call_count, 1)
+
+        # Repeated lookups (and sibling folders seen in the listing) hit the cache
+        self.assertEqual(uploader.get_folder_token("/downloads/anime/", "root"), "fld_anime")
+        self.assertEqual(uploader.get_folder_token("movies", "root"), "fld_mv")
+        self.assertEqual(mock_get.call_count, 2)
+
+        # The index survives a restart
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["root:downloads/anime"], "fld_anime")
+        reloaded = FeishuUploader("app_id", "app_secret", folder_cache_path=cache_path)
+        self.assertEqual(reloaded.get_folder_token("/downloads/anime", "root"), "fld_anime")
+
+    def test_stale_folder_is_resolved_again(self):
+        uploader = FeishuUploader("app_id", "app_secret")
+        uploader.folder_cache = {
+            "root:downloads": "fld_dl", "root:downloads/anime": "fld_old",
+            "root:downloads/anime/s1": "fld_old_s1", "root:movies": "fld_mv"
+        }
+        uploader._list_child_folders = MagicMock(side_effect=[{"downloads": "fld_dl"}, {}])
+        uploader._create_folder = MagicMock(return_value="fld_new")
+        uploader.upload_file = MagicMock(side_effect=[
+            {"code": 1061044, "msg": "parent node not exist"},
+            {"code": 0, "data": {"file_token": "f1"}}
+        ])
+
+        res = uploader.upload_to_folder("a.mp4", "/downloads/anime", "root", content_md5="abc")
+        self.assertEqual(res["code"], 0)
+        self.assertEqual([c.args for c in uploader.upload_file.call_args_list],
+                         [("a.mp4", "fld_old"), ("a.mp4", "fld_new")])
+        self.assertEqual(uploader.upload_file.call_args.kwargs, {"content_md5": "abc"})
+        # The path was walked again from the root; unrelated folders stay cached
+        self.assertEqual(uploader.folder_cache["root:downloads/anime"], "fld_new")
+        self.assertNotIn("root:downloads/anime/s1", uploader.folder_cache)
+        self.assertEqual(uploader.folder_cache["root:movies"], "fld_mv")
+
+        # Only one retry: a second failure is returned as is
+        uploader.upload_file.side_effect = None
+        uploader.upload_file.return_value = {"code": 1061044}
+        uploader._list_child_folders.side_effect = None
+        uploader._list_child_folders.return_value = {"downloads": "fld_dl", "anime": "fld_new"}
+        self.assertEqual(uploader.upload_to_folder("a.mp4", "/downloads/anime", "root")["code"], 1061044)
+        self.assertEqual(uploader.upload_file.call_count, 4)
+
+    @patch('feishu_uploader.time.sleep')
+    @patch('requests.Session.post')
+    def test_rate_limited_request_is_retried(self, mock_post, mock_sleep):
+        self.uploader.token = "token"
+        self.uploader.token_expiry = float("inf")
+        self.uploader.concurrency.limit = 4
+        mock_post.side_effect = [
+            MagicMock(status_code=400, json=lambda: {"code": 99991400, "msg": "request trigger frequency limit"}),
+            MagicMock(status_code=200, json=lambda: {"code": 0, "data": {"token": "fld"}})
+        ]
+
+        res = self.uploader._request("post", "https://open.feishu.cn/open-apis/drive/v1/files/create_folder", json={})
+        self.assertEqual(res["code"], 0)
+        self.assertEqual(mock_post.call_count, 2)
+        mock_sleep.assert_called_once()
+        # Throttling halved the concurrency limit before the success nudged it back up
+        self.assertLess(self.uploader.concurrency.limit, 3)
+
+    @patch('feishu_uploader.time.sleep')
+    @patch('requests.Session.post')
+    def test_non_retryable_error_returned_immediately(self, mock_post, mock_sleep):
+        self.uploader.token = "token"
+        self.uploader.token_expiry = float("inf")
+        mock_post.return_value = MagicMock(status_code=400, json=lambda: {"code": 1061002, "msg": "params error"})
+
+        res = self.uploader._request("post", "https://open.feishu.cn/open-apis/drive/v1/files/upload_all")
+        self.assertEqual(res["code"], 1061002)
+        self.assertEqual(mock_post.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_upload_cache_skips_identical_content(self):
+        root = tempfile.mkdtemp()
+        cache_path = os.path.join(root, "uploads.json")
+        file_path = os.path.join(root, "a.bin")
+        with open(file_path, 'wb') as f:
+            f.write(b"same bytes")
+        md5 = hashlib.md5(b"same bytes").hexdigest()
+
+        uploader = FeishuUploader("app_id", "app_secret", upload_cache=UploadCache(cache_path))
+        uploader._upload_small_file = MagicMock(return_value={"code": 0, "data": {"file_token": "f1"}})
+        uploader._request = MagicMock()
+        self.assertEqual(uploader.upload_file(file_path, "fld")["data"]["file_token"], "f1")
+
+        # Same content (hash passed in from the download), same folder: not sent again
+        res = uploader.upload_file(file_path, "fld", md5)
+        self.assertTrue(res["cached"])
+        self.assertEqual(res["data"]["file_token"], "f1")
+        self.assertEqual(uploader._upload_small_file.call_count, 1)
+        uploader._request.assert_not_called()
+        # Another folder is uploaded
+        uploader.upload_file(file_path, "other")
+        self.assertEqual(uploader._upload_small_file.call_count, 2)
+
+        # After a restart, an old entry is checked against Feishu first
+        reloaded = FeishuUploader("app_id", "app_secret", upload_cache=UploadCache(cache_path, revalidate_after=0))
+        reloaded._upload_small_file = MagicMock(return_value={"code": 0, "data": {"file_token": "f2"}})
+        reloaded._request = MagicMock(return_value={"code": 0, "data": {"metas": [{"doc_token": "f1"}]}})
+        self.assertTrue(reloaded.upload_file(file_path, "fld")["cached"])
+        self.assertEqual(reloaded._request.call_args[1]["json"]["request_docs"][0]["doc_token"], "f1")
+
+        # Deleted on Feishu: uploaded again and the new token is remembered
+        reloaded._request.return_value = {"code": 0, "data": {"metas": [], "failed_list": [{"token": "f1"}]}}
+        self.assertNotIn("cached", reloaded.upload_file(file_path, "fld"))
+        self.assertEqual(reloaded.upload_cache.get(md5, "fld")["file_token"], "f2")
+
+    def test_async_uploader_shares_sync_state(self):
+        self.uploader.upload_file = MagicMock(return_value={"code": 0})
+        # Without an uploader there is nothing to build one from
+        with self.assertRaises(ValueError):
+            AsyncFeishuUploader(uploader=None)
+        async_uploader = AsyncFeishuUploader(uploader=self.uploader)
+        try:
+            res = asyncio.run(async_uploader.upload_file("test.txt", "parent_token"))
+        finally:
+            async_uploader.close()
+        self.assertEqual(res["code"], 0)
+        self.uploader.upload_file.assert_called_with("test.txt", "parent_token")
+
+    def test_pool_spreads_uploads_over_apps(self):
+        busy = FeishuUploader("busy_app", "secret")
+        idle = FeishuUploader("idle_app", "secret")
+        busy.upload_file = MagicMock(return_value={"code": 0})
+        idle.upload_file = MagicMock(return_value={"code": 0, "data": {"file_token": "f1"}})
+        pool = FeishuUploaderPool([busy, idle])
+        pool.in_flight[0] = 2
+
+        res = pool.upload_file("test.txt", "parent_token")
+        self.assertEqual(res, {"code": 0, "data": {"file_token": "f1"}})
+        idle.upload_file.assert_called_with("test.txt", "parent_token")
+        busy.upload_file.assert_not_called()
+        self.assertEqual(pool.in_flight, [2, 0])
 
 if __name__ == '__main__':
     unittest.main()
@@ -88,7 +88,7 @@ class TestManualFlow(unittest.TestCase):
             pass
 
     @patch('webhook_server.get_feishu_uploader')
-    @patch('webhook_server.SimpleBaiduPCS')
+    @patch('transfer.SimpleBaiduPCS')
     def test_full_process(self, MockPCS, mock_get_uploader):
         print("\n=== Starting End-to-End Process Test ===")
         
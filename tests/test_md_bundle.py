@@ -0,0 +1,60 @@
+import unittest
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from md_bundle import bundle_markdown
+
+class TestMarkdownBundle(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "images"))
+        for name in ("a.webp", "b.txt"):
+            with open(os.path.join(self.root, "images", name), 'wb') as f:
+                f.write(b"x" * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_bundle_contains_markdown_and_images(self):
+        md_path = os.path.join(self.root, "[2023-11-15_06-13] Alice_1.md")
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write("text\n![img](images/a.webp)\n![img](images/b.txt)\n"
+                    "![img](images/missing.jpg)\n![img](https://i0.hdslb.com/x.jpg)\n")
+
+        zip_path = bundle_markdown(md_path)
+
+        self.assertEqual(os.path.dirname(zip_path), os.path.join(self.root, "bundles"))
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertEqual(
+                sorted(zf.namelist()),
+                ["[2023-11-15_06-13] Alice_1.md", "images/a.webp", "images/b.txt"]
+            )
+            # Already-compressed images are stored as-is, everything else is deflated
+            self.assertEqual(zf.getinfo("images/a.webp").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zf.getinfo("images/b.txt").compress_type, zipfile.ZIP_DEFLATED)
+            content = zf.read("[2023-11-15_06-13] Alice_1.md").decode('utf-8')
+        # Links that could not be bundled are left untouched
+        self.assertIn("![img](images/missing.jpg)", content)
+        self.assertIn("![img](https://i0.hdslb.com/x.jpg)", content)
+
+    def test_links_are_rewritten_for_nested_markdown(self):
+        # Digest files live in a subdirectory and link to ../images/
+        os.makedirs(os.path.join(self.root, "digests"))
+        md_path = os.path.join(self.root, "digests", "digest_Alice.md")
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write("![img](../images/a.webp)")
+
+        zip_path = bundle_markdown(md_path, output_dir=self.root)
+
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertIn("images/a.webp", zf.namelist())
+            self.assertEqual(zf.read("digest_Alice.md").decode('utf-8'), "![img](images/a.webp)")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import os
+import sys
+import time
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiler
+
+def busy_worker(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=busy_worker, args=(self.stop,), name="busy-thread")
+        self.thread.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join()
+
+    def test_sample_stacks_collapsed_format(self):
+        collapsed = profiler.sample_stacks(duration=0.2, interval=0.01)
+        lines = [l for l in collapsed.splitlines() if l.startswith("busy-thread;")]
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertIn("busy_worker (test_profiler.py:", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_dump_stacks(self):
+        self.assertIn("--- busy-thread", profiler.dump_stacks())
+        self.assertIn("busy_worker", profiler.dump_stacks())
+
+    def test_one_session_at_a_time(self):
+        with profiler._session_lock:
+            self.assertIsNone(profiler.run_session(0.1))
+        self.assertIsNotNone(profiler.run_session(0.1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import sys
+import json
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_integration
+from lazy_import import LazyModule
+
+class TestCommandLine(unittest.TestCase):
+    def test_default_command_is_serve(self):
+        args = run_integration.build_parser().parse_args([])
+        self.assertIsNone(args.command)
+        with patch.dict(run_integration.COMMANDS, {"serve": MagicMock(return_value=0)}):
+            self.assertEqual(run_integration.main([]), 0)
+            run_integration.COMMANDS["serve"].assert_called_once()
+
+    @patch('transfer.transfer_files')
+    @patch('transfer.load_config', return_value={})
+    @patch('transfer.get_feishu_uploader')
+    @patch('transfer.get_baidu_pcs')
+    def test_transfer_command(self, mock_pcs, mock_uploader, mock_config, mock_transfer):
+        mock_transfer.return_value = [{"file": "/a.mp4", "status": "success"}]
+        with patch('builtins.print') as mock_print:
+            code = run_integration.main(["transfer", "/a.mp4"])
+
+        self.assertEqual(code, 0)
+        mock_transfer.assert_called_once_with(["/a.mp4"], mock_pcs.return_value, mock_uploader.return_value, {})
+        printed = json.loads(mock_print.call_args.args[0])
+        self.assertEqual(printed["results"][0]["status"], "success")
+
+        mock_transfer.return_value = [{"file": "/a.mp4", "status": "error", "message": "boom"}]
+        with patch('builtins.print'):
+            self.assertEqual(run_integration.main(["transfer", "/a.mp4"]), 1)
+
+    @patch('bilibili_monitor.BilibiliMonitor')
+    @patch('transfer.get_transfer_scheduler')
+    @patch('transfer.get_baidu_pcs')
+    @patch('transfer.get_feishu_uploader', return_value=None)
+    def test_monitor_without_feishu_skips_uploads(self, mock_uploader, mock_pcs, mock_scheduler, MockMonitor):
+        with patch('builtins.print'):
+            monitor = run_integration.start_bilibili_monitor({"bilibili_users": [1]})
+        self.assertIs(monitor, MockMonitor.return_value)
+        args, kwargs = MockMonitor.call_args
+        self.assertIsNone(args[2])
+        self.assertIsNone(kwargs["video_callback"])
+        monitor.start.assert_called_once()
+
+class TestLazyModule(unittest.TestCase):
+    def test_import_deferred_until_attribute_access(self):
+        sys.modules.pop("colorsys", None)
+        lazy = LazyModule("colorsys")
+        self.assertNotIn("colorsys", sys.modules)
+        self.assertEqual(lazy.rgb_to_hsv(0, 0, 0), (0.0, 0.0, 0.0))
+        self.assertIn("colorsys", sys.modules)
+
+    def test_patch_on_proxy(self):
+        lazy = LazyModule("colorsys")
+        with patch.object(lazy, "rgb_to_hsv", return_value="patched"):
+            self.assertEqual(lazy.rgb_to_hsv(1, 1, 1), "patched")
+        self.assertEqual(lazy.rgb_to_hsv(0, 0, 0), (0.0, 0.0, 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
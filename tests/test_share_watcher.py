@@ -0,0 +1,139 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest.mock import MagicMock
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from share_watcher import ShareWatcher, diff_share, invalidate, parse_surl
+from transfer import transfer_files
+
+def item(path, fs_id, isdir=False, size=0, mtime=1, md5=""):
+    return {"server_filename": os.path.basename(path), "path": path, "fs_id": fs_id,
+            "isdir": int(isdir), "size": size, "server_mtime": mtime, "md5": md5}
+
+class FakeShare:
+    """Share tree: remote dir path (None = root) -> list of API items; records listed dirs"""
+    def __init__(self):
+        self.tree = {
+            None: [item("/s/Anime", 1, isdir=True, mtime=10), item("/s/readme.txt", 2, size=5)],
+            "/s/Anime": [item("/s/Anime/S1", 3, isdir=True, mtime=20), item("/s/Anime/ep1.mp4", 4, size=100)],
+            "/s/Anime/S1": [item("/s/Anime/S1/ep2.mp4", 5, size=200)],
+        }
+        self.listed = []
+
+    def list_dir(self, remote_dir):
+        self.listed.append(remote_dir)
+        return self.tree[remote_dir]
+
+class TestShareDiff(unittest.TestCase):
+    def test_parse_surl(self):
+        self.assertEqual(parse_surl("https://pan.baidu.com/s/1AbCd?pwd=x"), "1AbCd")
+        self.assertEqual(parse_surl("https://pan.baidu.com/share/init?surl=AbCd"), "1AbCd")
+
+    def test_only_changed_subtrees_are_relisted(self):
+        share = FakeShare()
+        snapshot, changed, listed = diff_share(share.list_dir)
+        self.assertEqual(listed, 3)
+        self.assertEqual(len(changed), 3)
+
+        # Nothing changed: only the root is listed, the subtree comes from the snapshot
+        share.listed.clear()
+        again, changed, _ = diff_share(share.list_dir, snapshot)
+        self.assertEqual(share.listed, [None])
+        self.assertEqual(changed, [])
+        self.assertEqual(again, snapshot)
+
+        # A new episode bumps the Anime folder's mtime: Anime is listed, S1 is not
+        share.tree["/s/Anime"].append(item("/s/Anime/ep3.mp4", 6, size=300))
+        share.tree[None][0]["server_mtime"] = 11
+        share.listed.clear()
+        snapshot, changed, _ = diff_share(share.list_dir, snapshot)
+        self.assertEqual(share.listed, [None, "/s/Anime"])
+        self.assertEqual([(rel, e["fs_id"]) for rel, e in changed], [("Anime", 6)])
+        self.assertIn("Anime/S1", snapshot)
+
+        # Full rescan finds in-place edits that did not touch any folder mtime
+        share.tree["/s/Anime/S1"][0]["md5"] = "new"
+        _, changed, listed = diff_share(share.list_dir, snapshot, full=True)
+        self.assertEqual(listed, 3)
+        self.assertEqual([(rel, e["fs_id"]) for rel, e in changed], [("Anime/S1", 5)])
+
+    def test_invalidate_relists_parents(self):
+        share = FakeShare()
+        snapshot, _, _ = diff_share(share.list_dir)
+        invalidate(snapshot, "Anime/S1", "ep2.mp4")
+        share.listed.clear()
+        _, changed, _ = diff_share(share.list_dir, snapshot)
+        self.assertEqual(share.listed, [None, "/s/Anime", "/s/Anime/S1"])
+        self.assertEqual([e["fs_id"] for _, e in changed], [5])
+
+class TestShareWatcher(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.share = FakeShare()
+        self.client = MagicMock()
+        self.client.open_share.return_value = {"surl": "1x", "shareid": "1", "uk": "2"}
+        self.client.list_dir.side_effect = lambda share, remote_dir: self.share.list_dir(remote_dir)
+        self.on_files = MagicMock(side_effect=lambda paths: [{"file": p, "status": "success"} for p in paths])
+        self.task = {"link": "https://pan.baidu.com/s/1x", "pwd": "1234", "save_to": "/downloads"}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def watcher(self, task=None):
+        return ShareWatcher(self.client, [task or self.task], self.on_files,
+                            snapshot_path=os.path.join(self.root, "snapshots.json"))
+
+    def test_first_check_is_baseline_then_changes_are_transferred(self):
+        watcher = self.watcher()
+        self.assertEqual(watcher.check_all(), [])
+        self.on_files.assert_not_called()
+
+        self.share.tree["/s/Anime/S1"].append(item("/s/Anime/S1/ep3.mp4", 6, size=300))
+        self.share.tree[None][0]["server_mtime"] = 11
+        self.share.tree["/s/Anime"][0]["server_mtime"] = 21
+        # A restarted watcher continues from the saved snapshot
+        results = self.watcher().check_all()
+        self.client.create_dir.assert_called_once_with("/downloads/Anime/S1")
+        self.client.save.assert_called_once_with(self.client.open_share.return_value, [6], "/downloads/Anime/S1")
+        self.on_files.assert_called_once_with(["/downloads/Anime/S1/ep3.mp4"])
+        self.assertEqual(results[0]["status"], "success")
+
+    def test_failed_transfer_is_retried(self):
+        watcher = self.watcher(dict(self.task, sync_existing=True))
+        self.on_files.side_effect = lambda paths: [
+            {"file": p, "status": "error" if p.endswith("ep2.mp4") else "success"} for p in paths
+        ]
+        watcher.check_all()
+        self.assertEqual(len(self.on_files.call_args[0][0]), 3)
+
+        self.on_files.side_effect = lambda paths: [{"file": p, "status": "success"} for p in paths]
+        watcher.check_all()
+        self.on_files.assert_called_with(["/downloads/Anime/S1/ep2.mp4"])
+        watcher.check_all()
+        self.assertEqual(self.on_files.call_count, 2)
+
+    def test_rejected_upload_is_retried(self):
+        pcs = MagicMock(max_parallel=1)
+        pcs.get_meta.return_value = {"size": 4}
+        uploader = MagicMock()
+        # The upload's retries ran out on a rate limit: Feishu's error comes back, no exception
+        uploader.upload_file.return_value = {"code": 99991400, "msg": "request trigger frequency limit"}
+        config = {"download_dir": os.path.join(self.root, "downloads")}
+        self.on_files.side_effect = lambda paths: transfer_files(paths, pcs, uploader, config)
+
+        watcher = self.watcher(dict(self.task, sync_existing=True))
+        results = watcher.check_all()
+        self.assertEqual({r["status"] for r in results}, {"error"})
+        self.assertNotIn("ep2.mp4", watcher._snapshots[self.task["link"]]["Anime/S1"])
+
+        uploader.upload_file.return_value = {"code": 0, "data": {"file_token": "f1"}}
+        self.assertEqual(len(watcher.check_all()), 3)
+        self.assertEqual({r["status"] for r in watcher.check_all()}, set())
+
+if __name__ == '__main__':
+    unittest.main()
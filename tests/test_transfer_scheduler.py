@@ -0,0 +1,80 @@
+import unittest
+import os
+import sys
+import time
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transfer_scheduler import TransferScheduler, PRIORITY_DYNAMIC, PRIORITY_SMALL, PRIORITY_LARGE
+
+MB = 1024 * 1024
+
+class TestTransferScheduler(unittest.TestCase):
+    def run_queued(self, scheduler, jobs):
+        """Queue jobs behind a blocker, release it and return the order they ran in"""
+        order = []
+        release = threading.Event()
+        blocker = scheduler.submit(release.wait, 5, priority=PRIORITY_DYNAMIC)
+        time.sleep(0.05)
+        futures = [scheduler.submit(order.append, name, **kwargs) for name, kwargs in jobs]
+        release.set()
+        blocker.result(5)
+        for future in futures:
+            future.result(5)
+        return order
+
+    def test_priority_classes_then_shortest_job_first(self):
+        scheduler = TransferScheduler(workers=1, small_threshold=10 * MB, reserved_workers=0)
+        order = self.run_queued(scheduler, [
+            ("big", {"size": 500 * MB}),
+            ("small-5", {"size": 5 * MB}),
+            ("dynamic", {"priority": PRIORITY_DYNAMIC}),
+            ("small-1", {"size": 1 * MB}),
+            ("bigger", {"size": 900 * MB}),
+        ])
+        self.assertEqual(order, ["dynamic", "small-1", "small-5", "big", "bigger"])
+        scheduler.shutdown()
+
+    def test_aging_promotes_waiting_large_jobs(self):
+        scheduler = TransferScheduler(workers=1, small_threshold=10 * MB, aging=60, reserved_workers=0)
+        release = threading.Event()
+        order = []
+        blocker = scheduler.submit(release.wait, 5)
+        time.sleep(0.05)
+        large = scheduler.submit(order.append, "large", size=100 * MB)
+        small = scheduler.submit(order.append, "small", size=1 * MB)
+        # Pretend the large job has waited two aging periods
+        with scheduler._cond:
+            for job in scheduler._queue:
+                if job.size == 100 * MB:
+                    job.enqueued -= 121
+        release.set()
+        for future in (blocker, large, small):
+            future.result(5)
+        self.assertEqual(order, ["large", "small"])
+        scheduler.shutdown()
+
+    def test_reserved_worker_is_kept_free_of_large_jobs(self):
+        scheduler = TransferScheduler(workers=2, small_threshold=10 * MB, reserved_workers=1)
+        release = threading.Event()
+        first_large = scheduler.submit(release.wait, 5, size=100 * MB)
+        second_large = scheduler.submit(release.wait, 5, size=100 * MB)
+        time.sleep(0.1)
+        # Only one large job may run; the small one uses the reserved worker
+        small = scheduler.submit(lambda: "done", size=1 * MB)
+        self.assertEqual(small.result(2), "done")
+        self.assertFalse(second_large.running() or second_large.done())
+        release.set()
+        self.assertTrue(first_large.result(5))
+        self.assertTrue(second_large.result(5))
+        scheduler.shutdown()
+
+    def test_classify(self):
+        scheduler = TransferScheduler(small_threshold=10 * MB)
+        self.assertEqual(scheduler.classify(10 * MB), PRIORITY_SMALL)
+        self.assertEqual(scheduler.classify(10 * MB + 1), PRIORITY_LARGE)
+
+if __name__ == '__main__':
+    unittest.main()
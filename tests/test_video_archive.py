@@ -0,0 +1,101 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_archive import VideoArchiver, pick_streams, stream_urls
+
+DASH = {
+    "video": [
+        {"id": 116, "codecid": 7, "bandwidth": 6000, "baseUrl": "http://cdn/v116.m4s"},
+        {"id": 80, "codecid": 12, "bandwidth": 2000, "baseUrl": "http://cdn/v80-hevc.m4s"},
+        {"id": 80, "codecid": 7, "bandwidth": 3000, "baseUrl": "http://cdn/v80.m4s", "backupUrl": ["http://mirror/v80.m4s"]},
+        {"id": 64, "codecid": 7, "bandwidth": 1000, "baseUrl": "http://cdn/v64.m4s"},
+    ],
+    "audio": [
+        {"id": 30216, "bandwidth": 64, "baseUrl": "http://cdn/a64.m4s"},
+        {"id": 30280, "bandwidth": 192, "baseUrl": "http://cdn/a192.m4s"},
+    ]
+}
+
+class FakeCDN:
+    """Serves byte ranges of in-memory files; the primary host fails its first request"""
+    def __init__(self, files):
+        self.files = files
+        self.failed_once = False
+        self.ranges = []
+
+    def get(self, url, headers=None, **kwargs):
+        data = self.files[url.split("/")[-1]]
+        start, end = (int(x) for x in headers["Range"][len("bytes="):].split("-"))
+        r = MagicMock(status_code=206, headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+        r.__enter__.return_value = r
+        if url.startswith("http://cdn/") and start > 0 and not self.failed_once:
+            self.failed_once = True
+            r.content = b""
+        else:
+            r.content = data[start:end + 1]
+            self.ranges.append((url, start, end))
+        return r
+
+class TestVideoArchive(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_pick_streams(self):
+        video, audio = pick_streams(DASH, max_quality=80, codec="avc")
+        self.assertEqual(video["baseUrl"], "http://cdn/v80.m4s")
+        self.assertEqual(audio["id"], 30280)
+        self.assertEqual(stream_urls(video), ["http://cdn/v80.m4s", "http://mirror/v80.m4s"])
+
+        video, _ = pick_streams(DASH, max_quality=80, codec="hevc")
+        self.assertEqual(video["codecid"], 12)
+        # Nothing at or below the cap: take the lowest quality there is
+        video, audio = pick_streams({"video": DASH["video"][:3]}, max_quality=32)
+        self.assertEqual(video["id"], 80)
+        self.assertIsNone(audio)
+        # AAC is preferred over a higher bitrate FLAC track, which is only a fallback
+        flac = {"id": 30251, "bandwidth": 900, "baseUrl": "http://cdn/flac.m4s"}
+        _, audio = pick_streams(dict(DASH, flac={"audio": flac}))
+        self.assertEqual(audio["id"], 30280)
+        _, audio = pick_streams({"video": DASH["video"], "flac": {"audio": flac}})
+        self.assertEqual(audio["id"], 30251)
+
+    @patch('video_archive.shutil.which', return_value="/usr/bin/ffmpeg")
+    def test_segmented_download_and_mux(self, _):
+        video_data, audio_data = os.urandom(2500), os.urandom(700)
+        archiver = VideoArchiver(max_connections=3, segment_mb=1000 / (1024 * 1024))
+        archiver.session = FakeCDN({"v80.m4s": video_data, "a192.m4s": audio_data})
+        archiver.get_dash = MagicMock(return_value=DASH)
+        muxed = {}
+
+        def fake_run(cmd, **kwargs):
+            with open(cmd[cmd.index("-i") + 1], 'rb') as f:
+                muxed["video"] = f.read()
+            with open(cmd[cmd.index("-i", cmd.index("-i") + 1) + 1], 'rb') as f:
+                muxed["audio"] = f.read()
+            self.assertEqual(cmd[-3:-1], ["-c", "copy"])
+            open(cmd[-1], 'wb').close()
+            return MagicMock(returncode=0)
+
+        out_path = os.path.join(self.root, "videos", "v.mp4")
+        with patch('video_archive.subprocess.run', side_effect=fake_run):
+            self.assertEqual(archiver.submit({"aid": 1, "cid": 2}, out_path).result(), out_path)
+        archiver.close()
+
+        self.assertEqual(muxed, {"video": video_data, "audio": audio_data})
+        # 1000-byte segments; the failed one was fetched again from the mirror
+        self.assertEqual(sorted(s for u, s, e in archiver.session.ranges if "v80" in u and e > 0), [0, 1000, 2000])
+        self.assertTrue(any(u.startswith("http://mirror/") for u, _, _ in archiver.session.ranges))
+        self.assertEqual(os.listdir(os.path.dirname(out_path)), ["v.mp4"])
+
+if __name__ == '__main__':
+    unittest.main()
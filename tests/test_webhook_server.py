@@ -3,11 +3,16 @@ from unittest.mock import MagicMock, patch
 import sys
 import os
 import json
+import hashlib
+import tempfile
+import requests
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from webhook_server import app, SimpleBaiduPCS
+import threading
+import time
+from webhook_server import app, SimpleBaiduPCS, BaiduPCSPool, BaiduPCSError, ChecksumMismatchError, TransferCoalescer
 
 class TestWebhookServer(unittest.TestCase):
     def setUp(self):
@@ -16,16 +21,16 @@ class TestWebhookServer(unittest.TestCase):
     @patch('webhook_server.get_baidu_pcs')
     @patch('webhook_server.get_feishu_uploader')
     @patch('webhook_server.load_config')
-    @patch('builtins.open')
-    @patch('os.makedirs')
-    @patch('os.remove')
     @patch('requests.get')
-    def test_baidu_event(self, mock_get, mock_remove, mock_makedirs, mock_open, mock_load, mock_get_uploader, mock_get_pcs):
-        mock_load.return_value = {"feishu_folder_token": "ft123", "download_dir": "tmp"}
+    def test_baidu_event(self, mock_get, mock_load, mock_get_uploader, mock_get_pcs):
+        download_dir = tempfile.mkdtemp()
+        mock_load.return_value = {"feishu_folder_token": "ft123", "download_dir": download_dir}
         mock_uploader = MagicMock()
         mock_get_uploader.return_value = mock_uploader
         
         mock_pcs = MagicMock()
+        mock_pcs.get_meta.return_value = {"size": 1024, "md5": "d41d8cd98f00b204e9800998ecf8427e"}
+        mock_pcs.max_parallel = 1
         mock_get_pcs.return_value = mock_pcs
         
         # FIX: Set return value for upload_file to a dict so jsonify works
@@ -38,8 +43,99 @@ class TestWebhookServer(unittest.TestCase):
         self.assertEqual(len(res_json['results']), 1)
         self.assertEqual(res_json['results'][0]['status'], 'success')
         
-        mock_pcs.download_file.assert_called_with("/test/video.mp4", os.path.join("tmp", "video.mp4"))
+        remote_path, local_path = mock_pcs.download_file.call_args[0]
+        self.assertEqual(remote_path, "/test/video.mp4")
+        self.assertEqual(mock_pcs.download_file.call_args[1], {"expected_md5": "d41d8cd98f00b204e9800998ecf8427e"})
+        # Downloaded into a per-transfer directory below download_dir, under its own name
+        self.assertEqual(os.path.basename(local_path), "video.mp4")
+        self.assertEqual(os.path.dirname(os.path.dirname(local_path)), download_dir)
         mock_uploader.upload_file.assert_called()
+        # The transfer directory is removed with the file
+        self.assertEqual(os.listdir(download_dir), [])
+
+    @patch('webhook_server.get_baidu_pcs')
+    @patch('webhook_server.get_feishu_uploader')
+    @patch('webhook_server.load_config')
+    def test_same_basename_transfers_do_not_collide(self, mock_load, mock_get_uploader, mock_get_pcs):
+        download_dir = tempfile.mkdtemp()
+        mock_load.return_value = {"feishu_folder_token": "ft123", "download_dir": download_dir}
+        mock_pcs = MagicMock()
+        mock_pcs.get_meta.return_value = {"size": 4}
+        mock_pcs.max_parallel = 2
+        mock_get_pcs.return_value = mock_pcs
+        both_downloaded = threading.Barrier(2, timeout=5)
+
+        def download(remote_path, local_path, expected_md5=None):
+            with open(local_path, 'w') as f:
+                f.write(remote_path)
+            # Both files are on disk at the same time
+            both_downloaded.wait()
+
+        uploaded = {}
+
+        def upload(local_path, folder, content_md5=None):
+            with open(local_path) as f:
+                uploaded[f.read()] = os.path.basename(local_path)
+            return {"code": 0}
+
+        mock_pcs.download_file.side_effect = download
+        mock_get_uploader.return_value.upload_file.side_effect = upload
+
+        resp = self.client.post('/baidu_event', json={"files": ["/a/cover.jpg", "/b/cover.jpg"]})
+        self.assertEqual([r['status'] for r in resp.json['results']], ['success', 'success'])
+        self.assertEqual(uploaded, {"/a/cover.jpg": "cover.jpg", "/b/cover.jpg": "cover.jpg"})
+        self.assertEqual(os.listdir(download_dir), [])
+
+    @patch('webhook_server.get_dynamic_index')
+    @patch('webhook_server.load_config', return_value={"admin_token": "secret"})
+    def test_search(self, mock_load, mock_get_index):
+        token = {"X-Admin-Token": "secret"}
+        mock_get_index.return_value = None
+        self.assertEqual(self.client.get('/search?q=test', headers=token).status_code, 404)
+
+        index = MagicMock()
+        index.search.return_value = [{"dynamic_id": 1, "text": "test post"}]
+        mock_get_index.return_value = index
+        resp = self.client.get('/search?q=test&uid=100&limit=500', headers=token)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["results"][0]["dynamic_id"], 1)
+        index.search.assert_called_once_with("test", uid=100, since=None, until=None, limit=200)
+
+    @patch('webhook_server.get_dynamic_index')
+    @patch('webhook_server.load_config')
+    def test_search_requires_token_unless_public(self, mock_load, mock_get_index):
+        mock_get_index.return_value.search.return_value = []
+        mock_load.return_value = {"admin_token": "secret", "bilibili_index": {"enabled": True}}
+        self.assertEqual(self.client.get('/search?q=test').status_code, 401)
+        self.assertEqual(self.client.get('/search?q=test', headers={"X-Admin-Token": "wrong"}).status_code, 401)
+        mock_get_index.return_value.search.assert_not_called()
+
+        mock_load.return_value = {"bilibili_index": {"enabled": True, "public_search": True}}
+        self.assertEqual(self.client.get('/search?q=test').status_code, 200)
+
+    @patch('webhook_server.load_config')
+    def test_admin_uids_requires_token(self, mock_load):
+        monitor = MagicMock()
+        monitor.uids = [1, 2]
+        monitor.add_uids.return_value = [3]
+        monitor.remove_uids.return_value = [1]
+
+        with patch('webhook_server._monitor', monitor):
+            mock_load.return_value = {}
+            resp = self.client.get('/admin/bilibili/uids', headers={"X-Admin-Token": ""})
+            self.assertEqual(resp.status_code, 403)
+
+            mock_load.return_value = {"admin_token": "secret"}
+            resp = self.client.post('/admin/bilibili/uids', json={"add": [3]}, headers={"X-Admin-Token": "wrong"})
+            self.assertEqual(resp.status_code, 401)
+            monitor.add_uids.assert_not_called()
+
+            resp = self.client.post('/admin/bilibili/uids', json={"add": ["3"], "remove": [1]},
+                                    headers={"X-Admin-Token": "secret"})
+            self.assertEqual(resp.status_code, 200)
+            monitor.add_uids.assert_called_once_with([3])
+            monitor.remove_uids.assert_called_once_with([1])
+            self.assertEqual(resp.json["added"], [3])
 
     @patch('webhook_server.get_feishu_uploader')
     @patch('webhook_server.load_config')
@@ -61,5 +157,139 @@ class TestWebhookServer(unittest.TestCase):
         self.assertEqual(resp.json['status'], 'success')
         mock_uploader.upload_file.assert_called_with("C:\\records\\video.flv", "ft123")
 
+    def test_download_resumes_and_verifies_md5(self):
+        payload = b"0123456789" * 1000
+        local_path = os.path.join(tempfile.mkdtemp(), "video.mp4")
+
+        def broken_stream():
+            yield payload[:4000]
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+        first = MagicMock(status_code=200, headers={"Content-Length": str(len(payload))})
+        first.iter_content.return_value = broken_stream()
+        second = MagicMock(status_code=206, headers={"Content-Length": str(len(payload) - 4000)})
+        second.iter_content.return_value = [payload[4000:]]
+        for resp in (first, second):
+            resp.__enter__.return_value = resp
+
+        pcs = SimpleBaiduPCS("bduss")
+        expected = hashlib.md5(payload).hexdigest()
+        with patch.object(pcs.session, 'get', side_effect=[first, second]) as mock_get:
+            digest = pcs.download_file("/test/video.mp4", local_path, expected_md5=expected)
+
+        self.assertEqual(digest, expected)
+        # Only the missing tail was requested again
+        self.assertEqual(mock_get.call_args_list[1].kwargs["headers"], {"Range": "bytes=4000-"})
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), payload)
+
+    def test_download_md5_mismatch_removes_file(self):
+        local_path = os.path.join(tempfile.mkdtemp(), "video.mp4")
+        resp = MagicMock(status_code=200, headers={"Content-Length": "4"})
+        resp.iter_content.return_value = [b"data"]
+        resp.__enter__.return_value = resp
+
+        pcs = SimpleBaiduPCS("bduss")
+        with patch.object(pcs.session, 'get', return_value=resp):
+            with self.assertRaises(ChecksumMismatchError):
+                pcs.download_file("/test/video.mp4", local_path, expected_md5="0" * 32)
+        self.assertFalse(os.path.exists(local_path))
+
+    def test_failed_md5_lookup_keeps_download(self):
+        local_path = os.path.join(tempfile.mkdtemp(), "video.mp4")
+        resp = MagicMock(status_code=200, headers={"Content-Length": "4"})
+        resp.iter_content.return_value = [b"data"]
+        resp.__enter__.return_value = resp
+
+        pcs = SimpleBaiduPCS("bduss")
+        # No expected md5 and no Content-MD5 header: the meta lookup after the download fails
+        with patch.object(pcs.session, 'get', return_value=resp), \
+                patch.object(pcs, 'get_meta', side_effect=BaiduPCSError(31066, "file does not exist")):
+            digest = pcs.download_file("/test/video.mp4", local_path)
+        self.assertEqual(digest, hashlib.md5(b"data").hexdigest())
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b"data")
+
+    def test_pcs_pool_routes_to_owner_and_drops_dead_accounts(self):
+        expired = MagicMock()
+        expired.get_meta.side_effect = BaiduPCSError(-6, "auth failed")
+        elsewhere = MagicMock()
+        elsewhere.get_meta.return_value = None
+        owner = MagicMock()
+        owner.get_meta.return_value = {"size": 4, "md5": "abc"}
+        owner.download_file.return_value = "abc"
+
+        pool = BaiduPCSPool({"expired": expired, "elsewhere": elsewhere, "owner": owner})
+        self.assertEqual(pool.get_meta("/a.mp4")["size"], 4)
+        self.assertEqual(pool.download_file("/a.mp4", "a.mp4", expected_md5="abc"), "abc")
+
+        owner.download_file.assert_called_with("/a.mp4", "a.mp4", expected_md5="abc")
+        elsewhere.download_file.assert_not_called()
+        self.assertEqual(pool.disabled, {"expired"})
+        self.assertEqual(pool.max_parallel, 2)
+
+    def test_pcs_pool_fails_over_on_limit(self):
+        limited = MagicMock()
+        limited.download_file.side_effect = BaiduPCSError(31326, "anti hotlinking")
+        backup = MagicMock()
+        backup.download_file.return_value = "md5"
+
+        pool = BaiduPCSPool({"limited": limited, "backup": backup})
+        self.assertEqual(pool.download_file("/a.mp4", "a.mp4"), "md5")
+        self.assertIn("limited", pool.cooldown_until)
+
+class TestTransferCoalescer(unittest.TestCase):
+    def test_burst_is_merged_and_deduplicated(self):
+        batches = []
+        def run_batch(files):
+            batches.append(sorted(files))
+            return [{"file": f, "status": "success"} for f in files]
+
+        coalescer = TransferCoalescer(run_batch, window=0.2)
+        results = {}
+        def post(name, files):
+            results[name] = coalescer.submit(files)
+
+        threads = [
+            threading.Thread(target=post, args=("a", ["/x.mp4", "/y.mp4"])),
+            threading.Thread(target=post, args=("b", ["/y.mp4", "/z.mp4", "/z.mp4"])),
+        ]
+        for t in threads:
+            t.start()
+            time.sleep(0.02)
+        for t in threads:
+            t.join()
+
+        self.assertEqual(batches, [["/x.mp4", "/y.mp4", "/z.mp4"]])
+        self.assertEqual([r["file"] for r in results["a"]], ["/x.mp4", "/y.mp4"])
+        self.assertEqual([r["file"] for r in results["b"]], ["/y.mp4", "/z.mp4", "/z.mp4"])
+
+    def test_in_flight_path_is_not_transferred_twice(self):
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+        def run_batch(files):
+            batches.append(sorted(files))
+            started.set()
+            release.wait(5)
+            return [{"file": f, "status": "success"} for f in files]
+
+        coalescer = TransferCoalescer(run_batch, window=0)
+        first = threading.Thread(target=coalescer.submit, args=(["/x.mp4"],))
+        first.start()
+        started.wait(5)
+
+        # /x.mp4 is downloading: the second event only schedules /y.mp4
+        second_results = []
+        second = threading.Thread(target=lambda: second_results.extend(coalescer.submit(["/x.mp4", "/y.mp4"])))
+        second.start()
+        time.sleep(0.1)
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(batches, [["/x.mp4"], ["/y.mp4"]])
+        self.assertEqual([r["status"] for r in second_results], ["success", "success"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,514 @@
+import os
+import json
+import logging
+import requests
+import hashlib
+import posixpath
+import shutil
+import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from feishu_uploader import FeishuUploader, FeishuUploaderPool, UploadCache
+from disk_budget import DiskBudget, PARTIAL_SUFFIX, TRANSFER_DIR_PREFIX, cleanup_partials
+from transfer_scheduler import TransferScheduler
+from bandwidth import BandwidthLimiter, parse_schedule, MB
+
+# Baidu Netdisk -> Feishu transfer pipeline. Kept free of Flask so cron jobs
+# and the CLI can run transfers without loading the web server.
+logger = logging.getLogger("IntegrationServer")
+
+CONFIG_FILE = "integration_config.json"
+BAIDU_CONFIG = "baidu-autosave/config/config.json"
+
+class ChecksumMismatchError(Exception):
+    pass
+
+class BaiduPCSError(Exception):
+    def __init__(self, error_code, message):
+        super().__init__(f"Baidu PCS error {error_code}: {message}")
+        self.error_code = error_code
+
+# PCS error codes that mean the account's cookies are no longer valid
+BAIDU_AUTH_ERROR_CODES = {-6, 110, 111, 31045}
+# PCS error codes for temporary per-account limits (frequency, anti-hotlinking)
+BAIDU_LIMIT_ERROR_CODES = {31034, 31326}
+
+class SimpleBaiduPCS:
+    def __init__(self, bduss, stoken=None, verify_md5=True, limiter=None):
+        self.session = requests.Session()
+        self.session.cookies.update({"BDUSS": bduss})
+        if stoken:
+            self.session.cookies.update({"STOKEN": stoken})
+        self.session.headers.update({
+            "User-Agent": "netdisk;7.0.3.2;PC;PC-Windows;10.0.19041;WindowsBaiduYunGuanJia"
+        })
+        self.verify_md5 = verify_md5
+        self.limiter = limiter  # Shared download BandwidthLimiter, optional
+
+    @staticmethod
+    def _raise_for_error(r):
+        if r.status_code >= 400:
+            # PCS reports the reason as JSON {"error_code": ..., "error_msg": ...}
+            try:
+                err = r.json()
+            except ValueError:
+                err = {}
+            if "error_code" in err:
+                raise BaiduPCSError(err["error_code"], err.get("error_msg", ""))
+        r.raise_for_status()
+
+    def get_meta(self, remote_path):
+        """Return Baidu's metadata (size, md5, mtime...) for a remote file, or None"""
+        api_url = "http://pcs.baidu.com/rest/2.0/pcs/file"
+        params = {
+            "method": "meta",
+            "path": remote_path,
+            "app_id": "250528"
+        }
+        r = self.session.get(api_url, params=params)
+        self._raise_for_error(r)
+        items = r.json().get("list", [])
+        return items[0] if items else None
+
+    def download_file(self, remote_path, local_path, expected_md5=None, max_resumes=3):
+        """
+        Stream a remote file to local_path, hashing it on the fly.
+        Interrupted transfers resume from the last written byte instead of
+        starting over. Returns the md5 hex digest of the downloaded file.
+        """
+        api_url = "http://pcs.baidu.com/rest/2.0/pcs/file"
+        params = {
+            "method": "download",
+            "path": remote_path,
+            "app_id": "250528"
+        }
+        
+        logger.info(f"Downloading from Baidu: {remote_path}")
+        md5 = hashlib.md5()
+        written = 0
+        total = None
+        header_md5 = None
+        # Written under a .part name until complete, so crashed runs leave recognisable leftovers
+        part_path = local_path + PARTIAL_SUFFIX
+        with open(part_path, 'wb') as f:
+            for attempt in range(max_resumes + 1):
+                headers = {"Range": f"bytes={written}-"} if written else {}
+                try:
+                    with self.session.get(api_url, params=params, headers=headers, stream=True) as r:
+                        self._raise_for_error(r)
+                        if written and r.status_code != 206:
+                            # Server ignored the range request, start over
+                            f.seek(0)
+                            f.truncate()
+                            md5 = hashlib.md5()
+                            written = 0
+                        if total is None and r.headers.get("Content-Length"):
+                            total = written + int(r.headers["Content-Length"])
+                        header_md5 = header_md5 or r.headers.get("Content-MD5")
+                        for chunk in r.iter_content(chunk_size=8192):
+                            if self.limiter:
+                                self.limiter.consume(len(chunk))
+                            f.write(chunk)
+                            md5.update(chunk)
+                            written += len(chunk)
+                    if total is None or written >= total:
+                        break
+                    logger.warning(f"Short read on {remote_path} ({written}/{total} bytes), resuming...")
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == max_resumes:
+                        raise
+                    logger.warning(f"Download of {remote_path} interrupted at {written} bytes ({e}), resuming...")
+            else:
+                raise IOError(f"Incomplete download of {remote_path}: {written}/{total} bytes")
+
+        digest = md5.hexdigest()
+        if self.verify_md5:
+            expected = expected_md5 or header_md5
+            if not expected:
+                try:
+                    expected = (self.get_meta(remote_path) or {}).get("md5")
+                except (requests.RequestException, BaiduPCSError) as e:
+                    # The download itself succeeded; only the check is skipped
+                    logger.warning(f"Could not look up the md5 of {remote_path}, skipping verification: {e}")
+            if expected and len(expected) == 32 and expected.lower() != digest:
+                os.remove(part_path)
+                raise ChecksumMismatchError(f"md5 mismatch for {remote_path}: expected {expected}, got {digest}")
+        os.replace(part_path, local_path)
+        return digest
+
+class BaiduPCSPool:
+    """
+    Spreads downloads over every configured Baidu account that holds the file.
+    Each account runs at most `per_account` downloads at once. Accounts whose
+    cookies fail auth are dropped; accounts hitting a limit cool down for a while.
+    Exposes the same get_meta/download_file interface as SimpleBaiduPCS.
+    """
+    def __init__(self, clients, per_account=1, cooldown=600):
+        """
+        :param clients: Dict of account name -> SimpleBaiduPCS, preferred account first
+        :param per_account: Concurrent downloads per account
+        :param cooldown: Seconds an account sits out after hitting a limit
+        """
+        self.clients = clients
+        self.per_account = per_account
+        self.cooldown = cooldown
+        self.in_flight = {name: 0 for name in clients}
+        self.disabled = set()
+        self.cooldown_until = {}
+        self.owners = {}  # remote path -> account names that hold it
+        self._cond = threading.Condition()
+
+    @property
+    def max_parallel(self):
+        return max(1, len(self.clients) - len(self.disabled)) * self.per_account
+
+    def _healthy(self, names=None):
+        now = time.time()
+        return [n for n in (names or self.clients)
+                if n not in self.disabled and self.cooldown_until.get(n, 0) <= now]
+
+    def _mark_failed(self, name, error):
+        with self._cond:
+            if error.error_code in BAIDU_AUTH_ERROR_CODES:
+                logger.error(f"Baidu account '{name}' failed auth, removing it from the pool: {error}")
+                self.disabled.add(name)
+            else:
+                logger.warning(f"Baidu account '{name}' hit a limit, cooling down: {error}")
+                self.cooldown_until[name] = time.time() + self.cooldown
+            self._cond.notify_all()
+
+    def get_meta(self, remote_path):
+        """Look the file up in every healthy account, remembering which ones hold it"""
+        meta = None
+        owners = []
+        for name in self._healthy():
+            try:
+                found = self.clients[name].get_meta(remote_path)
+            except BaiduPCSError as e:
+                if e.error_code in BAIDU_AUTH_ERROR_CODES or e.error_code in BAIDU_LIMIT_ERROR_CODES:
+                    self._mark_failed(name, e)
+                continue
+            if found:
+                owners.append(name)
+                meta = meta or found
+        with self._cond:
+            self.owners[remote_path] = owners
+        return meta
+
+    def _acquire(self, candidates):
+        with self._cond:
+            while True:
+                healthy = self._healthy(candidates)
+                if not healthy:
+                    return None
+                free = [n for n in healthy if self.in_flight[n] < self.per_account]
+                if free:
+                    name = min(free, key=lambda n: self.in_flight[n])
+                    self.in_flight[name] += 1
+                    return name
+                self._cond.wait(timeout=5)
+
+    def _release(self, name):
+        with self._cond:
+            self.in_flight[name] -= 1
+            self._cond.notify_all()
+
+    def download_file(self, remote_path, local_path, expected_md5=None):
+        with self._cond:
+            candidates = list(self.owners.pop(remote_path, []))
+        if not candidates:
+            # Unknown owner: try every account, preferred first
+            candidates = list(self.clients)
+        last_error = None
+        while candidates:
+            name = self._acquire(candidates)
+            if name is None:
+                break
+            try:
+                return self.clients[name].download_file(remote_path, local_path, expected_md5=expected_md5)
+            except BaiduPCSError as e:
+                last_error = e
+                candidates.remove(name)
+                if e.error_code in BAIDU_AUTH_ERROR_CODES or e.error_code in BAIDU_LIMIT_ERROR_CODES:
+                    self._mark_failed(name, e)
+            finally:
+                self._release(name)
+        raise last_error or BaiduPCSError(-1, f"No usable Baidu account holds {remote_path}")
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_bandwidth_limiter(config, direction):
+    """Shared BandwidthLimiter for "download" or "upload", updated from the current config"""
+    bandwidth = config.get("bandwidth", {})
+    rate = bandwidth.get(f"{direction}_mb", 0) * MB
+    schedule = parse_schedule(bandwidth.get("schedule"), f"{direction}_mb")
+    with _limiters_lock:
+        if direction not in _limiters:
+            _limiters[direction] = BandwidthLimiter()
+        _limiters[direction].configure(rate, schedule)
+        return _limiters[direction]
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+# Uploaders are reused across requests so their token and folder caches stay warm
+_uploaders = {}
+
+def get_feishu_uploader():
+    """FeishuUploader for the configured app, or a FeishuUploaderPool when several apps are configured"""
+    config = load_config()
+    apps = []
+    if config.get("feishu_app_id") and config.get("feishu_app_secret"):
+        apps.append((config["feishu_app_id"], config["feishu_app_secret"]))
+    for extra in config.get("feishu_apps", []):
+        app_key = (extra.get("app_id"), extra.get("app_secret"))
+        if all(app_key) and app_key not in apps:
+            apps.append(app_key)
+    if not apps:
+        logger.error("Feishu credentials not found in config")
+        return None
+    key = tuple(apps)
+    # Refresh the limits even when the uploaders are cached
+    upload_limiter = get_bandwidth_limiter(config, "upload")
+    if key not in _uploaders:
+        folder_cache = config.get("feishu_folder_cache", "feishu_folder_cache.json")
+        upload_cache = None
+        if config.get("feishu_upload_cache", "feishu_upload_cache.json"):
+            # One content-hash index for all apps of the pool
+            upload_cache = UploadCache(
+                config.get("feishu_upload_cache", "feishu_upload_cache.json"),
+                revalidate_after=config.get("feishu_upload_cache_revalidate_hours", 24) * 3600
+            )
+        # Only the first app resolves folders, so only it needs the folder index
+        uploaders = [
+            FeishuUploader(
+                app_id, app_secret,
+                folder_cache_path=folder_cache if i == 0 else None,
+                max_concurrency=config.get("feishu_max_concurrency", 4),
+                limiter=upload_limiter,
+                upload_cache=upload_cache
+            )
+            for i, (app_id, app_secret) in enumerate(apps)
+        ]
+        _uploaders[key] = uploaders[0] if len(uploaders) == 1 else FeishuUploaderPool(uploaders)
+    return _uploaders[key]
+
+_disk_budgets = {}
+_disk_budgets_lock = threading.Lock()
+
+def get_disk_budget(config):
+    download_dir = config.get("download_dir", "temp_downloads")
+    with _disk_budgets_lock:
+        if download_dir not in _disk_budgets:
+            # First use since startup: nothing can be mid-download yet
+            cleanup_partials(download_dir)
+            _disk_budgets[download_dir] = DiskBudget(
+                download_dir,
+                budget_bytes=config.get("download_budget_mb", 0) * 1024 * 1024,
+                min_free_bytes=config.get("download_min_free_mb", 512) * 1024 * 1024
+            )
+        return _disk_budgets[download_dir]
+
+_baidu_pool = None
+_baidu_pool_key = None
+_baidu_pool_lock = threading.Lock()
+
+def load_baidu_accounts():
+    """(name, bduss, stoken) for every baidu-autosave account with a BDUSS, current user first"""
+    if not os.path.exists(BAIDU_CONFIG):
+        return []
+    with open(BAIDU_CONFIG, 'r', encoding='utf-8') as f:
+        baidu_conf = json.load(f)
+    users = baidu_conf.get("baidu", {}).get("users", {})
+    current_user_id = baidu_conf.get("baidu", {}).get("current_user")
+    # Current user first, so it is preferred when several accounts hold a file
+    names = sorted(users, key=lambda n: n != current_user_id)
+
+    accounts = []
+    for name in names:
+        user = users[name]
+        bduss = user.get("bduss") or user.get("cookies", {}).get("BDUSS")
+        stoken = user.get("stoken") or user.get("cookies", {}).get("STOKEN")
+        if bduss:
+            accounts.append((name, bduss, stoken))
+    return accounts
+
+def get_baidu_pcs():
+    """Return a BaiduPCSPool over every baidu-autosave account with a BDUSS"""
+    global _baidu_pool, _baidu_pool_key
+    try:
+        accounts = load_baidu_accounts()
+        if accounts:
+            config = load_config()
+            key = (tuple(accounts), config.get("baidu_verify_md5", True))
+            # Refresh the limits even when the pool is cached
+            download_limiter = get_bandwidth_limiter(config, "download")
+            with _baidu_pool_lock:
+                # Reuse the pool so account health and load survive across events
+                if _baidu_pool is None or _baidu_pool_key != key:
+                    clients = {
+                        name: SimpleBaiduPCS(
+                            bduss=bduss, stoken=stoken, verify_md5=key[1],
+                            limiter=download_limiter
+                        )
+                        for name, bduss, stoken in accounts
+                    }
+                    _baidu_pool = BaiduPCSPool(
+                        clients,
+                        per_account=config.get("baidu_downloads_per_account", 1),
+                        cooldown=config.get("baidu_account_cooldown_minutes", 10) * 60
+                    )
+                    _baidu_pool_key = key
+                return _baidu_pool
+    except Exception as e:
+        logger.error(f"Failed to load Baidu config: {e}")
+    return None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_transfer_scheduler(config, pcs=None):
+    """Process-wide TransferScheduler shared by Baidu transfers and Bilibili uploads"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            reserved = config.get("transfer_reserved_workers", 1)
+            # Default: one worker per Baidu download slot, plus the slots kept free of large files
+            workers = config.get("transfer_workers") or getattr(pcs, "max_parallel", 1) + reserved
+            _scheduler = TransferScheduler(
+                workers=workers,
+                small_threshold=config.get("transfer_small_file_mb", 64) * 1024 * 1024,
+                aging=config.get("transfer_aging_minutes", 5) * 60,
+                reserved_workers=reserved
+            )
+        return _scheduler
+
+def transfer_files(files, pcs, uploader, config):
+    """
+    Download each remote file from Baidu and upload it to Feishu.
+    Returns one {"file", "status"[, "message"]} result per file.
+    """
+    download_dir = config.get("download_dir", "temp_downloads")
+    os.makedirs(download_dir, exist_ok=True)
+    budget = get_disk_budget(config)
+    
+    def lookup(remote_path):
+        try:
+            return pcs.get_meta(remote_path) or {}
+        except Exception as e:
+            logger.warning(f"Could not look up {remote_path}: {e}")
+            return {}
+
+    def process(remote_path, meta):
+        try:
+            filename = os.path.basename(remote_path)
+
+            # Reserve the file's size up front; waits while other transfers hold the budget
+            with budget.reserve(meta.get("size", 0), label=remote_path) as reservation:
+                # Own directory per transfer: /a/cover.jpg and /b/cover.jpg may download at the same
+                # time, and the Feishu file name stays the basename
+                work_dir = tempfile.mkdtemp(prefix=TRANSFER_DIR_PREFIX, dir=download_dir)
+                reservation.track(work_dir)
+                local_path = os.path.join(work_dir, filename)
+                try:
+                    logger.info(f"Downloading {remote_path} to {local_path}...")
+                    digest = pcs.download_file(remote_path, local_path, expected_md5=meta.get("md5"))
+                    
+                    logger.info(f"Downloaded. Uploading to Feishu...")
+                    target_folder = config.get("feishu_folder_token")
+                    # The md5 from the download keys the upload cache, no second pass over the file
+                    if config.get("feishu_mirror_dirs"):
+                        # Mirror the Baidu directory layout below the target folder
+                        upload_res = uploader.upload_to_folder(
+                            local_path, posixpath.dirname(remote_path), target_folder, content_md5=digest
+                        )
+                    else:
+                        upload_res = uploader.upload_file(local_path, target_folder, content_md5=digest)
+                    if (upload_res or {}).get("code") != 0:
+                        raise Exception(f"Upload to Feishu failed: {upload_res}")
+                    logger.info(f"Uploaded: {upload_res}")
+                finally:
+                    # Cleanup, also on failure: the reservation is released with the file
+                    shutil.rmtree(work_dir, ignore_errors=True)
+            return {"file": remote_path, "status": "success"}
+            
+        except Exception as e:
+            logger.error(f"Error processing {remote_path}: {e}")
+            return {"file": remote_path, "status": "error", "message": str(e)}
+
+    if not files:
+        return []
+    # Sizes first, so the scheduler can run small files ahead of large ones
+    with ThreadPoolExecutor(max_workers=min(len(files), 8)) as executor:
+        metas = list(executor.map(lookup, files))
+    scheduler = get_transfer_scheduler(config, pcs)
+    futures = [
+        scheduler.submit(process, remote_path, meta, size=meta.get("size", 0), label=remote_path)
+        for remote_path, meta in zip(files, metas)
+    ]
+    return [future.result() for future in futures]
+
+
+class TransferCoalescer:
+    """
+    Merges bursts of transfer requests into one batch.
+    The first request of a burst becomes the leader: it waits `window` seconds,
+    then transfers the de-duplicated union of every path submitted meanwhile.
+    Paths that are already being transferred are not started again; their
+    submitters wait for the running transfer's result instead.
+    """
+    def __init__(self, run_batch, window=2):
+        """
+        :param run_batch: Called with a list of unique paths, returns transfer_files-style results
+        :param window: Seconds the leader waits for more requests before starting the batch
+        """
+        self.run_batch = run_batch
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}  # path -> Future, waiting for the next batch
+        self._in_flight = {}  # path -> Future, in the batch currently running
+        self._leader_waiting = False
+
+    def submit(self, files):
+        """Block until every path in files is transferred; returns one result per entry"""
+        lead = False
+        with self._lock:
+            futures = []
+            for path in files:
+                future = self._in_flight.get(path) or self._pending.get(path)
+                if future is None:
+                    future = self._pending[path] = Future()
+                futures.append(future)
+            if self._pending and not self._leader_waiting:
+                self._leader_waiting = lead = True
+
+        if lead:
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._leader_waiting = False
+                self._in_flight.update(batch)
+            self._run(batch)
+        return [future.result() for future in futures]
+
+    def _run(self, batch):
+        logger.info(f"Transferring coalesced batch of {len(batch)} files")
+        try:
+            results = {result["file"]: result for result in self.run_batch(list(batch))}
+            for path, future in batch.items():
+                future.set_result(results.get(path, {"file": path, "status": "error", "message": "No result"}))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                for path in batch:
+                    self._in_flight.pop(path, None)
@@ -0,0 +1,148 @@
+import time
+import logging
+import itertools
+import threading
+from concurrent.futures import Executor, Future
+
+logger = logging.getLogger("TransferScheduler")
+
+# Priority classes, lower runs first
+PRIORITY_DYNAMIC = 0  # Bilibili markdown / digest uploads
+PRIORITY_SMALL = 1
+PRIORITY_LARGE = 2
+
+
+class _Job:
+    __slots__ = ("func", "args", "kwargs", "future", "size", "priority", "label", "enqueued", "seq")
+
+    def __init__(self, func, args, kwargs, size, priority, label, seq):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.size = size
+        self.priority = priority
+        self.label = label
+        self.enqueued = time.monotonic()
+        self.seq = seq
+
+
+class TransferScheduler:
+    """
+    Runs transfer jobs on a fixed set of workers in priority order.
+    Within a priority class the smallest job goes first (shortest-job-first).
+    Every `aging` seconds a job waits it is promoted by one class, so large
+    files still make progress under a steady stream of small ones. Large jobs
+    never occupy the last `reserved_workers` workers, which keeps small items
+    moving while bulk transfers run.
+    """
+    def __init__(self, workers=3, small_threshold=64 * 1024 * 1024, aging=300, reserved_workers=1):
+        """
+        :param workers: Jobs running at the same time
+        :param small_threshold: Files up to this many bytes count as small
+        :param aging: Seconds of waiting that promote a job by one priority class
+        :param reserved_workers: Workers kept free of large jobs
+        """
+        self.workers = max(1, workers)
+        self.small_threshold = small_threshold
+        self.aging = aging
+        self.reserved_workers = reserved_workers
+        self._queue = []
+        self._running_large = 0
+        self._threads = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._shutdown = False
+
+    def classify(self, size):
+        return PRIORITY_SMALL if size <= self.small_threshold else PRIORITY_LARGE
+
+    def submit(self, func, *args, size=0, priority=None, label="", **kwargs):
+        """Queue func(*args, **kwargs); priority defaults to the size class. Returns a Future"""
+        size = max(0, int(size or 0))
+        if priority is None:
+            priority = self.classify(size)
+        job = _Job(func, args, kwargs, size, priority, label, next(self._seq))
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("TransferScheduler is shut down")
+            self._queue.append(job)
+            self._ensure_workers()
+            self._cond.notify()
+        return job.future
+
+    def executor(self, priority):
+        """concurrent.futures.Executor view that queues everything at `priority` (e.g. for run_in_executor)"""
+        return _PriorityExecutor(self, priority)
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    @property
+    def queued(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"transfer-{len(self._threads)}")
+            self._threads.append(thread)
+            thread.start()
+
+    def _effective_priority(self, job, now):
+        return max(0, job.priority - int((now - job.enqueued) // self.aging)) if self.aging else job.priority
+
+    def _pick(self):
+        # Queues stay short (a batch of files), so a scan beats keeping a heap with changing keys
+        now = time.monotonic()
+        large_allowed = self._running_large < max(1, self.workers - self.reserved_workers)
+        candidates = [j for j in self._queue if large_allowed or j.priority != PRIORITY_LARGE]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda j: (self._effective_priority(j, now), j.size, j.seq))
+        self._queue.remove(job)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._pick()
+                while job is None:
+                    if self._shutdown and not self._queue:
+                        return
+                    # Timeout: aging can make a waiting job eligible without any notify
+                    self._cond.wait(timeout=5)
+                    job = self._pick()
+                is_large = job.priority == PRIORITY_LARGE
+                if is_large:
+                    self._running_large += 1
+            if job.future.set_running_or_notify_cancel():
+                waited = time.monotonic() - job.enqueued
+                if waited > 1:
+                    logger.info(f"Starting {job.label or 'job'} after {waited:.1f}s in queue")
+                try:
+                    job.future.set_result(job.func(*job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            if is_large:
+                with self._cond:
+                    self._running_large -= 1
+                    self._cond.notify_all()
+
+
+class _PriorityExecutor(Executor):
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self.scheduler.submit(fn, *args, priority=self.priority, **kwargs)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        # The scheduler is shared; its owner shuts it down
+        pass
@@ -0,0 +1,196 @@
+import os
+import shutil
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger("VideoArchive")
+
+PLAYURL_API = "https://api.bilibili.com/x/player/playurl"
+PAGELIST_API = "https://api.bilibili.com/x/player/pagelist"
+# fnval 16: DASH (separate audio/video streams); 2048 adds AV1 variants
+DASH_FNVAL = 16 | 2048
+
+# qn: 120 = 4K, 80 = 1080P, 64 = 720P, 32 = 480P, 16 = 360P
+DEFAULT_MAX_QUALITY = 80
+CODEC_IDS = {"avc": 7, "hevc": 12, "av1": 13}
+
+MB = 1024 * 1024
+
+
+def pick_streams(dash, max_quality=DEFAULT_MAX_QUALITY, codec="avc"):
+    """
+    (video, audio) stream entries of a playurl DASH response: the best video at
+    or below max_quality (the lowest one when all are above it), preferring the
+    codec, and the highest bitrate AAC audio. The FLAC track is only used when
+    there is no AAC one; audio is None when the video has no separate track.
+    """
+    videos = dash.get("video") or []
+    if not videos:
+        raise ValueError("No DASH video stream")
+    allowed = [v["id"] for v in videos if v["id"] <= max_quality]
+    best_id = max(allowed) if allowed else min(v["id"] for v in videos)
+    preferred = CODEC_IDS.get(codec)
+    candidates = [v for v in videos if v["id"] == best_id]
+    video = next((v for v in candidates if v.get("codecid") == preferred), None) \
+        or max(candidates, key=lambda v: v.get("bandwidth", 0))
+    # FLAC in mp4 needs a recent ffmpeg, so it is the fallback rather than the "best" track
+    flac = (dash.get("flac") or {}).get("audio")
+    audios = list(dash.get("audio") or []) or ([flac] if flac else [])
+    audio = max(audios, key=lambda a: a.get("bandwidth", 0)) if audios else None
+    return video, audio
+
+
+def stream_urls(stream):
+    """Primary URL of a DASH stream followed by its CDN mirrors"""
+    urls = [stream.get("baseUrl") or stream.get("base_url")]
+    urls += stream.get("backupUrl") or stream.get("backup_url") or []
+    return [u for u in urls if u]
+
+
+class VideoArchiver:
+    """
+    Downloads a video's DASH streams with concurrent ranged requests and muxes
+    them into an mp4 with ffmpeg (-c copy, no re-encoding).
+    All downloads share one segment pool, so `max_connections` caps the
+    connections to the CDN no matter how many videos are queued, and videos
+    themselves run `max_videos` at a time on their own threads, never on the
+    monitor's event loop.
+    """
+    def __init__(self, cookies=None, max_quality=DEFAULT_MAX_QUALITY, codec="avc",
+                 max_videos=1, max_connections=4, segment_mb=4, ffmpeg="ffmpeg"):
+        """
+        :param cookies: Dict with sessdata (and optionally buvid3); qualities above 480P need a login
+        :param max_quality: Highest qn to download (80 = 1080P)
+        :param codec: Preferred video codec: "avc", "hevc" or "av1"
+        :param max_videos: Videos archived at the same time
+        :param max_connections: Ranged requests in flight across all videos
+        :param segment_mb: Size of each ranged request
+        :param ffmpeg: ffmpeg executable
+        """
+        self.ffmpeg = shutil.which(ffmpeg)
+        if not self.ffmpeg:
+            raise FileNotFoundError(f"{ffmpeg} not found; it is needed to mux the audio and video streams")
+        self.max_quality = max_quality
+        self.codec = codec
+        self.segment_size = int(segment_mb * MB)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                          "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+            # The video CDN rejects requests without a bilibili.com referer
+            "Referer": "https://www.bilibili.com/"
+        })
+        cookies = cookies or {}
+        if cookies.get("sessdata"):
+            self.session.cookies.update({"SESSDATA": cookies["sessdata"]})
+        if cookies.get("buvid3"):
+            self.session.cookies.update({"buvid3": cookies["buvid3"]})
+        self._videos = ThreadPoolExecutor(max_workers=max_videos, thread_name_prefix="video")
+        self._segments = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="video-segment")
+
+    def submit(self, video, out_path):
+        """Queue archive(video, out_path); returns a concurrent.futures.Future of the mp4 path"""
+        return self._videos.submit(self.archive, video, out_path)
+
+    def close(self):
+        self._videos.shutdown(wait=False, cancel_futures=True)
+        self._segments.shutdown(wait=False, cancel_futures=True)
+
+    def _get_json(self, url, params):
+        r = self.session.get(url, params=params, timeout=10)
+        r.raise_for_status()
+        data = r.json()
+        if data.get("code") != 0:
+            raise RuntimeError(f"{url} returned {data.get('code')}: {data.get('message')}")
+        return data["data"]
+
+    def get_dash(self, video):
+        """playurl DASH info for a {"aid", "bvid", "cid"} dict (cid of the first page when missing)"""
+        ids = {"bvid": video["bvid"]} if video.get("bvid") else {"aid": video["aid"]}
+        cid = video.get("cid") or self._get_json(PAGELIST_API, ids)[0]["cid"]
+        params = dict(ids, cid=cid, qn=self.max_quality, fnval=DASH_FNVAL, fourk=1)
+        if "aid" in params:
+            params["avid"] = params.pop("aid")
+        return self._get_json(PLAYURL_API, params)["dash"]
+
+    def _content_length(self, urls):
+        for url in urls:
+            try:
+                with self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=10) as r:
+                    r.raise_for_status()
+                    content_range = r.headers.get("Content-Range", "")
+                    if "/" in content_range:
+                        return int(content_range.rsplit("/", 1)[1])
+            except requests.RequestException as e:
+                logger.warning(f"Could not size {url.split('?')[0]}: {e}")
+        raise IOError("None of the stream URLs answered a range request")
+
+    def _fetch_range(self, urls, path, start, end, retries=3):
+        expected = end - start + 1
+        last_error = None
+        for attempt in range(retries):
+            # Rotate through the CDN mirrors on failure
+            url = urls[attempt % len(urls)]
+            try:
+                r = self.session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=30)
+                r.raise_for_status()
+                if r.status_code != 206 or len(r.content) != expected:
+                    raise IOError(f"Expected {expected} bytes at {start}, got {len(r.content)} (HTTP {r.status_code})")
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    f.write(r.content)
+                return expected
+            except (requests.RequestException, IOError) as e:
+                last_error = e
+        raise IOError(f"Segment {start}-{end} failed after {retries} attempts: {last_error}")
+
+    def download_stream(self, stream, path):
+        """Download one DASH stream to path in segment_size ranges fetched concurrently"""
+        urls = stream_urls(stream)
+        size = self._content_length(urls)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        futures = [
+            self._segments.submit(self._fetch_range, urls, path, start, min(start + self.segment_size, size) - 1)
+            for start in range(0, size, self.segment_size)
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return size
+
+    def mux(self, video_path, audio_path, out_path):
+        cmd = [self.ffmpeg, "-y", "-loglevel", "error", "-i", video_path]
+        if audio_path:
+            # -strict -2 lets older ffmpeg builds put a FLAC fallback track into mp4
+            cmd += ["-i", audio_path, "-strict", "-2"]
+        cmd += ["-c", "copy", out_path]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+
+    def archive(self, video, out_path):
+        """Download and mux one video to out_path; returns out_path"""
+        video_stream, audio_stream = pick_streams(self.get_dash(video), self.max_quality, self.codec)
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        video_part = out_path + ".video.m4s"
+        audio_part = out_path + ".audio.m4s" if audio_stream else None
+        try:
+            size = self.download_stream(video_stream, video_part)
+            if audio_stream:
+                size += self.download_stream(audio_stream, audio_part)
+            self.mux(video_part, audio_part, out_path)
+        finally:
+            for part in (video_part, audio_part):
+                if part and os.path.exists(part):
+                    os.remove(part)
+        logger.info(f"Archived video {video.get('bvid') or video.get('aid')} "
+                    f"(qn {video_stream['id']}, {size / MB:.1f} MB) to {out_path}")
+        return out_path
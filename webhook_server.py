@@ -1,8 +1,9 @@
 import os
+import hmac
 import json
 import logging
-import requests
 import sys
+import threading
 
 # Add local libs to path for baidu-autosave dependencies
 libs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baidu-autosave", "libs")
@@ -10,8 +11,13 @@ if os.path.exists(libs_path):
     sys.path.insert(0, libs_path)
 
 from flask import Flask, request, jsonify
-from feishu_uploader import FeishuUploader
-from urllib.parse import quote
+# The transfer pipeline lives in transfer.py; re-exported here for existing callers
+from transfer import (
+    CONFIG_FILE, BAIDU_CONFIG, ChecksumMismatchError, BaiduPCSError,
+    BAIDU_AUTH_ERROR_CODES, BAIDU_LIMIT_ERROR_CODES, SimpleBaiduPCS, BaiduPCSPool,
+    load_config, get_feishu_uploader, get_disk_budget, get_baidu_pcs, transfer_files,
+    TransferCoalescer
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,71 +25,37 @@ logger = logging.getLogger("IntegrationServer")
 
 app = Flask(__name__)
 
-# CONFIGURATION - TO BE FILLED BY USER or LOADED
-# Ideally load from a separate config file
-CONFIG_FILE = "integration_config.json"
-BAIDU_CONFIG = "baidu-autosave/config/config.json"
-
-class SimpleBaiduPCS:
-    def __init__(self, bduss, stoken=None):
-        self.session = requests.Session()
-        self.session.cookies.update({"BDUSS": bduss})
-        if stoken:
-            self.session.cookies.update({"STOKEN": stoken})
-        self.session.headers.update({
-            "User-Agent": "netdisk;7.0.3.2;PC;PC-Windows;10.0.19041;WindowsBaiduYunGuanJia"
-        })
-
-    def download_file(self, remote_path, local_path):
-        api_url = "http://pcs.baidu.com/rest/2.0/pcs/file"
-        params = {
-            "method": "download",
-            "path": remote_path,
-            "app_id": "250528"
-        }
-        
-        logger.info(f"Downloading from Baidu: {remote_path}")
-        with self.session.get(api_url, params=params, stream=True) as r:
-            r.raise_for_status()
-            with open(local_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-def get_feishu_uploader():
-    config = load_config()
-    app_id = config.get("feishu_app_id")
-    app_secret = config.get("feishu_app_secret")
-    if not app_id or not app_secret:
-        logger.error("Feishu credentials not found in config")
-        return None
-    return FeishuUploader(app_id, app_secret)
-
-def get_baidu_pcs():
-    try:
-        if os.path.exists(BAIDU_CONFIG):
-            with open(BAIDU_CONFIG, 'r', encoding='utf-8') as f:
-                baidu_conf = json.load(f)
-                users = baidu_conf.get("baidu", {}).get("users", {})
-                if not users:
-                    return None
-                current_user_id = baidu_conf.get("baidu", {}).get("current_user")
-                user = users.get(current_user_id) if current_user_id else list(users.values())[0]
-                
-                bduss = user.get("bduss") or user.get("cookies", {}).get("BDUSS")
-                stoken = user.get("stoken") or user.get("cookies", {}).get("STOKEN")
-                
-                if bduss:
-                    return SimpleBaiduPCS(bduss=bduss, stoken=stoken)
-    except Exception as e:
-        logger.error(f"Failed to load Baidu config: {e}")
+# Running BilibiliMonitor (set by run_integration) for the admin endpoints
+_monitor = None
+
+def register_monitor(monitor):
+    global _monitor
+    _monitor = monitor
+
+def check_admin_token():
+    """None if the request carries the configured admin token, else an error response"""
+    expected = load_config().get("admin_token")
+    if not expected:
+        return jsonify({"error": "Admin API disabled (no admin_token configured)"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), expected):
+        return jsonify({"error": "Invalid admin token"}), 401
     return None
 
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+def get_transfer_coalescer(window):
+    """Shared coalescer, so concurrent /baidu_event requests are merged into one batch"""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = TransferCoalescer(
+                lambda files: transfer_files(files, get_baidu_pcs(), get_feishu_uploader(), load_config()),
+                window=window
+            )
+        _coalescer.window = window
+        return _coalescer
+
 @app.route('/baidu_event', methods=['POST'])
 def handle_baidu_event():
     """
@@ -102,32 +74,101 @@ def handle_baidu_event():
         return jsonify({"error": "Feishu uploader not configured"}), 500
         
     config = load_config()
-    download_dir = config.get("download_dir", "temp_downloads")
-    os.makedirs(download_dir, exist_ok=True)
-    
-    results = []
+    window = config.get("baidu_coalesce_seconds", 0)
+    if window:
+        # Bursts of overlapping events become one batch without duplicate downloads
+        results = get_transfer_coalescer(window).submit(files)
+    else:
+        results = transfer_files(files, pcs, uploader, config)
+    return jsonify({"results": results})
+
+@app.route('/admin/bilibili/uids', methods=['GET', 'POST'])
+def admin_bilibili_uids():
+    """
+    GET: list monitored UIDs.
+    POST JSON: { "add": [uid, ...], "remove": [uid, ...] } changes the running monitor's UIDs.
+    Requires the X-Admin-Token header.
+    """
+    error = check_admin_token()
+    if error:
+        return error
+    if not _monitor:
+        return jsonify({"error": "Bilibili monitor not running"}), 503
     
-    for remote_path in files:
+    added, removed = [], []
+    if request.method == 'POST':
+        data = request.json or {}
         try:
-            filename = os.path.basename(remote_path)
-            local_path = os.path.join(download_dir, filename)
-            
-            logger.info(f"Downloading {remote_path} to {local_path}...")
-            pcs.download_file(remote_path, local_path)
-            
-            logger.info(f"Downloaded. Uploading to Feishu...")
-            target_folder = config.get("feishu_folder_token")
-            upload_res = uploader.upload_file(local_path, target_folder)
-            logger.info(f"Uploaded: {upload_res}")
-            
-            # Cleanup
-            os.remove(local_path)
-            results.append({"file": remote_path, "status": "success"})
-            
-        except Exception as e:
-            logger.error(f"Error processing {remote_path}: {e}")
-            results.append({"file": remote_path, "status": "error", "message": str(e)})
+            added = _monitor.add_uids([int(uid) for uid in data.get("add", [])])
+            removed = _monitor.remove_uids([int(uid) for uid in data.get("remove", [])])
+        except (TypeError, ValueError):
+            return jsonify({"error": "UIDs must be integers"}), 400
+    return jsonify({"uids": list(_monitor.uids), "added": added, "removed": removed})
+
+@app.route('/admin/profile', methods=['GET'])
+def admin_profile():
+    """
+    Sample all threads for `seconds` (default 10, max 300) and return the
+    profile as collapsed stacks (text/plain), e.g. for flamegraph.pl or speedscope.
+    Params: seconds, interval (sampling interval in seconds, default 0.01)
+    """
+    error = check_admin_token()
+    if error:
+        return error
+    import profiler
+    seconds = request.args.get("seconds", 10, type=float)
+    interval = max(0.001, request.args.get("interval", 0.01, type=float))
+    collapsed = profiler.run_session(seconds, interval)
+    if collapsed is None:
+        return jsonify({"error": "A profiling session is already running"}), 409
+    return collapsed, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+@app.route('/admin/stacks', methods=['GET'])
+def admin_stacks():
+    """Current stack of every thread (text/plain)"""
+    error = check_admin_token()
+    if error:
+        return error
+    import profiler
+    return profiler.dump_stacks(), 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+_dynamic_index = None
+_dynamic_index_lock = threading.Lock()
 
+def get_dynamic_index(config):
+    global _dynamic_index
+    index_conf = config.get("bilibili_index", {})
+    if not index_conf.get("enabled"):
+        return None
+    with _dynamic_index_lock:
+        if _dynamic_index is None:
+            from dynamic_index import DynamicIndex
+            _dynamic_index = DynamicIndex(index_conf.get("path", "dynamic_index.db"))
+        return _dynamic_index
+
+@app.route('/search', methods=['GET'])
+def search_dynamics():
+    """
+    Query archived Bilibili dynamics.
+    Params: q (search terms), uid, since / until (unix timestamps), limit (default 20, max 200)
+    Needs the admin token unless bilibili_index.public_search is set.
+    """
+    config = load_config()
+    if not config.get("bilibili_index", {}).get("public_search"):
+        error = check_admin_token()
+        if error:
+            return error
+    index = get_dynamic_index(config)
+    if not index:
+        return jsonify({"error": "Dynamic index not enabled"}), 404
+    # Malformed numbers are ignored (type=int yields the default)
+    results = index.search(
+        request.args.get("q", ""),
+        uid=request.args.get("uid", type=int),
+        since=request.args.get("since", type=int),
+        until=request.args.get("until", type=int),
+        limit=max(1, min(request.args.get("limit", 20, type=int), 200))
+    )
     return jsonify({"results": results})
 
 